@@ -2,6 +2,9 @@ import cv2
 import numpy as np
 from PIL import Image
 
+from defect_set import DefectSet
+from ingest import BUFFER_POOL, ingest
+
 def detect_defect(image):
     """
     PROFESSIONAL PCB DEFECT DETECTION
@@ -13,18 +16,9 @@ def detect_defect(image):
     """
     
     # ===== STEP 1: Prepare Image =====
-    # Convert PIL to OpenCV format
-    img = np.array(image)
-    if len(img.shape) == 3 and img.shape[2] == 4:  # RGBA
-        img = cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
-    elif len(img.shape) == 3 and img.shape[2] == 3:  # RGB
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    
-    original_img = img.copy()
-    height, width = img.shape[:2]
-    
-    # Resize for processing (standard size)
-    img_resized = cv2.resize(img, (640, 480))
+    # Convert to OpenCV BGR and resize for processing (standard size) in
+    # one pass, into a pooled buffer
+    img_resized = ingest(image, (640, 480), out=BUFFER_POOL.acquire((480, 640, 3)))
     
     # ===== STEP 2: Convert to Grayscale =====
     gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
@@ -43,8 +37,10 @@ def detect_defect(image):
     contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     # ===== STEP 6: Filter and Draw Valid Defects =====
-    img_with_boxes = img_resized.copy()
-    defects_found = []
+    # Grayscale is done, so the boxes are drawn on the resized frame itself
+    img_with_boxes = img_resized
+    bboxes = []
+    areas = []
     min_area = 50  # Minimum defect size (pixels²)
     
     for contour in contours:
@@ -55,13 +51,8 @@ def detect_defect(image):
             x, y, w, h = cv2.boundingRect(contour)
             
             # Store defect info
-            defects_found.append({
-                'x': x,
-                'y': y,
-                'width': w,
-                'height': h,
-                'area': area
-            })
+            bboxes.append((x, y, w, h))
+            areas.append(area)
             
             # Draw GREEN rectangle for detected defect
             cv2.rectangle(img_with_boxes, (x, y), (x+w, y+h), (0, 255, 0), 2)
@@ -74,9 +65,12 @@ def detect_defect(image):
             cv2.putText(img_with_boxes, label, (x, y-10),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
     
+    defects_found = DefectSet.from_bboxes(bboxes, areas)
+    
     # ===== STEP 7: Prepare Results =====
     # Resize result back to original size for display
     result_img = cv2.cvtColor(img_with_boxes, cv2.COLOR_BGR2RGB)
+    BUFFER_POOL.release(img_resized)
     
     # Create detailed report
     if len(defects_found) > 0:
@@ -90,7 +84,7 @@ def detect_defect(image):
         defect_info = {
             'status': 'NO DEFECT',
             'count': 0,
-            'defects': [],
+            'defects': defects_found,
             'confidence': 'NONE'
         }
     
@@ -0,0 +1,149 @@
+"""
+MILESTONE 3/4: DefectSet Result Type
+Structure-of-arrays container for the defects found in one frame
+"""
+
+import json
+
+import numpy as np
+
+FIELDS = ('x', 'y', 'width', 'height', 'area', 'circularity')
+
+DTYPES = {
+    'x': np.int32,
+    'y': np.int32,
+    'width': np.int32,
+    'height': np.int32,
+    'area': np.float64,
+    'circularity': np.float64,
+}
+
+
+class DefectSet:
+    """
+    Defects of one frame stored as parallel NumPy arrays
+
+    Building, filtering and aggregating hundreds of defects stays in NumPy.
+    The old list-of-dicts interface still works as a lazy view:
+        - len(defects), bool(defects)
+        - defects[i] -> {'x': ..., 'y': ..., 'width': ..., ...}
+        - for defect in defects: defect['area']
+    Dictionaries are only built when an element is actually accessed.
+
+    Slicing (defects[2:10]) returns a zero-copy DefectSet that shares the
+    arrays. Boolean or index-array selection (defects[mask]) returns a
+    compact copy.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, x=(), y=(), width=(), height=(), area=(), circularity=None):
+        """
+        Args:
+            x, y, width, height: Bounding boxes (top-left corner and size)
+            area: Contour areas (pixels²)
+            circularity: Optional 4*pi*area/perimeter² scores (left out of
+                         the dict view when not given)
+        """
+        self.x = np.asarray(x, dtype=DTYPES['x'])
+        self.y = np.asarray(y, dtype=DTYPES['y'])
+        self.width = np.asarray(width, dtype=DTYPES['width'])
+        self.height = np.asarray(height, dtype=DTYPES['height'])
+        self.area = np.asarray(area, dtype=DTYPES['area'])
+        self.circularity = (None if circularity is None
+                            else np.asarray(circularity, dtype=DTYPES['circularity']))
+
+        lengths = {len(getattr(self, name)) for name in self._fields()}
+        if len(lengths) > 1:
+            raise ValueError(f"DefectSet columns have different lengths: {lengths}")
+
+    @classmethod
+    def from_bboxes(cls, bboxes, area, circularity=None):
+        """Build from an (N, 4) x, y, w, h array plus per-defect values"""
+        bboxes = np.asarray(bboxes).reshape(-1, 4)
+        return cls(bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3],
+                   area, circularity)
+
+    @classmethod
+    def from_dicts(cls, defects):
+        """Build from the legacy list of defect dictionaries"""
+        defects = list(defects)
+        columns = {name: [d[name] for d in defects] for name in FIELDS[:5]}
+        if defects and all('circularity' in d for d in defects):
+            columns['circularity'] = [d['circularity'] for d in defects]
+        return cls(**columns)
+
+    def _fields(self):
+        return FIELDS if self.circularity is not None else FIELDS[:5]
+
+    # ============ SEQUENCE / LAZY DICT VIEW ============
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return {name: getattr(self, name)[index].item() for name in self._fields()}
+        return self._select(index)
+
+    def __iter__(self):
+        # One tolist() per column, then plain Python values per defect
+        fields = self._fields()
+        columns = [getattr(self, name).tolist() for name in fields]
+        for values in zip(*columns):
+            yield dict(zip(fields, values))
+
+    def __eq__(self, other):
+        if isinstance(other, DefectSet):
+            return (self._fields() == other._fields() and
+                    all(np.array_equal(getattr(self, n), getattr(other, n))
+                        for n in self._fields()))
+        if isinstance(other, list):
+            return self.to_dicts() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f"DefectSet({len(self)} defects)"
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def __setstate__(self, state):
+        for name in FIELDS:
+            setattr(self, name, state[name])
+
+    # ============ SELECTION ============
+    def _select(self, index):
+        selected = DefectSet.__new__(DefectSet)
+        for name in FIELDS[:5]:
+            setattr(selected, name, getattr(self, name)[index])
+        selected.circularity = None if self.circularity is None else self.circularity[index]
+        return selected
+
+    def filter(self, min_area=None, max_area=None):
+        """Vectorized area filter (min_area exclusive, like detection)"""
+        mask = np.ones(len(self), dtype=bool)
+        if min_area is not None:
+            mask &= self.area > min_area
+        if max_area is not None:
+            mask &= self.area <= max_area
+        return self._select(mask)
+
+    # ============ AGGREGATES ============
+    def bboxes(self):
+        """(N, 4) array of x, y, width, height"""
+        return np.stack([self.x, self.y, self.width, self.height], axis=1)
+
+    def total_area(self):
+        return float(self.area.sum())
+
+    def mean_area(self):
+        return float(self.area.mean()) if len(self) else 0.0
+
+    # ============ CONVERSION ============
+    def to_dicts(self):
+        """Materialize the legacy list of defect dictionaries"""
+        return list(self)
+
+    def to_json(self):
+        """JSON array of defect objects"""
+        return json.dumps(self.to_dicts())
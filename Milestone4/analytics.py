@@ -0,0 +1,156 @@
+"""
+MILESTONE 4: Incremental Analytics Store
+Running totals for the prediction log, so the dashboard never re-reads it
+"""
+
+import csv
+import io
+import json
+import os
+import threading
+
+_lock = threading.Lock()
+
+
+def stats_path_for(log_path):
+    """logs/prediction_log.csv -> logs/prediction_log.stats.json"""
+    return os.path.splitext(log_path)[0] + ".stats.json"
+
+
+def _empty_stats():
+    return {
+        'total_analyses': 0,
+        'defects_found': 0,
+        'images_with_defects': 0,
+        'per_status': {},
+        'per_hour': [0] * 24,
+        'log_offset': 0
+    }
+
+
+def _add_row(stats, row):
+    """Fold one CSV row (Timestamp, Status, Defect_Count, ...) into stats"""
+    if len(row) < 3 or row[0] == "Timestamp":
+        return
+    try:
+        count = int(row[2])
+    except ValueError:
+        return
+
+    stats['total_analyses'] += 1
+    stats['defects_found'] += count
+    if count > 0:
+        stats['images_with_defects'] += 1
+
+    status = row[1]
+    stats['per_status'][status] = stats['per_status'].get(status, 0) + 1
+
+    # Timestamp format: YYYY-mm-dd HH:MM:SS
+    try:
+        hour = int(row[0][11:13])
+        stats['per_hour'][hour] += 1
+    except (ValueError, IndexError):
+        pass
+
+
+class AnalyticsStore:
+    """
+    Aggregates for one CSV prediction log, kept in a small JSON index
+
+    The index stores the totals plus the byte offset of the log they
+    cover. Appends update the totals directly (record_rows). Any rows
+    written by something else are picked up by reading only the bytes
+    after the stored offset (refresh). A render therefore costs one
+    os.stat and one small JSON read, however large the log grows.
+    """
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.stats_path = stats_path_for(log_path)
+
+    def _load(self):
+        try:
+            with open(self.stats_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return _empty_stats()
+
+    def _store(self, stats):
+        # Write-then-rename so readers never see a half-written index
+        tmp_path = self.stats_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(stats, file)
+        os.replace(tmp_path, self.stats_path)
+
+    def _catch_up(self, stats, end_offset=None):
+        """Fold in any log bytes between the stored offset and end_offset"""
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return _empty_stats()
+
+        if size < stats['log_offset']:
+            # Log was truncated or replaced - rebuild from scratch
+            stats = _empty_stats()
+
+        end = size if end_offset is None else min(end_offset, size)
+        if end <= stats['log_offset']:
+            return stats
+
+        with open(self.log_path, "rb") as file:
+            file.seek(stats['log_offset'])
+            chunk = file.read(end - stats['log_offset'])
+
+        # Only consume complete lines
+        complete = chunk.rfind(b"\n") + 1
+        for row in csv.reader(io.StringIO(chunk[:complete].decode("utf-8", errors="replace"))):
+            _add_row(stats, row)
+        stats['log_offset'] += complete
+        return stats
+
+    def record_rows(self, rows, start_offset, end_offset):
+        """
+        Update the totals after rows were appended to the log
+
+        Args:
+            rows: The rows just written
+            start_offset: Log size before the append
+            end_offset: Log size after the append
+        """
+        with _lock:
+            stats = self._load()
+            if stats['log_offset'] == start_offset:
+                for row in rows:
+                    _add_row(stats, row)
+                stats['log_offset'] = end_offset
+            else:
+                # Index is behind (or ahead) of this append - re-read the gap
+                stats = self._catch_up(stats, end_offset)
+            self._store(stats)
+
+    def refresh(self):
+        """
+        Return current totals, reading only log bytes not yet indexed
+        """
+        with _lock:
+            stats = self._load()
+            offset = stats['log_offset']
+            stats = self._catch_up(stats)
+            if stats['log_offset'] != offset:
+                self._store(stats)
+            return stats
+
+
+def record_rows(log_path, rows, start_offset, end_offset):
+    """Update the analytics index for log_path after an append"""
+    try:
+        AnalyticsStore(log_path).record_rows(rows, start_offset, end_offset)
+    except Exception as e:
+        print(f"Error updating analytics: {str(e)}")
+
+
+def load_analytics(log_path):
+    """Return aggregated statistics for log_path (None if there is no log)"""
+    if not os.path.exists(log_path):
+        return None
+    return AnalyticsStore(log_path).refresh()
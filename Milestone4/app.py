@@ -2,7 +2,10 @@ import streamlit as st
 from PIL import Image
 import cv2
 import numpy as np
-from backend import detect_defect
+from backend import DetectionEngine, detect_defect
+from analytics import load_analytics
+from result_cache import ResultCache, result_key
+from template_registry import TEMPLATE_REGISTRY
 import os
 import json
 from datetime import datetime
@@ -279,6 +282,30 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+IMAGE_MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".bmp": "image/bmp"}
+
+# ===== DETECTION ENGINE CACHE =====
+@st.cache_resource
+def load_templates():
+    """Golden templates from templates/ (one image per board type), loaded once"""
+    return TEMPLATE_REGISTRY.load_dir()
+
+@st.cache_resource
+def get_engine(min_area, threshold_value, confidence_level, export_format, reference=None):
+    """One DetectionEngine per parameter set, reused across reruns"""
+    return DetectionEngine(
+        min_area=min_area,
+        threshold_value=threshold_value,
+        confidence_level=confidence_level,
+        export_format=export_format,
+        reference=reference
+    )
+
+@st.cache_resource
+def get_result_cache():
+    """Result cache shared by all sessions, persisted under logs/result_cache/"""
+    return ResultCache()
+
 # ===== HEADER =====
 st.title("🔬 PCB Defect Detection System")
 st.markdown("<h3 style='text-align: center; color: #06b6d4; margin-top: -10px;'>AI-Powered Industrial Inspection</h3>", unsafe_allow_html=True)
@@ -329,6 +356,16 @@ with st.sidebar:
             help="Detection sensitivity mode"
         )
         
+        board_types = load_templates()
+        reference = st.selectbox(
+            "Reference Board",
+            ["None (threshold only)"] + board_types,
+            help="Compare against the golden template of this board type "
+                 "(images in templates/) instead of a fixed threshold"
+        )
+        if reference not in board_types:
+            reference = None
+        
         st.divider()
         st.markdown("#### Export Options")
         export_format = st.selectbox("Result Format", ["PNG", "JPG", "BMP"])
@@ -337,22 +374,12 @@ with st.sidebar:
     with tab2:
         st.markdown("#### System Analytics")
         
-        # Check if log file exists
+        # Running totals from the analytics index - no full log re-scan
         log_file = "logs/prediction_log.csv"
-        if os.path.exists(log_file):
-            with open(log_file, "r") as f:
-                lines = f.readlines()
-                total_analyses = len(lines) - 1
-                
-                # Count defects
-                defects_count = 0
-                for line in lines[1:]:
-                    try:
-                        parts = line.strip().split(",")
-                        if len(parts) >= 3:
-                            defects_count += int(parts[2])
-                    except:
-                        pass
+        stats = load_analytics(log_file)
+        if stats is not None:
+            total_analyses = stats['total_analyses']
+            defects_count = stats['defects_found']
             
             col1, col2 = st.columns(2)
             with col1:
@@ -363,8 +390,24 @@ with st.sidebar:
             # Success rate
             success_rate = (total_analyses - (defects_count > 0 and 1 or 0)) / max(total_analyses, 1) * 100
             st.metric("✅ Success Rate", f"{success_rate:.1f}%")
+            
+            if total_analyses > 0:
+                st.markdown("##### Results by Status")
+                st.bar_chart({"analyses": stats['per_status']})
+                st.markdown("##### Analyses by Hour")
+                st.bar_chart({"analyses": {f"{hour:02d}": n for hour, n in enumerate(stats['per_hour'])}})
         else:
             st.info("No data yet. Start analyzing images!")
+        
+        st.markdown("##### Result Cache")
+        cache_stats = get_result_cache().stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("♻️ Hits", cache_stats['hits'])
+            st.metric("📦 Cached Results", cache_stats['entries'])
+        with col2:
+            st.metric("🔍 Misses", cache_stats['misses'])
+            st.metric("🎯 Hit Rate", f"{cache_stats['hit_rate'] * 100:.1f}%")
     
     with tab3:
         st.markdown("#### About This System")
@@ -443,13 +486,33 @@ with col2:
         if analyze_btn:
             with st.spinner("⏳ Processing image... This may take a few seconds"):
                 # Run detection
-                result_img, defect_info, output_path, confidence_score = detect_defect(image)
+                engine = get_engine(min_area, threshold_value, confidence_level, export_format,
+                                    reference)
+                result_cache = get_result_cache()
+                
+                # Same pixels and settings (and template) as an earlier analysis -
+                # reuse its result (no new detection, output file or log row)
+                params = engine.params()
+                if engine.template is not None:
+                    params['template'] = engine.template.digest
+                cache_key = result_key(image, params)
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    result_img, defect_info, output_path, confidence_score, created = cached
+                    timestamp = datetime.fromtimestamp(created)
+                else:
+                    result_img, defect_info, output_path, confidence_score = detect_defect(image, engine)
+                    result_cache.put(cache_key, result_img, defect_info, output_path,
+                                     confidence_score)
+                    timestamp = datetime.now()
+                
                 st.session_state.last_result = {
                     'image': result_img,
                     'info': defect_info,
                     'path': output_path,
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    'confidence': confidence_score
+                    'timestamp': timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                    'confidence': confidence_score,
+                    'cached': cached is not None
                 }
         
         # Display results if available
@@ -460,6 +523,9 @@ with col2:
             st.markdown("<div class='image-container'>", unsafe_allow_html=True)
             st.image(result['image'], caption="🎯 Detection Result", use_column_width=True)
             st.markdown("</div>", unsafe_allow_html=True)
+            if result.get('cached'):
+                st.caption("♻️ Served from the result cache - this image was already analyzed "
+                           "with the same settings")
             
             st.divider()
             
@@ -541,6 +607,7 @@ with col2:
                 <p><b>Confidence Level:</b> <span class='badge badge-success'>{defect_info['confidence']}</span></p>
                 <p><b>Model Confidence:</b> <span style='color: #10b981; font-weight: 700;'>{result['confidence']:.1f}%</span></p>
                 <p><b>Timestamp:</b> {result['timestamp']}</p>
+                <p><b>Result ID:</b> <code>{defect_info.get('result_id', '-')}</code></p>
                 </div>
                 """, unsafe_allow_html=True)
                 
@@ -607,6 +674,7 @@ with col2:
                 <p><b>Confidence Level:</b> <span class='badge badge-success'>{defect_info['confidence']}</span></p>
                 <p><b>Model Confidence:</b> <span style='color: #fbbf24; font-weight: 700;'>{result['confidence']:.1f}%</span></p>
                 <p><b>Timestamp:</b> {result['timestamp']}</p>
+                <p><b>Result ID:</b> <code>{defect_info.get('result_id', '-')}</code></p>
                 </div>
                 """, unsafe_allow_html=True)
             
@@ -618,15 +686,23 @@ with col2:
             col_dl1, col_dl2, col_dl3 = st.columns(3)
             
             with col_dl1:
-                if os.path.exists(result['path']):
+                # Result files are written in the background - until this one
+                # is on disk, encode the displayed result instead of waiting
+                if result['path'] and os.path.exists(result['path']):
+                    extension = os.path.splitext(result['path'])[1]
                     with open(result['path'], "rb") as file:
-                        st.download_button(
-                            label="📸 Image",
-                            data=file,
-                            file_name=f"pcb_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
-                            mime="image/png",
-                            use_container_width=True
-                        )
+                        image_data = file.read()
+                else:
+                    extension = os.path.splitext(result['path'])[1] if result['path'] else ".png"
+                    image_data = cv2.imencode(extension, cv2.cvtColor(result['image'],
+                                                                      cv2.COLOR_RGB2BGR))[1].tobytes()
+                st.download_button(
+                    label="📸 Image",
+                    data=image_data,
+                    file_name=f"pcb_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}",
+                    mime=IMAGE_MIME_TYPES.get(extension, "image/png"),
+                    use_container_width=True
+                )
             
             with col_dl2:
                 log_file = "logs/prediction_log.csv"
@@ -1,9 +1,40 @@
 import cv2
 import numpy as np
 from PIL import Image
-import csv
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from defect_log import DEFAULT_LOG_DIR
+from defect_set import DefectSet
+from ingest import BUFFER_POOL, ingest
+from overlay import render_overlay
+from result_ids import new_result_id, result_path
+from result_writer import append_log_rows, get_writer
+from template_registry import TEMPLATE_REGISTRY
+from tiling import (complete_in_any, covers_any, enclosed, group_boxes, tile_windows,
+                    touches_inner_edge, union_box)
+
+# Standard processing size (width, height)
+PROCESS_SIZE = (640, 480)
+
+# The binary inspection log (defect_log.py) is always written; the CSV
+# prediction log is an optional export kept on for the Streamlit app
+CSV_LOG_ENABLED = True
+
+def _log_row(defect_info):
+    """
+    Build one CSV log row, timestamped at the time of the call
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    status = defect_info['status']
+    count = defect_info['count']
+    details = f"{count} defect(s) detected" if count > 0 else "No defects"
+    return [timestamp, status, count, details, defect_info.get('result_id', '')]
+
 
 def save_log(defect_info, filename="prediction_log.csv"):
     """
@@ -14,129 +45,177 @@ def save_log(defect_info, filename="prediction_log.csv"):
         filename: CSV file to save to
     """
     try:
-        # Create output directory if it doesn't exist
-        os.makedirs("logs", exist_ok=True)
         log_path = os.path.join("logs", filename)
-        
-        # Check if file exists to add header
-        file_exists = os.path.exists(log_path)
-        
-        with open(log_path, "a", newline="") as file:
-            writer = csv.writer(file)
-            
-            # Write header if new file
-            if not file_exists:
-                writer.writerow(["Timestamp", "Status", "Defect_Count", "Details"])
-            
-            # Write prediction data
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            status = defect_info['status']
-            count = defect_info['count']
-            details = f"{count} defect(s) detected" if count > 0 else "No defects"
-            
-            writer.writerow([timestamp, status, count, details])
-        
+        append_log_rows([_log_row(defect_info)], log_path)
         return log_path
     except Exception as e:
         print(f"Error saving log: {str(e)}")
         return None
 
-def detect_defect(image):
+
+def flush_results(timeout=None):
     """
-    PROFESSIONAL PCB DEFECT DETECTION
-    Uses image processing techniques from Milestone 1 & 2
-    
-    Returns:
-        - result_img: Image with defect boxes drawn
-        - defect_info: Dictionary with detection results
-        - output_path: Path to saved result image
-        - confidence_score: Confidence percentage (0-100)
+    Wait until all queued result images and log rows are on disk
     """
+    return get_writer().flush(timeout)
+
+
+def _to_gray(image):
+    """
+    Grayscale of an RGBA, RGB or grayscale array (PIL channel order)
     
-    # ===== STEP 1: Prepare Image =====
-    # Convert PIL to OpenCV format
-    img = np.array(image)
-    if len(img.shape) == 3 and img.shape[2] == 4:  # RGBA
-        img = cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
-    elif len(img.shape) == 3 and img.shape[2] == 3:  # RGB
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    elif len(img.shape) == 2:  # Grayscale - convert to BGR
-        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-    
-    original_img = img.copy()
-    height, width = img.shape[:2]
-    
-    # Resize for processing (standard size)
-    img_resized = cv2.resize(img, (640, 480))
-    
-    # ===== STEP 2: Convert to Grayscale =====
-    gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
-    
-    # ===== STEP 3: Image Quality Assessment =====
-    # Calculate image quality metrics
-    laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-    mean_brightness = np.mean(gray)
-    contrast = np.std(gray)
-    
+    Works on views (e.g. a window of a larger image) without copying them
+    first - only the single-channel result is allocated.
+    """
+    if image.ndim == 3 and image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY)
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return np.ascontiguousarray(image)
+
+
+def _quality_score(laplacian_var, mean_brightness, contrast):
+    """
+    Image quality score (0-100) from sharpness, brightness and contrast
+    """
     # Quality score (0-100) - More generous scoring for high confidence
     quality_score = min(100, laplacian_var / 30 * 25)  # Increased sharpness factor
     if mean_brightness < 40 or mean_brightness > 210:
         quality_score *= 0.95  # Minimal reduction for poor lighting
     if contrast < 15:
         quality_score *= 0.9  # Minimal reduction for low contrast
-    
-    # ===== STEP 4: Apply Thresholding (Binary Image) =====
-    _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-    
-    # ===== STEP 5: Morphological Operations =====
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    return quality_score
+
+
+def _morphology(thresh, kernel):
+    """
+    Close small holes, then open to remove specks
+    """
     morph = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
     morph = cv2.morphologyEx(morph, cv2.MORPH_OPEN, kernel)
+    return morph
+
+
+def _contour_stats_loop(contours):
+    """
+    Reference per-contour measurement with cv2.contourArea /
+    cv2.arcLength / cv2.boundingRect (one Python iteration per contour)
+    """
+    return {
+        'area': np.array([cv2.contourArea(c) for c in contours], dtype=np.float64),
+        'perimeter': np.array([cv2.arcLength(c, True) for c in contours], dtype=np.float64),
+        'bbox': np.array([cv2.boundingRect(c) for c in contours], dtype=np.int32).reshape(-1, 4)
+    }
+
+
+def _contour_stats_vectorized(contours):
+    """
+    Measure every contour in one pass over all contour points
+    
+    All points are concatenated into a single array and each statistic is
+    a segmented reduction over it:
+        - area: shoelace formula (np.add.reduceat), exact for integer points
+        - bbox: np.minimum / np.maximum.reduceat of x and y
+        - perimeter: float32 segment lengths summed in float64 in the same
+          order as cv2.arcLength, so results match it bit for bit
+    """
+    count = len(contours)
+    if count == 0:
+        return {
+            'area': np.empty(0, dtype=np.float64),
+            'perimeter': np.empty(0, dtype=np.float64),
+            'bbox': np.empty((0, 4), dtype=np.int32)
+        }
+    
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.intp, count=count)
+    points = np.concatenate(contours).reshape(-1, 2)
+    starts = np.zeros(count, dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    ends = starts + lengths - 1
+    
+    # Index of the previous point on the same (closed) contour
+    prev = np.arange(len(points), dtype=np.intp) - 1
+    prev[starts] = ends
+    
+    x = points[:, 0]
+    y = points[:, 1]
+    
+    # ===== Area (shoelace) =====
+    xf = x.astype(np.float64)
+    yf = y.astype(np.float64)
+    cross = xf[prev] * yf - yf[prev] * xf
+    area = np.abs(np.add.reduceat(cross, starts)) * 0.5
+    
+    # ===== Bounding boxes =====
+    x_min = np.minimum.reduceat(x, starts)
+    y_min = np.minimum.reduceat(y, starts)
+    x_max = np.maximum.reduceat(x, starts)
+    y_max = np.maximum.reduceat(y, starts)
+    bbox = np.stack([x_min, y_min, x_max - x_min + 1, y_max - y_min + 1], axis=1).astype(np.int32)
+    
+    # ===== Perimeter =====
+    # cv2.arcLength: float32 segment lengths, accumulated in float64
+    # starting with the closing segment. Step k adds the k-th segment of
+    # every contour that is at least k+1 points long.
+    dx = (x - x[prev]).astype(np.float32)
+    dy = (y - y[prev]).astype(np.float32)
+    segments = np.sqrt(dx * dx + dy * dy).astype(np.float64)
+    
+    by_length = np.argsort(-lengths, kind="stable")
+    sorted_lengths = lengths[by_length]
+    sorted_starts = starts[by_length]
+    sorted_perimeter = np.zeros(count, dtype=np.float64)
+    for k in range(int(sorted_lengths[0])):
+        active = np.searchsorted(-sorted_lengths, -k, side="left")
+        sorted_perimeter[:active] += segments[sorted_starts[:active] + k]
+    perimeter = np.empty(count, dtype=np.float64)
+    perimeter[by_length] = sorted_perimeter
+    
+    return {'area': area, 'perimeter': perimeter, 'bbox': bbox}
+
+
+def _contour_stats(morph):
+    """
+    Find contours in the cleaned mask and measure all of them once
     
-    # ===== STEP 6: Find Contours =====
+    Returns:
+        - contours: Contour list from cv2.findContours
+        - stats: Dictionary of parallel arrays - 'area' (float64),
+                 'perimeter' (float64) and 'bbox' ((N, 4) int32 x, y, w, h)
+    """
     contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours, _contour_stats_vectorized(contours)
+
+
+def _build_result(stats, quality_score, min_area=50):
+    """
+    Filter measured contours by area and score the valid defects
     
-    # ===== STEP 7: Filter and Draw Valid Defects =====
-    img_with_boxes = img_resized.copy()
-    defects_found = []
-    min_area = 50  # Minimum defect size (pixels²)
+    Filtering is a vectorized mask over the precomputed contour stats, so
+    a new min_area never needs the contours to be measured again. Nothing
+    is drawn here - see overlay.render_overlay.
     
-    detection_quality = 0
+    Returns:
+        - defect_info: Dictionary with detection results
+        - overall_confidence: Confidence percentage (0-100)
+        - keep: Indices of the valid defects' contours
+    """
     
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        
-        # Only consider significant defects
-        if area > min_area:
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Calculate contour quality
-            perimeter = cv2.arcLength(contour, True)
-            circularity = 4 * np.pi * area / (perimeter ** 2 + 1e-5)
-            
-            # Store defect info
-            defects_found.append({
-                'x': x,
-                'y': y,
-                'width': w,
-                'height': h,
-                'area': area,
-                'circularity': circularity
-            })
-            
-            # Accumulate detection quality
-            detection_quality += min(100, circularity * 100)
-            
-            # Draw GREEN rectangle for detected defect
-            cv2.rectangle(img_with_boxes, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            
-            # Draw contour
-            cv2.drawContours(img_with_boxes, [contour], 0, (0, 165, 255), 2)
-            
-            # Add label
-            label = f"Area:{int(area)}px"
-            cv2.putText(img_with_boxes, label, (x, y-10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    # ===== Filter Valid Defects =====
+    # Only consider significant defects
+    keep = np.flatnonzero(stats['area'] > min_area)
+    areas = stats['area'][keep]
+    perimeters = stats['perimeter'][keep]
+    bboxes = stats['bbox'][keep]
+    
+    # Calculate contour quality
+    circularities = 4 * np.pi * areas / (perimeters ** 2 + 1e-5)
+    
+    # ===== Store Valid Defects =====
+    defects_found = DefectSet.from_bboxes(bboxes, areas, circularities)
+    
+    # Accumulate detection quality
+    detection_quality = sum(np.minimum(100, circularities * 100).tolist())
     
     # Calculate overall confidence score
     if len(defects_found) > 0:
@@ -151,10 +230,6 @@ def detect_defect(image):
     if overall_confidence > 85:
         overall_confidence = min(100, overall_confidence + 8)
     
-    
-    # ===== STEP 8: Prepare Results =====
-    result_img = cv2.cvtColor(img_with_boxes, cv2.COLOR_BGR2RGB)
-    
     # Determine confidence category
     if overall_confidence >= 85:
         confidence_level = "VERY HIGH"
@@ -177,17 +252,751 @@ def detect_defect(image):
         defect_info = {
             'status': 'NO DEFECT',
             'count': 0,
-            'defects': [],
+            'defects': defects_found,
             'confidence': confidence_level
         }
     
-    # ===== STEP 9: Save Result Image =====
-    os.makedirs("output", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_path = os.path.join("output", f"defect_result_{timestamp}.png")
-    cv2.imwrite(output_path, img_with_boxes)
+    return defect_info, overall_confidence, keep
+
+
+def _render(img_resized, contours, defect_info, keep):
+    """
+    Draw the defects of one frame, returning the BGR overlay and its RGB copy
+    """
+    img_with_boxes = render_overlay(img_resized, defect_info['defects'],
+                                    [contours[i] for i in keep.tolist()])
+    return img_with_boxes, cv2.cvtColor(img_with_boxes, cv2.COLOR_BGR2RGB)
+
+
+def _save_image(img_with_boxes, result_id):
+    """Queue the annotated image of result_id; returns its path"""
+    output_path = result_path(result_id)
+    get_writer().submit_image(os.path.abspath(output_path), img_with_boxes)
+    return output_path
+
+
+def _save_result(img_with_boxes, defect_info, confidence, extension="png"):
+    """
+    Queue the annotated result image and its log entries for the
+    background writer, so disk I/O stays off the detection path
+    
+    With img_with_boxes=None (geometry-only detection) only the log
+    entries are written and no result image path is returned.
+    
+    A unique result ID is stored in defect_info['result_id'] and in the
+    log entries. It ends in the image format (e.g. "...042.jpg"), so
+    result_path() maps it back to the image file on its own. Every
+    defect goes to the binary inspection log, and the CSV row is
+    written when CSV_LOG_ENABLED is set.
+    
+    Returns:
+        Path the result image will be written to
+    """
+    result_id = new_result_id(extension)
+    defect_info['result_id'] = result_id
+    output_path = None
+    
+    # Absolute paths: the writer thread may run after the caller changes cwd
+    writer = get_writer()
+    if img_with_boxes is not None:
+        output_path = _save_image(img_with_boxes, result_id)
+    writer.submit_frame(os.path.abspath(DEFAULT_LOG_DIR), time.time(), defect_info, confidence)
+    if CSV_LOG_ENABLED:
+        writer.submit_log_row(_log_row(defect_info),
+                              os.path.abspath(os.path.join("logs", "prediction_log.csv")))
+    
+    return output_path
+
+
+def _batch_mean_var(flat):
+    """
+    Per-row mean and variance of an (N, pixels) array
+    
+    Uses running sums instead of ndarray.var so no full-size float
+    temporaries are allocated for the whole batch.
+    """
+    pixels = flat.shape[1]
+    mean = flat.sum(axis=1, dtype=np.float64) / pixels
+    if flat.dtype == np.float64:
+        squares = np.einsum("ij,ij->i", flat, flat)
+    else:
+        squares = np.einsum("ij,ij->i", flat, flat, dtype=np.float64)
+    variance = np.maximum(squares / pixels - mean * mean, 0)
+    return mean, variance
+
+
+def _batch_laplacian_var(gray_batch):
+    """
+    Variance of the Laplacian for every frame of an (N, H, W) stack
+    
+    The stack is filtered as one tall image in a single cv2.Laplacian call.
+    Only the first and last row of each frame see a neighbouring frame
+    instead of the BORDER_REFLECT_101 edge, so those rows are corrected
+    afterwards to match cv2.Laplacian(gray, cv2.CV_64F).var() per frame.
+    """
+    count, height, width = gray_batch.shape
+    tall = gray_batch.reshape(count * height, width)
+    laplacian = cv2.Laplacian(tall, cv2.CV_64F)
+    
+    if count > 1:
+        rows = tall.astype(np.float64)
+        # Top rows of frames 1..N-1: swap the previous frame's last row for row 1
+        top = np.arange(1, count) * height
+        laplacian[top] += rows[top + 1] - rows[top - 1]
+        # Bottom rows of frames 0..N-2: swap the next frame's first row for row H-2
+        bottom = np.arange(0, count - 1) * height + height - 1
+        laplacian[bottom] += rows[bottom - 1] - rows[bottom + 1]
+    
+    _, variance = _batch_mean_var(laplacian.reshape(count, height * width))
+    return variance
+
+
+def _image_key(img):
+    """Fast content hash of a decoded image array (pixels + shape) or of encoded bytes"""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(img, np.ndarray):
+        digest.update(str((img.shape, img.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(img).data)
+    else:
+        digest.update(b"encoded")
+        digest.update(img)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Bounded LRU cache of the expensive upstream detection stages
+    
+    Key: (image content hash, threshold value, kernel size) - everything
+    that changes the mask. Value: resized image, grayscale, threshold mask,
+    morphology output, quality score, contours and their area/perimeter/
+    bbox arrays. Changing only min_area (or the export format) re-uses the
+    entry and just re-filters the cached contour stats.
+    """
+    
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Shared by all engines, so engines that differ only in min_area share work
+ANALYSIS_CACHE = AnalysisCache()
+
+
+# Sidebar "Confidence Level" -> morphology kernel size
+# Stricter modes use a larger kernel, which removes more small specks
+CONFIDENCE_KERNELS = {
+    "High (Strict)": 7,
+    "Medium (Balanced)": 5,
+    "Low (Lenient)": 3,
+}
+
+EXPORT_FORMATS = {"PNG": "png", "JPG": "jpg", "BMP": "bmp"}
+
+# Reference mode: Otsu threshold floor for the template difference. A clean
+# board's difference is sensor noise only, which Otsu would still split.
+REFERENCE_MIN_DIFF = 30
+
+
+class DetectionEngine:
+    """
+    Reusable, parameterized detection pipeline
+    
+    Parameters are validated once in the constructor. The structuring
+    element and threshold lookup table are built once there too, and then
+    reused by every detect / detect_batch call.
+    
+    Two ways to find defect candidates:
+        - threshold mode (default): fixed binary threshold of the image
+        - reference mode (reference="<board type>"): difference to the
+          golden template of that board type, thresholded with Otsu
+          (at least REFERENCE_MIN_DIFF), so traces that match the
+          template are not flagged
+    Morphology, contour analysis, scoring and rendering are shared.
+    """
+    
+    def __init__(self, min_area=50, threshold_value=127,
+                 confidence_level="Medium (Balanced)", export_format="PNG",
+                 reference=None, registry=None):
+        """
+        Args:
+            min_area: Minimum defect area in pixels² (contours <= this are ignored)
+            threshold_value: Binary threshold (0-255), threshold mode only
+            confidence_level: One of CONFIDENCE_KERNELS
+            export_format: One of EXPORT_FORMATS
+            reference: Board type to compare against (None = threshold mode)
+            registry: TemplateRegistry holding the reference (defaults to
+                      the shared TEMPLATE_REGISTRY)
+        """
+        if not isinstance(min_area, (int, float)) or min_area < 0:
+            raise ValueError(f"min_area must be a non-negative number, got {min_area!r}")
+        if not isinstance(threshold_value, (int, np.integer)) or not 0 <= threshold_value <= 255:
+            raise ValueError(f"threshold_value must be an integer in 0-255, got {threshold_value!r}")
+        if confidence_level not in CONFIDENCE_KERNELS:
+            raise ValueError(f"confidence_level must be one of {list(CONFIDENCE_KERNELS)}, "
+                             f"got {confidence_level!r}")
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"export_format must be one of {list(EXPORT_FORMATS)}, "
+                             f"got {export_format!r}")
+        
+        self.min_area = min_area
+        self.threshold_value = int(threshold_value)
+        self.confidence_level = confidence_level
+        self.export_format = export_format
+        self.extension = EXPORT_FORMATS[export_format]
+        
+        # Resolved once - the engine keeps this template even if the
+        # registry entry is replaced later
+        self.reference = reference
+        self.template = None
+        if reference is not None:
+            try:
+                self.template = (registry or TEMPLATE_REGISTRY).get(reference)
+            except KeyError as e:
+                raise ValueError(e.args[0]) from None
+        # Part of the analysis cache key: what decides the binary mask
+        self._mask_key = (self.threshold_value if self.template is None
+                          else ("reference", self.template.digest))
+        
+        # Precomputed once per parameter set
+        kernel_size = CONFIDENCE_KERNELS[confidence_level]
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+        # Same as cv2.threshold(gray, threshold_value, 255, THRESH_BINARY)
+        self.threshold_lut = np.where(
+            np.arange(256) > self.threshold_value, 255, 0
+        ).astype(np.uint8)
+    
+    def params(self):
+        """Return the parameter set as a dictionary"""
+        return {
+            'min_area': self.min_area,
+            'threshold_value': self.threshold_value,
+            'confidence_level': self.confidence_level,
+            'export_format': self.export_format,
+            'reference': self.reference
+        }
+    
+    def __repr__(self):
+        params = ", ".join(f"{k}={v!r}" for k, v in self.params().items())
+        return f"DetectionEngine({params})"
+    
+    def analyze(self, image):
+        """
+        Run the upstream stages (resize → contour stats), memoized
+        
+        Results are cached in ANALYSIS_CACHE keyed by image content and the
+        parameters that affect the mask, so repeated analyses of the same
+        image with a different min_area skip straight to filtering.
+        
+        Returns:
+            Dictionary with 'resized', 'gray', 'thresh', 'morph',
+            'quality_score', 'contours' and 'stats'
+        """
+        # Encoded bytes are keyed as they are, so a cache hit skips the decode
+        encoded = isinstance(image, (bytes, bytearray, memoryview))
+        img = image if encoded else np.asarray(image)
+        key = (_image_key(img), self._mask_key, self.kernel.shape[0])
+        analysis = ANALYSIS_CACHE.get(key)
+        if analysis is not None:
+            return analysis
+        
+        # ===== STEP 1: Prepare Image =====
+        # Decode / convert to BGR and resize for processing in one pass
+        img_resized = ingest(img, PROCESS_SIZE)
+        
+        # ===== STEP 2: Convert to Grayscale =====
+        gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
+        
+        # ===== STEP 3: Image Quality Assessment =====
+        # Calculate image quality metrics
+        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        mean_brightness = np.mean(gray)
+        contrast = np.std(gray)
+        quality_score = _quality_score(laplacian_var, mean_brightness, contrast)
+        
+        # ===== STEP 4: Apply Thresholding (Binary Image) =====
+        thresh = self._threshold(gray)
+        
+        # ===== STEP 5: Morphological Operations =====
+        morph = _morphology(thresh, self.kernel)
+        
+        # ===== STEP 6: Find and Measure Contours =====
+        contours, stats = _contour_stats(morph)
+        
+        analysis = {
+            'resized': img_resized,
+            'gray': gray,
+            'thresh': thresh,
+            'morph': morph,
+            'quality_score': quality_score,
+            'contours': contours,
+            'stats': stats
+        }
+        for array in (img_resized, gray, thresh, morph, *stats.values()):
+            array.setflags(write=False)
+        
+        ANALYSIS_CACHE.put(key, analysis)
+        return analysis
+    
+    def _threshold(self, gray, out=None):
+        """
+        Binary defect candidates of a processing-size grayscale frame
+        
+        Threshold mode uses the precomputed lookup table. Reference mode
+        thresholds |gray - template| with Otsu, falling back to
+        REFERENCE_MIN_DIFF when Otsu lands below it (clean board).
+        """
+        if self.template is None:
+            return cv2.LUT(gray, self.threshold_lut, dst=out)
+        if gray.shape != self.template.gray.shape:
+            raise ValueError(f"Reference templates are {self.template.gray.shape[::-1]}, "
+                             f"frame is {gray.shape[::-1]}")
+        diff = cv2.absdiff(gray, self.template.gray)
+        otsu, thresh = cv2.threshold(diff, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=out)
+        if otsu < REFERENCE_MIN_DIFF:
+            _, thresh = cv2.threshold(diff, REFERENCE_MIN_DIFF, 255, cv2.THRESH_BINARY, dst=out)
+        return thresh
+    
+    def detect(self, image, render=True):
+        """
+        PROFESSIONAL PCB DEFECT DETECTION
+        Uses image processing techniques from Milestone 1 & 2
+        
+        Args:
+            image: PIL image, RGB NumPy array or encoded image bytes
+            render: Draw and save the annotated result image. With
+                    render=False only geometry is returned (result_img and
+                    output_path are None); call render() later if needed.
+        
+        Returns:
+            - result_img: Image with defect boxes drawn
+            - defect_info: Dictionary with detection results
+            - output_path: Path to saved result image
+            - confidence_score: Confidence percentage (0-100)
+        """
+        
+        analysis = self.analyze(image)
+        
+        # ===== STEP 7: Filter Valid Defects =====
+        defect_info, overall_confidence, keep = _build_result(
+            analysis['stats'], analysis['quality_score'], self.min_area
+        )
+        
+        # ===== STEP 8: Draw Results (optional) =====
+        img_with_boxes = result_img = None
+        if render:
+            img_with_boxes, result_img = _render(analysis['resized'], analysis['contours'],
+                                                 defect_info, keep)
+        
+        # ===== STEP 9-10: Save Result Image and Log =====
+        output_path = _save_result(img_with_boxes, defect_info, overall_confidence,
+                                   self.extension)
+        
+        return result_img, defect_info, output_path, overall_confidence
+    
+    def render(self, image):
+        """
+        Draw this engine's detections on image, without logging anything
+        
+        Uses the analysis cache, so rendering a frame that was just run
+        through detect(render=False) does not repeat the detection stages.
+        
+        Returns:
+            RGB image with defect boxes drawn
+        """
+        analysis = self.analyze(image)
+        defect_info, _, keep = _build_result(
+            analysis['stats'], analysis['quality_score'], self.min_area
+        )
+        _, result_img = _render(analysis['resized'], analysis['contours'], defect_info, keep)
+        return result_img
+    
+    def detect_batch(self, images, render=True, log=True):
+        """
+        BATCHED PCB DEFECT DETECTION
+        Same pipeline as detect, for a burst of frames at once
+        
+        All frames are resized into one contiguous (N, 480, 640, 3) array so the
+        per-pixel stages (grayscale conversion, thresholding, quality metrics)
+        run once over the whole batch. Morphology and contour analysis are
+        spatial and still run frame by frame.
+        
+        Args:
+            images: Iterable of PIL images, RGB arrays or encoded image bytes
+            render: Draw and save annotated result images (see detect)
+            log: Queue results for the inspection log. Worker processes
+                 pass False and leave logging to the process that owns
+                 the log (see server.py); output_path is then None.
+        
+        Returns:
+            List with one (result_img, defect_info, output_path, confidence_score)
+            tuple per input frame, in input order
+        """
+        images = list(images)
+        if not images:
+            return []
+        
+        width, height = PROCESS_SIZE
+        count = len(images)
+        
+        # ===== STEP 1: Ingest frames into one contiguous pooled array =====
+        # Each frame is decoded / converted and resized straight into its slot
+        batch = BUFFER_POOL.acquire((count, height, width, 3))
+        gray_batch = BUFFER_POOL.acquire((count, height, width))
+        thresh_batch = BUFFER_POOL.acquire((count, height, width))
+        for i, image in enumerate(images):
+            ingest(image, PROCESS_SIZE, out=batch[i])
+        
+        # ===== STEP 2: Grayscale for the whole batch in one call =====
+        # Frames are stacked along rows, so the batch is one tall image
+        cv2.cvtColor(batch.reshape(count * height, width, 3), cv2.COLOR_BGR2GRAY,
+                     dst=gray_batch.reshape(count * height, width))
+        
+        # ===== STEP 3: Quality metrics per frame, vectorized =====
+        laplacian_vars = _batch_laplacian_var(gray_batch)
+        mean_brightness, brightness_var = _batch_mean_var(gray_batch.reshape(count, height * width))
+        contrast = np.sqrt(brightness_var)
+        
+        # ===== STEP 4: Threshold the whole batch in one call =====
+        # (reference mode: per frame, every frame gets its own Otsu threshold)
+        if self.template is None:
+            cv2.LUT(gray_batch.reshape(count * height, width), self.threshold_lut,
+                    dst=thresh_batch.reshape(count * height, width))
+        else:
+            for i in range(count):
+                self._threshold(gray_batch[i], out=thresh_batch[i])
+        
+        # ===== STEP 5-10: Per-frame morphology, contours and saving =====
+        results = []
+        for i in range(count):
+            quality_score = _quality_score(laplacian_vars[i], mean_brightness[i], contrast[i])
+            morph = _morphology(thresh_batch[i], self.kernel)
+            contours, stats = _contour_stats(morph)
+            defect_info, overall_confidence, keep = _build_result(
+                stats, quality_score, self.min_area
+            )
+            img_with_boxes = result_img = None
+            if render:
+                img_with_boxes, result_img = _render(batch[i], contours, defect_info, keep)
+            output_path = None
+            if log:
+                output_path = _save_result(img_with_boxes, defect_info, overall_confidence,
+                                           self.extension)
+            results.append((result_img, defect_info, output_path, overall_confidence))
+        
+        # Nothing returned refers to the stacks (overlays are drawn on copies)
+        for array in (batch, gray_batch, thresh_batch):
+            BUFFER_POOL.release(array)
+        return results
+
+
+    # ============ TILED HIGH-RESOLUTION MODE ============
+    def _window_mask(self, img, window):
+        """
+        Grayscale and cleaned binary mask of one full-resolution window
+        """
+        x0, y0, x1, y1 = window
+        gray = _to_gray(img[y0:y1, x0:x1])
+        morph = _morphology(cv2.LUT(gray, self.threshold_lut), self.kernel)
+        return gray, morph
+    
+    def _reduced_mask(self, img, window, scale, tile_size, overlap):
+        """
+        Cleaned mask of a large window at reduced scale, built tile by tile
+        
+        Every tile is thresholded and cleaned at full resolution (so thin
+        traces survive), then max-pooled into the small mask. Only one tile
+        and the small mask are in memory at a time.
+        """
+        x0, y0, x1, y1 = window
+        small = np.zeros((max(1, round((y1 - y0) * scale)), max(1, round((x1 - x0) * scale))),
+                         dtype=np.uint8)
+        for sub_window, core in tile_windows(y1 - y0, x1 - x0, tile_size, overlap):
+            sx0, sy0 = sub_window[:2]
+            _, morph = self._window_mask(img, (x0 + sx0, y0 + sy0, x0 + sub_window[2], y0 + sub_window[3]))
+            core_mask = morph[core[1] - sy0:core[3] - sy0, core[0] - sx0:core[2] - sx0]
+            
+            dx0, dy0 = int(core[0] * scale), int(core[1] * scale)
+            dx1 = min(max(dx0 + 1, int(np.ceil(core[2] * scale))), small.shape[1])
+            dy1 = min(max(dy0 + 1, int(np.ceil(core[3] * scale))), small.shape[0])
+            pooled = cv2.resize(core_mask, (dx1 - dx0, dy1 - dy0), interpolation=cv2.INTER_AREA)
+            small[dy0:dy1, dx0:dx1] |= np.where(pooled > 0, 255, 0).astype(np.uint8)
+        return small
+    
+    @staticmethod
+    def _measure_mask(morph, window, scale=1.0):
+        """
+        Contours and stats of a window mask, in image coordinates
+        
+        With scale < 1 (a reduced mask) the results are scaled back.
+        """
+        contours, stats = _contour_stats(morph)
+        if scale < 1.0:
+            stats['area'] = stats['area'] / (scale * scale)
+            stats['perimeter'] = stats['perimeter'] / scale
+            stats['bbox'] = np.round(stats['bbox'] / scale).astype(np.int32)
+            contours = [np.round(c / scale).astype(np.int32) for c in contours]
+        offset = np.array(window[:2], dtype=np.int32)
+        stats['bbox'] = stats['bbox'] + np.concatenate([offset, [0, 0]]).astype(np.int32)
+        contours = [c + offset for c in contours]
+        return contours, stats
+    
+    def _seam_margin(self):
+        # Close + open erode/dilate four times; each pass can shift a
+        # boundary by half a kernel, so this is how far window edges reach
+        return 2 * self.kernel.shape[0]
+    
+    def _inspect_tile(self, img, window, core, earlier_windows):
+        """
+        Detect defects in one tile window
+        
+        Returns:
+            Dictionary with the stats of the defects this tile reports
+            (seen whole here and in no earlier tile), the bboxes of defects
+            cut by an inner window edge ('pieces') and the quality-metric
+            sums over the tile core
+        """
+        height, width = img.shape[:2]
+        margin = self._seam_margin()
+        gray, morph = self._window_mask(img, window)
+        contours, stats = self._measure_mask(morph, window)
+        
+        clipped = touches_inner_edge(stats['bbox'], window, (width, height), margin)
+        owned = ~clipped & ~complete_in_any(stats['bbox'], earlier_windows,
+                                            (width, height), margin)
+        
+        # Quality sums over the core only, so every pixel counts exactly once
+        x0, y0 = window[:2]
+        core_rows = slice(core[1] - y0, core[3] - y0)
+        core_cols = slice(core[0] - x0, core[2] - x0)
+        core_gray = gray[core_rows, core_cols].astype(np.float64)
+        laplacian = cv2.Laplacian(gray, cv2.CV_64F)[core_rows, core_cols]
+        sums = np.array([
+            core_gray.size,
+            core_gray.sum(),
+            np.einsum("ij,ij->", core_gray, core_gray),
+            laplacian.sum(),
+            np.einsum("ij,ij->", laplacian, laplacian)
+        ])
+        
+        return {
+            'contours': [contours[i] for i in np.flatnonzero(owned).tolist()],
+            'area': stats['area'][owned],
+            'perimeter': stats['perimeter'][owned],
+            'bbox': stats['bbox'][owned],
+            'pieces': stats['bbox'][clipped],
+            'sums': sums
+        }
+    
+    def _merge_seams(self, img, pieces, windows, tile_size, overlap, max_merge_pixels):
+        """
+        Re-measure defects that were cut by tile seams
+        
+        Overlapping pieces are grouped and their union box (plus overlap
+        for morphology context) is measured again as one window. Only
+        defects spanning one of the group's pieces are kept, and those some
+        tile already saw whole are dropped, so nothing counts twice.
+        """
+        height, width = img.shape[:2]
+        margin = self._seam_margin()
+        merged = []
+        for group in group_boxes(pieces):
+            x0, y0, x1, y1 = union_box(pieces[group])
+            window = (max(x0 - overlap, 0), max(y0 - overlap, 0),
+                      min(x1 + overlap, width), min(y1 + overlap, height))
+            pixels = (window[2] - window[0]) * (window[3] - window[1])
+            if max_merge_pixels is not None and pixels > max_merge_pixels:
+                scale = float(np.sqrt(max_merge_pixels / pixels))
+                morph = self._reduced_mask(img, window, scale, tile_size, overlap)
+            else:
+                scale = 1.0
+                _, morph = self._window_mask(img, window)
+            
+            contours, stats = self._measure_mask(morph, window, scale)
+            tolerance = margin + int(np.ceil(2 / scale))
+            keep = (~touches_inner_edge(stats['bbox'], window, (width, height), margin) &
+                    ~complete_in_any(stats['bbox'], windows, (width, height), margin) &
+                    covers_any(stats['bbox'], pieces[group], tolerance))
+            merged.append({name: values[keep] for name, values in stats.items()})
+            merged[-1]['contours'] = [contours[i] for i in np.flatnonzero(keep).tolist()]
+            # How far a reduced-scale outline may be off
+            merged[-1]['slack'] = np.full(int(keep.sum()), 0.0 if scale == 1.0 else 2 / scale)
+        
+        if not merged:
+            return None
+        stats = {name: np.concatenate([m[name] for m in merged])
+                 for name in ('area', 'perimeter', 'bbox', 'slack')}
+        contours = [c for m in merged for c in m['contours']]
+        # Neighbouring groups can re-measure the same defect
+        _, unique = np.unique(np.column_stack([stats['bbox'], stats['area']]),
+                              axis=0, return_index=True)
+        unique = np.sort(unique)
+        stats = {name: values[unique] for name, values in stats.items()}
+        stats['contours'] = [contours[i] for i in unique.tolist()]
+        return stats
+    
+    def detect_tiled(self, image, tile_size=1024, overlap=64, workers=None,
+                     max_merge_pixels=None):
+        """
+        HIGH-RESOLUTION PCB DEFECT DETECTION
+        Full-resolution inspection in overlapping tiles (no 640x480 downscale)
+        
+        The image is split into tile_size cores, each processed with overlap
+        pixels of context on every side, in parallel threads. A defect seen
+        whole by several overlapping windows is kept by the first of them
+        only; defects cut by a seam are merged and re-measured. Results
+        match a single full-image pass exactly.
+        
+        Working buffers are per tile, so peak memory follows tile_size and
+        workers, not the image size - except for the seam merge, which
+        needs the bounding box of a defect that crosses tiles. Set
+        max_merge_pixels to cap that too: larger seam defects are then
+        measured on a max-pooled mask (approximate area and outline).
+        
+        min_area is in full-resolution pixels here. Only geometry is
+        returned; draw it with overlay.render_overlay if needed. Threshold
+        mode only.
+        
+        Args:
+            image: PIL image or array (RGB/RGBA/grayscale), e.g. a memmap
+            tile_size: Core tile size in pixels
+            overlap: Context around each tile (should exceed typical defect size)
+            workers: Parallel tile workers (default: CPU count)
+            max_merge_pixels: Largest seam window measured at full size
+                              (default: no limit); larger ones are shrunk
+        
+        Returns:
+            - defect_info: Dictionary with detection results
+            - confidence_score: Confidence percentage (0-100)
+        """
+        if self.template is not None:
+            raise ValueError("Reference templates are kept at the processing size - "
+                             "tiled full-resolution inspection needs threshold mode")
+        img = image if isinstance(image, np.ndarray) else np.asarray(image)
+        height, width = img.shape[:2]
+        overlap = max(int(overlap), 2 * self._seam_margin())
+        
+        # ===== STEP 1: Tile Layout =====
+        tiles = tile_windows(height, width, tile_size, overlap)
+        windows = [window for window, _ in tiles]
+        
+        # ===== STEP 2-6: Per-Tile Detection (parallel) =====
+        # Only `workers` tiles are in flight, each holding tile-sized buffers
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            results = list(pool.map(
+                lambda i: self._inspect_tile(img, *tiles[i], windows[:i]), range(len(tiles))
+            ))
+        
+        stats = {name: np.concatenate([r[name] for r in results])
+                 for name in ('area', 'perimeter', 'bbox')}
+        stats['bbox'] = stats['bbox'].reshape(-1, 4)
+        contours = [c for r in results for c in r['contours']]
+        slack = np.zeros(len(contours))
+        
+        # ===== STEP 7: Merge Defects Across Seams =====
+        pieces = np.concatenate([r['pieces'] for r in results]).reshape(-1, 4)
+        seams = self._merge_seams(img, pieces, windows, tile_size, overlap,
+                                  max_merge_pixels)
+        if seams is not None:
+            contours += seams.pop('contours')
+            slack = np.concatenate([slack, seams.pop('slack')])
+            stats = {name: np.concatenate([stats[name], seams[name]]) for name in stats}
+        
+        # Blobs inside a large defect's hole are not external contours
+        external = ~enclosed(stats['bbox'], contours, slack)
+        stats = {name: values[external] for name, values in stats.items()}
+        
+        # ===== STEP 8: Image Quality (whole image, from tile sums) =====
+        count, total, squares, lap_total, lap_squares = np.sum([r['sums'] for r in results], axis=0)
+        mean_brightness = total / count
+        contrast = np.sqrt(max(squares / count - mean_brightness ** 2, 0))
+        laplacian_var = max(lap_squares / count - (lap_total / count) ** 2, 0)
+        quality_score = _quality_score(laplacian_var, mean_brightness, contrast)
+        
+        # ===== STEP 9-10: Score and Log =====
+        defect_info, overall_confidence, _ = _build_result(stats, quality_score, self.min_area)
+        _save_result(None, defect_info, overall_confidence, self.extension)
+        
+        return defect_info, overall_confidence
+
+
+# Default parameters - matches the original hard-coded pipeline
+DEFAULT_ENGINE = DetectionEngine()
+
+
+def detect_defect(image, engine=None, render=True):
+    """
+    PROFESSIONAL PCB DEFECT DETECTION
+    Runs image through engine (DEFAULT_ENGINE if not given)
+    
+    With render=False no overlay is drawn or saved (result_img and
+    output_path are None) - for callers that only need the defects.
+    
+    Returns:
+        - result_img: Image with defect boxes drawn
+        - defect_info: Dictionary with detection results
+        - output_path: Path to saved result image
+        - confidence_score: Confidence percentage (0-100)
+    """
+    return (engine or DEFAULT_ENGINE).detect(image, render)
+
+
+def detect_defects_batch(images, engine=None, render=True, log=True):
+    """
+    BATCHED PCB DEFECT DETECTION
+    Runs a burst of frames through engine (DEFAULT_ENGINE if not given)
     
-    # ===== STEP 10: Save Log =====
-    save_log(defect_info)
+    Returns:
+        List with one (result_img, defect_info, output_path, confidence_score)
+        tuple per input frame, in input order
+    """
+    return (engine or DEFAULT_ENGINE).detect_batch(images, render, log)
+
+
+def detect_defect_tiled(image, engine=None, **tiling):
+    """
+    HIGH-RESOLUTION PCB DEFECT DETECTION
+    Tiled full-resolution run through engine (see DetectionEngine.detect_tiled)
     
-    return result_img, defect_info, output_path, overall_confidence
+    Returns:
+        - defect_info: Dictionary with detection results
+        - confidence_score: Confidence percentage (0-100)
+    """
+    return (engine or DEFAULT_ENGINE).detect_tiled(image, **tiling)
+
+
+def render_defects(image, engine=None):
+    """
+    Draw the defects engine finds in image (RGB), on demand
+    """
+    return (engine or DEFAULT_ENGINE).render(image)
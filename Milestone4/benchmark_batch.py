@@ -0,0 +1,91 @@
+"""
+MILESTONE 4: Batch Detection Throughput Benchmark
+Compares detect_defects_batch with calling detect_defect in a loop
+"""
+
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from backend import ANALYSIS_CACHE, detect_defect, detect_defects_batch, flush_results
+
+
+def make_synthetic_boards(count, size=(1280, 960), seed=0):
+    """
+    Create synthetic PCB boards (RGB PIL images) with random pads and traces
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    boards = []
+    for _ in range(count):
+        board = np.full((height, width, 3), (20, 90, 30), dtype=np.uint8)
+        for _ in range(60):
+            x, y = rng.integers(0, width), rng.integers(0, height)
+            r = int(rng.integers(5, 25))
+            cv2.circle(board, (int(x), int(y)), r, (200, 170, 60), -1)
+        for _ in range(40):
+            p1 = tuple(int(v) for v in rng.integers(0, (width, height)))
+            p2 = tuple(int(v) for v in rng.integers(0, (width, height)))
+            cv2.line(board, p1, p2, (210, 180, 70), 4)
+        noise = rng.normal(0, 4, board.shape)
+        board = np.clip(board + noise, 0, 255).astype(np.uint8)
+        boards.append(Image.fromarray(board))
+    return boards
+
+
+def run_benchmark(batch_size=32, repeats=3):
+    """
+    Time both entry points on the same burst of frames and print throughput
+    """
+    boards = make_synthetic_boards(batch_size)
+
+    print("\n" + "="*60)
+    print("BATCH DETECTION BENCHMARK")
+    print("="*60)
+    print(f"Frames per burst: {batch_size}")
+    print(f"Repeats: {repeats}")
+
+    # Results are written to output/ and logs/ - keep them out of the project
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            loop_times = []
+            batch_times = []
+            for _ in range(repeats):
+                # Start every timed run cold - otherwise repeats (and the
+                # batch after the loop) are served from the analysis cache
+                ANALYSIS_CACHE.clear()
+                start = time.perf_counter()
+                loop_results = [detect_defect(board) for board in boards]
+                loop_times.append(time.perf_counter() - start)
+
+                ANALYSIS_CACHE.clear()
+                start = time.perf_counter()
+                batch_results = detect_defects_batch(boards)
+                batch_times.append(time.perf_counter() - start)
+
+            # Let the background writer finish before leaving the temp dir
+            flush_results()
+        finally:
+            os.chdir(cwd)
+
+    # Both paths must agree on every frame
+    for single, batched in zip(loop_results, batch_results):
+        assert single[1]['count'] == batched[1]['count']
+        assert np.array_equal(single[0], batched[0])
+
+    loop_best = min(loop_times)
+    batch_best = min(batch_times)
+    print(f"✔️ detect_defect loop:  {loop_best:.3f}s  ({batch_size / loop_best:.1f} frames/s)")
+    print(f"✔️ detect_defects_batch: {batch_best:.3f}s  ({batch_size / batch_best:.1f} frames/s)")
+    print(f"✔️ Speedup: {loop_best / batch_best:.2f}x")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,74 @@
+"""
+MILESTONE 4: Contour Statistics Microbenchmark
+Per-contour cv2 loop vs vectorized contour stats on high-defect boards
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from backend import _contour_stats_loop, _contour_stats_vectorized
+
+
+def make_noisy_masks(count, defect_density=0.3, size=(640, 480), seed=0):
+    """
+    Create binary masks with thousands of blobs (very noisy boards)
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    masks = []
+    for i in range(count):
+        mask = (rng.random((height, width)) < defect_density).astype(np.uint8) * 255
+        if i % 2:
+            # Mix of speckle and larger merged blobs
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+        masks.append(mask)
+    return masks
+
+
+def _time(function, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(num_boards=10, repeats=5):
+    """
+    Check both paths agree exactly, then time them
+    """
+    masks = make_noisy_masks(num_boards)
+    contour_lists = [cv2.findContours(m, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+                     for m in masks]
+    total_contours = sum(len(c) for c in contour_lists)
+
+    print("\n" + "="*60)
+    print("CONTOUR STATISTICS BENCHMARK")
+    print("="*60)
+    print(f"Boards: {num_boards}")
+    print(f"Contours: {total_contours} ({total_contours // num_boards} per board)")
+
+    # Results must be bit-identical to the cv2 per-contour path
+    for contours in contour_lists:
+        reference = _contour_stats_loop(contours)
+        vectorized = _contour_stats_vectorized(contours)
+        for key in reference:
+            assert np.array_equal(reference[key], vectorized[key]), key
+    print("✔️ Vectorized stats identical to cv2 loop")
+
+    loop_time = _time(lambda: [_contour_stats_loop(c) for c in contour_lists], repeats)
+    vector_time = _time(lambda: [_contour_stats_vectorized(c) for c in contour_lists], repeats)
+
+    print(f"✔️ cv2 per-contour loop: {loop_time * 1000:.1f} ms "
+          f"({total_contours / loop_time / 1e6:.2f} M contours/s)")
+    print(f"✔️ Vectorized:           {vector_time * 1000:.1f} ms "
+          f"({total_contours / vector_time / 1e6:.2f} M contours/s)")
+    print(f"✔️ Speedup: {loop_time / vector_time:.2f}x")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_benchmark()
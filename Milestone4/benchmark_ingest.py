@@ -0,0 +1,106 @@
+"""
+MILESTONE 4: Ingestion Memory Benchmark
+Peak allocation per call (tracemalloc) of the old PIL conversion and the pooled ingest path
+"""
+
+import io
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from backend import PROCESS_SIZE
+from benchmark_batch import make_synthetic_boards
+from ingest import ingest
+
+# Allowance for Python objects and OpenCV's small temporaries
+SLACK_BYTES = 64 * 1024
+
+
+def legacy_prepare(image):
+    """Old detect_defect preparation: array, BGR conversion, unused copy, resize"""
+    img = np.array(image)
+    img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    original_img = img.copy()
+    return cv2.resize(img, PROCESS_SIZE)
+
+
+def legacy_decode_prepare(data):
+    """Old path for an upload: PIL decode, then legacy_prepare"""
+    return legacy_prepare(Image.open(io.BytesIO(data)))
+
+
+def peak_bytes(fn, *args):
+    """Peak traced allocation of one warm call"""
+    fn(*args)
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def best_time(fn, *args, repeats=20):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmark(size=(1280, 960)):
+    """
+    Measure and check the peak allocation of one ingest call per input type
+
+    Budgets (beyond SLACK_BYTES):
+        - array: nothing - resize and conversion go to pooled buffers
+        - bytes: the decoded frame
+        - PIL:   two frames - Pillow's array export joins its row chunks
+    """
+    board = make_synthetic_boards(1, size)[0]
+    array = np.asarray(board).copy()
+    buffer = io.BytesIO()
+    board.save(buffer, format="PNG")
+    encoded = buffer.getvalue()
+    frame_bytes = array.nbytes
+
+    width, height = PROCESS_SIZE
+    out = np.empty((height, width, 3), dtype=np.uint8)
+
+    print("\n" + "="*60)
+    print("INGESTION MEMORY BENCHMARK")
+    print("="*60)
+    print(f"Input: {size[0]}x{size[1]} RGB ({frame_bytes / 1e6:.1f} MB per frame), "
+          f"processed at {width}x{height}")
+
+    # Same pixels as the old path (PNG is lossless, so the bytes decode to the board)
+    expected = legacy_prepare(board)
+    for source in (array, encoded, board):
+        assert np.array_equal(ingest(source, PROCESS_SIZE, out), expected)
+
+    cases = [
+        ("array", array, legacy_prepare, 0),
+        ("bytes", encoded, legacy_decode_prepare, frame_bytes),
+        ("PIL", board, legacy_prepare, 2 * frame_bytes),
+    ]
+    for name, source, legacy, budget in cases:
+        old_peak = peak_bytes(legacy, source)
+        new_peak = peak_bytes(ingest, source, PROCESS_SIZE, out)
+        old_time = best_time(legacy, source)
+        new_time = best_time(ingest, source, PROCESS_SIZE, out)
+        assert new_peak <= budget + SLACK_BYTES, \
+            f"{name}: peak {new_peak} bytes over budget {budget + SLACK_BYTES}"
+        print(f"✔️ {name:5s} peak {old_peak / 1e6:6.2f} MB -> {new_peak / 1e6:6.2f} MB "
+              f"({new_peak / frame_bytes:.2f} frames), "
+              f"{old_time * 1000:.2f} ms -> {new_time * 1000:.2f} ms")
+
+    print("✔️ Pixels identical to the old conversion")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,268 @@
+"""
+MILESTONE 4: Columnar Binary Inspection Log
+Append-only, memory-mappable log of every frame and every defect
+"""
+
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+
+from defect_set import DefectSet
+
+DEFAULT_LOG_DIR = os.path.join("logs", "inspection")
+
+# One raw little-endian file per column, so each column can be np.memmap'ed
+FRAME_COLUMNS = {
+    'frame_id': np.dtype('<u8'),
+    'timestamp': np.dtype('<f8'),      # Unix time (seconds)
+    'status': np.dtype('u1'),          # 0 = NO DEFECT, 1 = DEFECT DETECTED
+    'defect_count': np.dtype('<u4'),
+    'confidence': np.dtype('<f4'),
+    'result_id': np.dtype('S32'),
+}
+
+DEFECT_COLUMNS = {
+    'frame_id': np.dtype('<u8'),
+    'timestamp': np.dtype('<f8'),
+    'x': np.dtype('<i4'),
+    'y': np.dtype('<i4'),
+    'width': np.dtype('<i4'),
+    'height': np.dtype('<i4'),
+    'area': np.dtype('<f4'),
+    'circularity': np.dtype('<f4'),
+}
+
+STATUS_NAMES = {0: 'NO DEFECT', 1: 'DEFECT DETECTED'}
+
+
+class DefectLog:
+    """
+    Columnar log stored under log_dir/frames/ and log_dir/defects/
+
+    Every column is a flat file of fixed-width values. Appending adds
+    bytes to the end of each column file. Reading memory-maps the columns,
+    so filtering touches only the columns involved and no text is parsed.
+    Timestamps never decrease (append clamps a clock that stepped back to
+    the last logged time), so time-range queries use a binary search.
+
+    A write interrupted half way leaves some columns longer than others.
+    Readers only see rows present in every column, and the next append
+    cuts the columns back to those rows first, so the tables stay aligned.
+
+    Only one process should append to a given log_dir at a time. The
+    Milestone 4 background writer is that single writer.
+    """
+
+    def __init__(self, log_dir=DEFAULT_LOG_DIR):
+        self.log_dir = log_dir
+        self.frames_dir = os.path.join(log_dir, "frames")
+        self.defects_dir = os.path.join(log_dir, "defects")
+
+    # ============ WRITING ============
+    @staticmethod
+    def _append_columns(table_dir, columns, values):
+        os.makedirs(table_dir, exist_ok=True)
+        for name, dtype in columns.items():
+            data = np.asarray(values[name], dtype=dtype)
+            with open(os.path.join(table_dir, name + ".bin"), "ab") as file:
+                file.write(data.tobytes())
+
+    @staticmethod
+    def _truncate(table_dir, columns, rows):
+        for name, dtype in columns.items():
+            path = os.path.join(table_dir, name + ".bin")
+            if os.path.exists(path) and os.path.getsize(path) != rows * dtype.itemsize:
+                os.truncate(path, rows * dtype.itemsize)
+
+    def _repair(self):
+        """
+        Cut the tables back to the last complete append
+
+        Drops torn column tails, and defects whose frame was never
+        written (defects are appended before their frames).
+
+        Returns:
+            (frame count, last frame timestamp or None)
+        """
+        rows = self._length(self.frames_dir, FRAME_COLUMNS)
+        self._truncate(self.frames_dir, FRAME_COLUMNS, rows)
+
+        defect_rows = self._length(self.defects_dir, DEFECT_COLUMNS)
+        if defect_rows:
+            frame_ids = np.memmap(os.path.join(self.defects_dir, "frame_id.bin"),
+                                  dtype=DEFECT_COLUMNS['frame_id'], mode="r", shape=(defect_rows,))
+            defect_rows = int(np.searchsorted(frame_ids, np.uint64(rows), side="left"))
+            del frame_ids
+        self._truncate(self.defects_dir, DEFECT_COLUMNS, defect_rows)
+
+        last_timestamp = None
+        if rows:
+            dtype = FRAME_COLUMNS['timestamp']
+            last_timestamp = float(np.fromfile(os.path.join(self.frames_dir, "timestamp.bin"),
+                                               dtype=dtype, count=1,
+                                               offset=(rows - 1) * dtype.itemsize)[0])
+        return rows, last_timestamp
+
+    def append_frames(self, frames):
+        """
+        Append a batch of frames and all of their defects
+
+        Args:
+            frames: List of (timestamp, defect_info, confidence) tuples.
+                    A timestamp earlier than the previous frame's is
+                    logged as the previous frame's time.
+
+        Returns:
+            Frame IDs assigned to the batch
+        """
+        if not frames:
+            return []
+
+        first_id, last_timestamp = self._repair()
+        frame_ids = np.arange(first_id, first_id + len(frames), dtype=np.uint64)
+
+        frame_values = {name: [] for name in FRAME_COLUMNS}
+        defect_values = {name: [] for name in DEFECT_COLUMNS}
+
+        for frame_id, (timestamp, defect_info, confidence) in zip(frame_ids, frames):
+            if last_timestamp is not None and timestamp < last_timestamp:
+                timestamp = last_timestamp
+            last_timestamp = timestamp
+            defects = defect_info['defects']
+            if not isinstance(defects, DefectSet):
+                defects = DefectSet.from_dicts(defects)
+            frame_values['frame_id'].append(frame_id)
+            frame_values['timestamp'].append(timestamp)
+            frame_values['status'].append(1 if defect_info['count'] > 0 else 0)
+            frame_values['defect_count'].append(defect_info['count'])
+            frame_values['confidence'].append(confidence)
+            frame_values['result_id'].append(defect_info.get('result_id', '').encode())
+
+            # Whole columns at once - no per-defect Python work
+            count = len(defects)
+            defect_values['frame_id'].append(np.full(count, frame_id, dtype=np.uint64))
+            defect_values['timestamp'].append(np.full(count, timestamp, dtype=np.float64))
+            for name in ('x', 'y', 'width', 'height', 'area'):
+                defect_values[name].append(getattr(defects, name))
+            if defects.circularity is None:
+                defect_values['circularity'].append(np.zeros(count))
+            else:
+                defect_values['circularity'].append(defects.circularity)
+
+        defect_values = {name: np.concatenate(parts) for name, parts in defect_values.items()}
+
+        # Defects first: a frame never becomes visible before its defects
+        self._append_columns(self.defects_dir, DEFECT_COLUMNS, defect_values)
+        self._append_columns(self.frames_dir, FRAME_COLUMNS, frame_values)
+        return list(frame_ids)
+
+    # ============ READING ============
+    @staticmethod
+    def _length(table_dir, columns):
+        """Rows fully present in every column (ignores a torn last write)"""
+        lengths = []
+        for name, dtype in columns.items():
+            path = os.path.join(table_dir, name + ".bin")
+            if not os.path.exists(path):
+                return 0
+            lengths.append(os.path.getsize(path) // dtype.itemsize)
+        return min(lengths)
+
+    @classmethod
+    def _open_table(cls, table_dir, columns):
+        rows = cls._length(table_dir, columns)
+        table = {}
+        for name, dtype in columns.items():
+            if rows == 0:
+                table[name] = np.empty(0, dtype=dtype)
+            else:
+                table[name] = np.memmap(os.path.join(table_dir, name + ".bin"),
+                                        dtype=dtype, mode="r", shape=(rows,))
+        return table
+
+    @staticmethod
+    def _time_slice(timestamps, start, end):
+        lo = 0 if start is None else np.searchsorted(timestamps, _to_unix(start), side="left")
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, _to_unix(end), side="right")
+        return slice(lo, hi)
+
+    def frames(self, start=None, end=None):
+        """
+        Frame columns within [start, end] (datetime or Unix seconds)
+
+        Returns:
+            Dictionary of column name -> array (memory-mapped views)
+        """
+        table = self._open_table(self.frames_dir, FRAME_COLUMNS)
+        window = self._time_slice(table['timestamp'], start, end)
+        return {name: column[window] for name, column in table.items()}
+
+    def defects(self, start=None, end=None, min_area=None, max_area=None, frame_ids=None):
+        """
+        Defect columns filtered by time range, defect area and/or frames
+
+        The time range is a zero-copy slice. Area and frame filters are
+        vectorized boolean masks over the memory-mapped columns.
+
+        Returns:
+            Dictionary of column name -> array
+        """
+        table = self._open_table(self.defects_dir, DEFECT_COLUMNS)
+        window = self._time_slice(table['timestamp'], start, end)
+        table = {name: column[window] for name, column in table.items()}
+
+        mask = None
+        if min_area is not None:
+            mask = table['area'] >= min_area
+        if max_area is not None:
+            upper = table['area'] <= max_area
+            mask = upper if mask is None else mask & upper
+        if frame_ids is not None:
+            in_frames = np.isin(table['frame_id'], np.asarray(frame_ids, dtype=np.uint64))
+            mask = in_frames if mask is None else mask & in_frames
+
+        if mask is None:
+            return table
+        return {name: column[mask] for name, column in table.items()}
+
+    # ============ EXPORT ============
+    def export_csv(self, csv_path, start=None, end=None, per_defect=False):
+        """
+        Export frames (or individual defects) to CSV
+
+        The frame export uses the same columns as the prediction log.
+        """
+        os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+        with open(csv_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            if per_defect:
+                table = self.defects(start, end)
+                writer.writerow(["Timestamp", "Frame_ID", "X", "Y", "Width", "Height",
+                                 "Area", "Circularity"])
+                for i in range(len(table['frame_id'])):
+                    writer.writerow([_format_time(table['timestamp'][i]), int(table['frame_id'][i]),
+                                     int(table['x'][i]), int(table['y'][i]),
+                                     int(table['width'][i]), int(table['height'][i]),
+                                     float(table['area'][i]), float(table['circularity'][i])])
+            else:
+                table = self.frames(start, end)
+                writer.writerow(["Timestamp", "Status", "Defect_Count", "Details", "Result_ID"])
+                for i in range(len(table['frame_id'])):
+                    count = int(table['defect_count'][i])
+                    details = f"{count} defect(s) detected" if count > 0 else "No defects"
+                    writer.writerow([_format_time(table['timestamp'][i]),
+                                     STATUS_NAMES[int(table['status'][i])], count, details,
+                                     table['result_id'][i].decode()])
+        return csv_path
+
+
+def _to_unix(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def _format_time(unix_seconds):
+    return datetime.fromtimestamp(float(unix_seconds)).strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,138 @@
+"""
+MILESTONE 3/4: Image Ingestion
+Bytes, NumPy arrays or PIL images to processing-size BGR frames, through pooled buffers
+"""
+
+import threading
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+# Encoded bodies are decoded like PIL does (no EXIF rotation, alpha dropped)
+DECODE_FLAGS = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+
+# Arrays and PIL images are in PIL channel order
+_TO_BGR = {2: cv2.COLOR_GRAY2BGR, 3: cv2.COLOR_RGB2BGR, 4: cv2.COLOR_RGBA2BGR}
+
+
+class BufferPool:
+    """
+    Free lists of reusable uint8 arrays, keyed by shape
+
+    acquire() hands out a pooled array (contents undefined) or allocates
+    one; release() returns it. A buffer that is never released is simply
+    garbage collected, so an exception between the two only costs one
+    allocation on the next call.
+    """
+
+    def __init__(self, max_per_shape=8):
+        self.max_per_shape = max_per_shape
+        self.allocations = 0
+        self.reuses = 0
+        self._free = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def acquire(self, shape):
+        shape = tuple(shape)
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                self.reuses += 1
+                return free.pop()
+            self.allocations += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, array):
+        with self._lock:
+            free = self._free[array.shape]
+            if len(free) < self.max_per_shape:
+                free.append(array)
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'allocations': self.allocations, 'reuses': self.reuses,
+                    'pooled': sum(len(free) for free in self._free.values())}
+
+
+# Shared by every caller in the process (scratch frames, detect_batch stacks)
+BUFFER_POOL = BufferPool()
+
+
+def decode_image(data):
+    """
+    Decode an encoded image (PNG/JPG/BMP bytes) straight to a BGR array
+
+    The bytes are wrapped, not copied; the decoded frame is the only
+    allocation.
+    """
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), DECODE_FLAGS)
+    if img is None:
+        raise ValueError("Cannot decode image: unknown format or corrupt data")
+    return img
+
+
+def source_frame(image):
+    """
+    View of image as an array plus the cv2 code that turns it into BGR
+
+    Returns:
+        (array, code) - code is None when array is already BGR (decoded
+        bytes). Arrays and PIL images are not copied beyond what PIL's
+        array interface does itself.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(image), None
+    img = np.asarray(image)
+    channels = img.shape[2] if img.ndim == 3 else 2
+    if img.dtype != np.uint8 or img.ndim not in (2, 3) or channels not in _TO_BGR:
+        raise ValueError(f"Expected an 8-bit grayscale, RGB or RGBA image, "
+                         f"got {img.dtype} array of shape {img.shape}")
+    return img, _TO_BGR[channels]
+
+
+def ingest(image, size, out=None, pool=BUFFER_POOL):
+    """
+    Bring an image to a (height, width, 3) BGR frame of size (width, height)
+
+    Resize and colour conversion are fused: the frame is resized in its
+    own channel layout first, so the conversion only touches the small
+    result (bit-identical to converting first - both are per channel).
+    The intermediate frame comes from pool, and out can be a pooled
+    buffer or a slot of a batch array, so a warm call allocates nothing
+    beyond the decode of encoded bytes.
+
+    Args:
+        image: Encoded bytes, NumPy array (PIL channel order) or PIL image
+        size: (width, height) to resize to
+        out: Optional (height, width, 3) uint8 destination
+        pool: BufferPool for the intermediate frame
+
+    Returns:
+        out (or a new array when out is None)
+    """
+    img, code = source_frame(image)
+    width, height = size
+    same_size = img.shape[:2] == (height, width)
+
+    if code is None:
+        if same_size and out is None:
+            return img
+        if out is None:
+            out = np.empty((height, width, 3), dtype=np.uint8)
+        return cv2.resize(img, size, dst=out)
+
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    if same_size:
+        return cv2.cvtColor(img, code, dst=out)
+
+    scratch = pool.acquire((height, width) + img.shape[2:])
+    cv2.resize(img, size, dst=scratch)
+    cv2.cvtColor(scratch, code, dst=out)
+    pool.release(scratch)
+    return out
@@ -0,0 +1,187 @@
+"""
+MILESTONE 4: Inference Server Load Generator
+Fires concurrent /detect requests at server.py and reports throughput and latency
+
+Usage:
+    python load_test.py --spawn --requests 400 --concurrency 16
+    python load_test.py --url http://127.0.0.1:8008 --requests 1000
+"""
+
+import argparse
+import http.client
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from benchmark_batch import make_synthetic_boards
+from template_registry import TEMPLATE_DIR
+
+
+def encode_boards(count, size=(1280, 960)):
+    """Synthetic boards as PNG bytes (what a line controller would upload)"""
+    payloads = []
+    for board in make_synthetic_boards(count, size):
+        buffer = io.BytesIO()
+        board.save(buffer, format="PNG")
+        payloads.append(buffer.getvalue())
+    return payloads
+
+
+def _get_json(url, path):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def wait_for_server(url, timeout=120.0):
+    """Poll /health until the server answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if _get_json(url, "/health").get('status') == 'ok':
+                return True
+        except OSError:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def run_load(url, payloads, total_requests, concurrency):
+    """
+    Send total_requests images from concurrency keep-alive connections
+
+    Returns:
+        (client latencies in seconds, error count, wall time, batch sizes)
+    """
+    parts = urlsplit(url)
+    latencies = []
+    batch_sizes = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                body = payloads[i % len(payloads)]
+                start = time.perf_counter()
+                try:
+                    conn.request("POST", "/detect", body=body,
+                                 headers={'Content-Type': 'application/octet-stream'})
+                    response = conn.getresponse()
+                    result = json.loads(response.read())
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException, ValueError):
+                    conn.close()
+                    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                        batch_sizes.append(result['batch_size'])
+                    else:
+                        errors[0] += 1
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - start, batch_sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for server.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8008")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--images", type=int, default=16,
+                        help="distinct synthetic boards to cycle through")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start server.py for the run (in a temporary working "
+                             "directory, so its logs stay out of the source tree) "
+                             "and stop it afterwards")
+    parser.add_argument("--workers", type=int, default=None, help="server workers (--spawn)")
+    parser.add_argument("--max-batch", type=int, default=8, help="server max batch (--spawn)")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0,
+                        help="server max wait (--spawn)")
+    args = parser.parse_args()
+
+    server = None
+    workdir = None
+    if args.spawn:
+        here = os.path.dirname(os.path.abspath(__file__))
+        workdir = tempfile.TemporaryDirectory(prefix="pcb_load_test_")
+        port = urlsplit(args.url).port
+        command = [sys.executable, os.path.join(here, "server.py"), "--port", str(port),
+                   "--max-batch", str(args.max_batch), "--max-wait-ms", str(args.max_wait_ms),
+                   "--templates", os.path.join(here, TEMPLATE_DIR)]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+        server = subprocess.Popen(command, cwd=workdir.name)
+
+    try:
+        if not wait_for_server(args.url):
+            print(f"❌ No server answering at {args.url}")
+            return
+
+        payloads = encode_boards(args.images)
+        print("\n" + "="*60)
+        print("INFERENCE SERVER LOAD TEST")
+        print("="*60)
+        print(f"Server: {args.url}")
+        print(f"Requests: {args.requests} from {args.concurrency} clients "
+              f"({len(payloads)} distinct {len(payloads[0]) // 1024} KB PNGs)")
+
+        latencies, errors, wall, batch_sizes = run_load(args.url, payloads, args.requests,
+                                                        args.concurrency)
+        if latencies:
+            p50, p90, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 99]).tolist()
+            print(f"✔️ Throughput: {len(latencies) / wall:.1f} requests/s ({errors} errors)")
+            print(f"✔️ Client latency: p50 {p50:.1f} ms, p90 {p90:.1f} ms, p99 {p99:.1f} ms")
+            print(f"✔️ Mean batch size: {np.mean(batch_sizes):.2f}")
+
+        stats = _get_json(args.url, "/stats")
+        server_latency = stats['latency_ms']
+        if server_latency:
+            print(f"✔️ Server latency: p50 {server_latency['p50']:.1f} ms, "
+                  f"p90 {server_latency['p90']:.1f} ms, p99 {server_latency['p99']:.1f} ms")
+        print(f"✔️ Server: {stats['requests']} requests in {stats['batches']} batches, "
+              f"{stats['workers']} workers")
+        print("="*60 + "\n")
+    finally:
+        if server is not None:
+            # SIGTERM - the server finishes in-flight batches and flushes its logs
+            server.terminate()
+            try:
+                server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+        if workdir is not None:
+            workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
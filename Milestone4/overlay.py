@@ -0,0 +1,117 @@
+"""
+MILESTONE 4: Defect Overlay Renderer
+Draws detection results on demand, separate from detection itself
+"""
+
+import cv2
+import numpy as np
+
+# Overlay colors (BGR) - same as the original per-defect drawing
+BOX_COLOR = (0, 255, 0)
+CONTOUR_COLOR = (0, 165, 255)
+LABEL_COLOR = (0, 255, 0)
+
+# Above this many defects only the largest ones get an "Area:...px" label
+MAX_LABELS = 50
+
+
+def box_outline_mask(shape, bboxes):
+    """
+    Boolean mask of every box outline, as drawn by
+    cv2.rectangle(img, (x, y), (x+w, y+h), color, 2)
+
+    A thickness-2 outline is the band from x-1 to x+w+1 minus the inside
+    from x+2 to x+w-2, without its four outer corner pixels. All boxes are
+    painted at once as +1/-1 rectangles on a 2D difference grid, which one
+    cv2.integral call turns into per-pixel coverage.
+
+    Args:
+        shape: (height, width) of the image
+        bboxes: (N, 4) array of x, y, width, height
+    """
+    height, width = shape[:2]
+    bboxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+    if len(bboxes) == 0:
+        return np.zeros((height, width), dtype=bool)
+
+    x, y, w, h = bboxes.T
+    # float32 is exact here (small integer counts) and cv2.integral takes it
+    grid = np.zeros((height + 1, width + 1), dtype=np.float32)
+
+    def paint(x0, y0, x1, y1, value):
+        # Half-open rectangles [x0, x1) x [y0, y1), clipped to the image
+        x0 = np.clip(x0, 0, width)
+        x1 = np.clip(x1, 0, width)
+        y0 = np.clip(y0, 0, height)
+        y1 = np.clip(y1, 0, height)
+        valid = (x0 < x1) & (y0 < y1)
+        x0, x1, y0, y1 = x0[valid], x1[valid], y0[valid], y1[valid]
+        np.add.at(grid, (y0, x0), value)
+        np.add.at(grid, (y0, x1), -value)
+        np.add.at(grid, (y1, x0), -value)
+        np.add.at(grid, (y1, x1), value)
+
+    # Outer band, minus the inside, minus the four rounded-off corners
+    paint(x - 1, y - 1, x + w + 2, y + h + 2, 1)
+    paint(x + 2, y + 2, x + w - 1, y + h - 1, -1)
+    for corner_x in (x - 1, x + w + 1):
+        for corner_y in (y - 1, y + h + 1):
+            paint(corner_x, corner_y, corner_x + 1, corner_y + 1, -1)
+
+    coverage = cv2.integral(grid[:height, :width], sdepth=cv2.CV_32F)
+    return coverage[1:, 1:] > 0
+
+
+def _label_indices(defects, max_labels):
+    """Indices of the defects to label - all of them, or the largest ones"""
+    count = len(defects)
+    if max_labels is None or count <= max_labels:
+        return np.arange(count)
+    if max_labels <= 0:
+        return np.empty(0, dtype=np.intp)
+    largest = np.argpartition(-defects.area, max_labels - 1)[:max_labels]
+    return np.sort(largest)
+
+
+def render_overlay(img_bgr, defects, contours=None, max_labels=MAX_LABELS):
+    """
+    Draw defect boxes, contours and area labels on a copy of an image
+
+    Level of detail:
+        - boxes: all at once through one mask assignment
+        - contours: all kept contours in a single cv2.drawContours call
+        - labels: cv2.putText per defect, capped at max_labels (the largest
+          defects win); None labels every defect, 0 draws no labels
+
+    Args:
+        img_bgr: Processed (resized) BGR image the defects were found in
+        defects: DefectSet from detection
+        contours: Optional contours of the defects, same order as defects
+        max_labels: Label cap for crowded frames
+
+    Returns:
+        Annotated BGR image (the input is not modified)
+    """
+    img_with_boxes = img_bgr.copy()
+    if len(defects) == 0:
+        return img_with_boxes
+
+    # ===== Boxes =====
+    mask = box_outline_mask(img_with_boxes.shape, defects.bboxes())
+    box_color = np.empty_like(img_with_boxes)
+    box_color[:] = BOX_COLOR
+    cv2.copyTo(box_color, mask.view(np.uint8), img_with_boxes)
+
+    # ===== Contours =====
+    if contours:
+        cv2.drawContours(img_with_boxes, list(contours), -1, CONTOUR_COLOR, 2)
+
+    # ===== Labels =====
+    x = defects.x.tolist()
+    y = defects.y.tolist()
+    area = defects.area.tolist()
+    for i in _label_indices(defects, max_labels).tolist():
+        cv2.putText(img_with_boxes, f"Area:{int(area[i])}px", (x[i], y[i]-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, LABEL_COLOR, 1)
+
+    return img_with_boxes
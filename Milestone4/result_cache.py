@@ -0,0 +1,211 @@
+"""
+MILESTONE 4: Result Cache
+Content-addressed detection results, so re-analyzing the same upload is instant
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from defect_set import DefectSet
+from result_writer import get_writer
+
+CACHE_DIR = os.path.join("logs", "result_cache")
+
+# A render younger than this may still be queued in the background writer,
+# so its entry is kept (the lookup is only a miss) instead of dropped
+RENDER_GRACE_SECONDS = 60
+
+
+def result_key(image, params):
+    """
+    Cache key of one analysis: decoded pixels (plus shape) and the
+    detection parameters, so the same board re-encoded or re-uploaded
+    under another name still hits
+    """
+    img = np.asarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str((img.shape, img.dtype.str)).encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(img).data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Bounded, persistent cache of finished detections
+
+    An entry holds the defect_info, confidence and rendered result of one
+    analysis, plus the path of the output file that analysis wrote, so a
+    hit returns without detecting, logging or writing another output
+    file. The render is kept as a lossless PNG of its own - the output
+    file may be a JPG, and a hit must show exactly what a fresh run would.
+    Entries expire ttl_seconds after they were created; past max_entries
+    the least recently used ones are evicted. An entry whose render is
+    missing counts as a miss.
+
+    Everything lives in cache_dir, so it survives app restarts:
+        index.json      key -> output path, confidence, created, last used,
+                        plus the hit/miss/eviction counters; small, and
+                        rewritten (write-then-rename) on every change
+        <key>.json      defect_info of one entry (can hold many defects,
+                        so it is written once and not kept in the index)
+        <key>.png       the rendered result (queued on the background
+                        writer, like the output files; until it is on disk
+                        the render is served from memory, so a repeated
+                        upload hits right away)
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=256, ttl_seconds=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, "index.json")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._load()
+
+    # ============ PERSISTENCE ============
+    def _load(self):
+        try:
+            with open(self.path, "r") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return
+        entries = sorted(index.get('entries', {}).items(), key=lambda item: item[1]['last_used'])
+        self._entries = OrderedDict(entries)
+        self._counters.update(index.get('counters', {}))
+        self._evict(time.time())
+
+    def _store(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({'entries': self._entries, 'counters': self._counters}, file)
+        os.replace(tmp_path, self.path)
+
+    def _evict(self, now):
+        """Drop expired entries, then the least recently used past max_entries"""
+        expired = [key for key, entry in self._entries.items()
+                   if now - entry['created'] > self.ttl_seconds]
+        for key in expired:
+            self._drop(key)
+        evicted = len(expired)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            evicted += 1
+        self._counters['evictions'] += evicted
+        return evicted
+
+    def _info_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _render_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _drop(self, key):
+        """Forget one entry (the output file itself is kept)"""
+        del self._entries[key]
+        self._pending.pop(key, None)
+        for path in (self._info_path(key), self._render_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ============ LOOKUP ============
+    def get(self, key):
+        """
+        Cached result for key
+
+        Returns:
+            (result_img, defect_info, output_path, confidence_score, created)
+            like detect_defect plus the creation time, or None on a miss
+        """
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            entry = self._entries.get(key)
+            result_img = defect_info = None
+            if entry is not None:
+                render_path = self._render_path(key)
+                if os.path.exists(render_path):
+                    result_img = cv2.imread(render_path, cv2.IMREAD_COLOR)
+                if result_img is None:
+                    result_img = self._pending.get(key)
+                else:
+                    self._pending.pop(key, None)
+                try:
+                    with open(self._info_path(key), "r") as file:
+                        defect_info = json.load(file)
+                except (OSError, ValueError):
+                    pass
+                pending = result_img is None and now - entry['created'] < RENDER_GRACE_SECONDS
+                if (result_img is None or defect_info is None) and not pending:
+                    # Render or entry file gone - forget the entry
+                    self._drop(key)
+
+            if result_img is None or defect_info is None:
+                self._counters['misses'] += 1
+                self._store()
+                return None
+
+            entry['last_used'] = now
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            self._store()
+
+        defect_info['defects'] = DefectSet.from_dicts(defect_info['defects'])
+        return (cv2.cvtColor(result_img, cv2.COLOR_BGR2RGB), defect_info,
+                entry['output_path'], entry['confidence'], entry['created'])
+
+    def put(self, key, result_img, defect_info, output_path, confidence):
+        """
+        Remember a finished detection
+
+        Args:
+            result_img: RGB render as returned by detect_defect (saved as PNG)
+            output_path: The output file the detection wrote (may be None)
+        """
+        if result_img is None:
+            return
+        info = dict(defect_info)
+        info['defects'] = defect_info['defects'].to_dicts()
+        now = time.time()
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._info_path(key), "w") as file:
+                json.dump(info, file)
+            render = cv2.cvtColor(result_img, cv2.COLOR_RGB2BGR)
+            get_writer().submit_image(os.path.abspath(self._render_path(key)), render)
+            self._pending[key] = render
+            self._entries[key] = {
+                'output_path': output_path,
+                'confidence': float(confidence),
+                'created': now,
+                'last_used': now
+            }
+            self._entries.move_to_end(key)
+            self._evict(now)
+            self._store()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+            self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+            self._store()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return dict(self._counters, entries=len(self._entries),
+                        hit_rate=self._counters['hits'] / lookups if lookups else 0.0)
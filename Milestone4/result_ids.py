@@ -0,0 +1,78 @@
+"""
+MILESTONE 4: Result IDs and Output Layout
+Collision-free result names and a sharded output directory
+"""
+
+import itertools
+import os
+import re
+import threading
+from datetime import datetime
+
+OUTPUT_DIR = "output"
+
+# 20260120_201256_123_1a2b_042.jpg
+#   date   time   ms  pid  seq format
+_ID_PATTERN = re.compile(r"^(\d{8})_(\d{2})\d{4}_\d{3}_[0-9a-f]{4}_\d{3}\.[a-z0-9]{3}$")
+# IDs without the format (20260120_201256_123_1a2b_000042) and results
+# saved before IDs existed (defect_result_20260120_201256.png)
+_UNTYPED_PATTERN = re.compile(r"^(\d{8})_(\d{2})\d{4}_\d{3}_[0-9a-f]{4}_\d{6}$")
+_LEGACY_PATTERN = re.compile(r"^\d{8}_\d{6}$")
+_EXTENSION_PATTERN = re.compile(r"^[a-z0-9]{3}$")
+
+_counter = itertools.count()
+_counter_lock = threading.Lock()
+
+
+def new_result_id(extension="png", now=None):
+    """
+    Create a unique, time-sortable result ID for a result saved as extension
+
+    The millisecond timestamp keeps IDs sortable, and the process id plus a
+    per-process sequence number keeps them unique even when many results
+    (up to 1000 per millisecond) are produced at once or by several worker
+    processes. The ID ends in the file format, so result_path() finds JPG
+    and BMP results too; at 32 characters it fits DefectLog's result_id
+    column.
+    """
+    if not _EXTENSION_PATTERN.match(extension):
+        raise ValueError(f"Extension must be 3 lowercase characters: {extension!r}")
+    now = now or datetime.now()
+    with _counter_lock:
+        sequence = next(_counter) % 1000
+    return (f"{now:%Y%m%d_%H%M%S}_{now.microsecond // 1000:03d}_"
+            f"{os.getpid() & 0xffff:04x}_{sequence:03d}.{extension}")
+
+
+def result_path(result_id, output_dir=OUTPUT_DIR, extension="png"):
+    """
+    Map a result ID to its file path without touching the filesystem
+
+    New results are sharded per day and hour:
+        output/20260120/20/defect_result_<id>
+    IDs without the format use extension in the same layout, and legacy
+    timestamp-only IDs map to the old flat layout:
+        output/defect_result_20260120_201256.png
+    """
+    match = _ID_PATTERN.match(result_id)
+    if match:
+        day, hour = match.groups()
+        return os.path.join(output_dir, day, hour, f"defect_result_{result_id}")
+    match = _UNTYPED_PATTERN.match(result_id)
+    if match:
+        day, hour = match.groups()
+        return os.path.join(output_dir, day, hour, f"defect_result_{result_id}.{extension}")
+    if _LEGACY_PATTERN.match(result_id):
+        return os.path.join(output_dir, f"defect_result_{result_id}.{extension}")
+    raise ValueError(f"Not a valid result ID: {result_id}")
+
+
+def result_id_from_path(path):
+    """Recover the result ID from a result image path"""
+    name = os.path.basename(path)
+    if not name.startswith("defect_result_"):
+        raise ValueError(f"Not a result image path: {path}")
+    result_id = name[len("defect_result_"):]
+    if _ID_PATTERN.match(result_id):
+        return result_id
+    return os.path.splitext(result_id)[0]
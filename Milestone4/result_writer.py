@@ -0,0 +1,273 @@
+"""
+MILESTONE 4: Background Result Writer
+Takes result images and CSV log rows off the detection request path
+"""
+
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from analytics import record_rows, stats_path_for
+from defect_log import DefectLog
+
+LOG_HEADER = ["Timestamp", "Status", "Defect_Count", "Details", "Result_ID"]
+
+# Logs whose header was already checked by this process
+_checked_logs = set()
+
+
+def migrate_log_header(log_path):
+    """
+    Rewrite a log written with an older header (e.g. without Result_ID)
+    to LOG_HEADER, padding old rows with empty cells, so the file never
+    mixes row widths. Runs once per log and process.
+
+    Returns:
+        True if the log was rewritten
+    """
+    if log_path in _checked_logs:
+        return False
+    _checked_logs.add(log_path)
+    try:
+        with open(log_path, "r", newline="") as file:
+            header = next(csv.reader(file), None)
+    except OSError:
+        return False
+    if header is None or header == LOG_HEADER:
+        return False
+
+    tmp_path = log_path + ".tmp"
+    with open(log_path, "r", newline="") as source, open(tmp_path, "w", newline="") as target:
+        reader = csv.reader(source)
+        next(reader)
+        writer = csv.writer(target)
+        writer.writerow(LOG_HEADER)
+        for row in reader:
+            writer.writerow((row + [""] * len(LOG_HEADER))[:len(LOG_HEADER)])
+    os.replace(tmp_path, log_path)
+
+    # Byte offsets in the analytics index no longer match - rebuild it
+    try:
+        os.remove(stats_path_for(log_path))
+    except OSError:
+        pass
+    return True
+
+
+def append_log_rows(rows, log_path):
+    """
+    Append rows to a CSV log in a single open, writing the header if the
+    file is new (or migrating an old one), and fold the rows into the
+    analytics index
+    """
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    migrate_log_header(log_path)
+    file_exists = os.path.exists(log_path)
+    start_offset = os.path.getsize(log_path) if file_exists else 0
+
+    with open(log_path, "a", newline="") as file:
+        writer = csv.writer(file)
+        if not file_exists:
+            writer.writerow(LOG_HEADER)
+        writer.writerows(rows)
+        end_offset = file.tell()
+
+    record_rows(log_path, rows, start_offset, end_offset)
+
+
+class ResultWriter:
+    """
+    Bounded-queue background writer for result images, CSV log rows and
+    binary inspection log frames
+
+    detect_defect only enqueues work. A daemon thread drains the queue in
+    batches and flushes when either the batch is full or flush_interval
+    seconds have passed since the first queued item. If the queue is full
+    the write is dropped (never blocks the caller) and counted.
+    """
+
+    def __init__(self, max_queue=256, batch_size=32, flush_interval=0.5,
+                 metrics_hook=None):
+        """
+        Args:
+            max_queue: Maximum number of pending writes
+            batch_size: Flush once this many writes are collected
+            flush_interval: Flush at least this often (seconds)
+            metrics_hook: Optional callable(metrics_dict) called after
+                          every flush
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics_hook = metrics_hook
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            'images_written': 0,
+            'rows_written': 0,
+            'frames_written': 0,
+            'dropped': 0,
+            'errors': 0,
+            'batches': 0
+        }
+
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    # ============ PRODUCER SIDE ============
+    def _put(self, item):
+        if self._stop.is_set():
+            self._count('dropped')
+            return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+    def submit_image(self, path, image):
+        """Queue an image to be written with cv2.imwrite"""
+        return self._put(('image', path, image))
+
+    def submit_log_row(self, row, log_path):
+        """Queue one CSV row to be appended to log_path"""
+        return self._put(('row', log_path, row))
+
+    def submit_frame(self, log_dir, timestamp, defect_info, confidence):
+        """Queue one inspected frame for the columnar DefectLog in log_dir"""
+        return self._put(('frame', log_dir, (timestamp, defect_info, confidence)))
+
+    def flush(self, timeout=None):
+        """
+        Block until everything queued so far has been written
+
+        Returns False at once after close() - there is no thread left to
+        write anything (close() already drained the queue).
+        """
+        if self._stop.is_set():
+            return False
+        marker = threading.Event()
+        try:
+            self._queue.put(('flush', None, marker), timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Stop accepting work, drain the queue and stop the thread"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    # ============ CONSUMER SIDE ============
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def metrics(self):
+        """Return queue depth and write/drop counters"""
+        with self._lock:
+            metrics = dict(self._stats)
+        metrics['queue_depth'] = self._queue.qsize()
+        return metrics
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = None
+            # Collect until the batch is full or the time limit hits
+            while len(batch) < self.batch_size:
+                if deadline is None:
+                    wait = 0.1
+                else:
+                    wait = deadline - time.monotonic()
+                    if wait <= 0:
+                        break
+                try:
+                    item = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    if self._stop.is_set() or deadline is not None:
+                        break
+                    continue
+                batch.append(item)
+                if item[0] == 'flush':
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch:
+                self._write_batch(batch)
+            elif self._stop.is_set() and self._queue.empty():
+                return
+
+    def _write_batch(self, batch):
+        rows_by_log = {}
+        frames_by_log = {}
+        markers = []
+
+        for kind, target, payload in batch:
+            if kind == 'image':
+                try:
+                    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+                    if cv2.imwrite(target, payload):
+                        self._count('images_written')
+                    else:
+                        self._count('errors')
+                except Exception as e:
+                    print(f"Error writing result image: {str(e)}")
+                    self._count('errors')
+            elif kind == 'row':
+                rows_by_log.setdefault(target, []).append(payload)
+            elif kind == 'frame':
+                frames_by_log.setdefault(target, []).append(payload)
+            else:
+                markers.append(payload)
+
+        # One open/append/close per log file for the whole batch
+        for log_path, rows in rows_by_log.items():
+            try:
+                append_log_rows(rows, log_path)
+                self._count('rows_written', len(rows))
+            except Exception as e:
+                print(f"Error saving log: {str(e)}")
+                self._count('errors')
+
+        for log_dir, frames in frames_by_log.items():
+            try:
+                DefectLog(log_dir).append_frames(frames)
+                self._count('frames_written', len(frames))
+            except Exception as e:
+                print(f"Error saving inspection log: {str(e)}")
+                self._count('errors')
+
+        self._count('batches')
+        for marker in markers:
+            marker.set()
+
+        if self.metrics_hook is not None:
+            try:
+                self.metrics_hook(self.metrics())
+            except Exception as e:
+                print(f"Error in writer metrics hook: {str(e)}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return the process-wide ResultWriter, starting it on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ResultWriter()
+            atexit.register(_writer.close)
+        return _writer
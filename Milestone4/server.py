@@ -0,0 +1,403 @@
+"""
+MILESTONE 4: Headless Inference Server
+HTTP endpoint for PCB defect detection - no Streamlit, many concurrent clients
+
+Endpoints:
+    POST /detect   body = encoded image (PNG/JPG/BMP) -> JSON defects
+    GET  /stats    request counts, batch sizes and latency percentiles
+    GET  /health   liveness check
+
+Requests are queued and grouped into batches (up to max_batch images, or
+whatever arrived within max_wait_ms of the first one). Each batch runs
+through DetectionEngine.detect_batch in a pre-warmed worker process, and
+the results are logged from this process, so only one process writes
+the inspection log.
+
+SIGTERM and Ctrl+C stop accepting connections, finish the batches in
+flight and flush the result writer before exiting.
+
+Usage:
+    python server.py --port 8008 --workers 4 --max-batch 8 --max-wait-ms 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from backend import CONFIDENCE_KERNELS, PROCESS_SIZE, DetectionEngine, _save_result, flush_results
+from template_registry import TEMPLATE_DIR, TEMPLATE_REGISTRY
+
+# Largest accepted request body
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Latencies kept for the percentiles in /stats (most recent requests)
+LATENCY_WINDOW = 10000
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 413: "Payload Too Large",
+                500: "Internal Server Error"}
+
+# Result of a request whose batch never ran (worker crashed or pool broken) -
+# a server fault (500), unlike an error string for an undecodable body (400)
+WorkerFailure = namedtuple("WorkerFailure", ["message"])
+
+
+# ============ WORKER PROCESS ============
+# Each worker builds its engine once and runs one dummy frame, so the
+# first real request does not pay for imports and OpenCV start-up
+_engine = None
+
+
+def _init_worker(engine_params, template_dir):
+    global _engine
+    TEMPLATE_REGISTRY.load_dir(template_dir)
+    _engine = DetectionEngine(**engine_params)
+    width, height = PROCESS_SIZE
+    _engine.detect_batch([np.zeros((height, width, 3), dtype=np.uint8)], render=False, log=False)
+
+
+def _worker_pid(_):
+    """Trivial task used to start every worker before serving"""
+    return os.getpid()
+
+
+def _detect_one(payload):
+    try:
+        _, defect_info, _, confidence = _engine.detect_batch([payload], render=False,
+                                                             log=False)[0]
+    except ValueError as e:
+        return str(e)
+    return defect_info, confidence
+
+
+def _detect_payloads(payloads):
+    """
+    Decode and detect one batch of encoded images
+
+    The bodies go to detect_batch as bytes and are decoded straight into
+    the batch array (see ingest.py).
+
+    Returns:
+        One (defect_info, confidence) tuple per payload, or an error
+        message string for payloads that are not decodable images
+    """
+    try:
+        detections = _engine.detect_batch(payloads, render=False, log=False)
+    except ValueError:
+        # Some payload is not an image - run them one by one so only it fails
+        return [_detect_one(payload) for payload in payloads]
+    return [(defect_info, confidence) for _, defect_info, _, confidence in detections]
+
+
+# ============ SERVER ============
+class InferenceServer:
+    """
+    asyncio HTTP front end with request batching over a process pool
+    """
+
+    def __init__(self, engine_params=None, workers=None, max_batch=8, max_wait_ms=10.0,
+                 template_dir=TEMPLATE_DIR):
+        """
+        Args:
+            engine_params: DetectionEngine keyword arguments (shared by all
+                           requests, so any requests can share a batch)
+            workers: Worker processes (None = os.cpu_count())
+            max_batch: Most images per batch
+            max_wait_ms: How long a batch waits for more requests after
+                         its first one arrived
+            template_dir: Reference templates every worker loads (for
+                          engine_params['reference'])
+        """
+        self.engine_params = dict(engine_params or {})
+        self.template_dir = template_dir
+        # Validate here rather than in every worker
+        TEMPLATE_REGISTRY.load_dir(template_dir)
+        DetectionEngine(**self.engine_params)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_images = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+
+        self._pool = None
+        self._queue = None
+        self._slots = None
+        self._batcher = None
+        self._server = None
+        # Running _run_batch tasks - the event loop only keeps weak references
+        self._batch_tasks = set()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.engine_params, self.template_dir))
+
+    async def start(self, host="127.0.0.1", port=8008):
+        """Start and warm the worker pool, then accept connections"""
+        loop = asyncio.get_running_loop()
+        self._pool = self._new_pool()
+        pids = await asyncio.gather(*(loop.run_in_executor(self._pool, _worker_pid, i)
+                                      for i in range(self.workers)))
+
+        self._queue = asyncio.Queue()
+        # At most one batch per worker in flight; the rest keep queueing
+        # (and so form larger batches) instead of piling up in the pool
+        self._slots = asyncio.Semaphore(self.workers)
+        self._batcher = asyncio.create_task(self._collect_batches())
+        self._server = await asyncio.start_server(self._handle, host, port)
+        print(f"✔️ Inference server on http://{host}:{port} "
+              f"({len(set(pids))} warm workers, max batch {self.max_batch}, "
+              f"max wait {self.max_wait * 1000:.0f} ms)")
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self, timeout=30.0):
+        """
+        Stop accepting connections, let the batches in flight finish and
+        get logged, then stop the workers and flush the result writer
+        """
+        if self._server is not None:
+            self._server.close()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self._batch_tasks:
+            await asyncio.wait(self._batch_tasks, timeout=timeout)
+        if self._server is not None:
+            try:
+                await asyncio.wait_for(self._server.wait_closed(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+        flush_results(timeout)
+
+    # ============ BATCHING ============
+    async def _collect_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Whatever is still queued joins the batch while we wait for a worker
+            await self._slots.acquire()
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            results = await loop.run_in_executor(pool, _detect_payloads,
+                                                 [payload for payload, _ in batch])
+        except BrokenProcessPool as e:
+            # A worker died - replace the pool so later batches can run
+            results = [WorkerFailure(f"Worker failed: {str(e)}")] * len(batch)
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+        except Exception as e:
+            results = [WorkerFailure(f"Worker failed: {str(e)}")] * len(batch)
+        finally:
+            self._slots.release()
+
+        self.batches += 1
+        self.batched_images += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result((result, len(batch)))
+
+    # ============ REQUESTS ============
+    async def _detect(self, body):
+        arrival = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((body, future))
+        result, batch_size = await future
+
+        self.requests += 1
+        if isinstance(result, WorkerFailure):
+            self.errors += 1
+            return 500, {'error': result.message}
+        if isinstance(result, str):
+            self.errors += 1
+            return 400, {'error': result}
+
+        defect_info, confidence = result
+        # Logged here - the only process that writes the inspection log
+        _save_result(None, defect_info, confidence)
+        latency = time.perf_counter() - arrival
+        self.latencies.append(latency)
+        return 200, {
+            'result_id': defect_info['result_id'],
+            'status': defect_info['status'],
+            'count': defect_info['count'],
+            'confidence': defect_info['confidence'],
+            'confidence_score': round(float(confidence), 2),
+            'defects': defect_info['defects'].to_dicts(),
+            'batch_size': batch_size,
+            'latency_ms': round(latency * 1000, 3)
+        }
+
+    def stats(self):
+        """Counters and latency percentiles (ms) over the recent window"""
+        latencies = np.array(self.latencies) * 1000
+        percentiles = {}
+        if len(latencies):
+            p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99]).tolist()
+            percentiles = {'p50': p50, 'p90': p90, 'p95': p95, 'p99': p99,
+                           'max': float(latencies.max()), 'mean': float(latencies.mean())}
+        return {
+            'uptime_s': time.time() - self.started,
+            'requests': self.requests,
+            'errors': self.errors,
+            'batches': self.batches,
+            'mean_batch_size': self.batched_images / self.batches if self.batches else 0.0,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'workers': self.workers,
+            'latency_ms': percentiles,
+            'latency_window': len(latencies)
+        }
+
+    async def _route(self, method, path, body):
+        if path == "/detect":
+            if method != "POST":
+                return 405, {'error': "Use POST with the image bytes as body"}
+            if not body:
+                return 400, {'error': "Empty request body"}
+            return await self._detect(body)
+        if path == "/stats" and method == "GET":
+            return 200, self.stats()
+        if path == "/health" and method == "GET":
+            return 200, {'status': 'ok'}
+        return 404, {'error': f"No route for {method} {path}"}
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+
+    async def _handle(self, reader, writer):
+        """One client connection (HTTP/1.1 keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    self._write_response(writer, 400, {'error': "Malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0) or 0)
+                if length > MAX_BODY_BYTES:
+                    self._write_response(writer, 413, {'error': f"Body over {MAX_BODY_BYTES} bytes"},
+                                         False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = await self._route(method, urlsplit(target).path, body)
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+
+                keep_alive = (version == "HTTP/1.1" and
+                              headers.get('connection', '').lower() != "close")
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host="127.0.0.1", port=8008, **options):
+    """Run an InferenceServer until SIGTERM or Ctrl+C, then shut it down cleanly"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:
+            # Windows event loops have no signal handlers
+            signal.signal(signum, lambda *_: loop.call_soon_threadsafe(stop.set))
+
+    server = InferenceServer(**options)
+    await server.start(host, port)
+    serving = asyncio.create_task(server.serve_forever())
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+        serving.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless PCB defect detection server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--min-area", type=float, default=50)
+    parser.add_argument("--threshold", type=int, default=127)
+    parser.add_argument("--confidence", default="Medium (Balanced)",
+                        choices=list(CONFIDENCE_KERNELS))
+    parser.add_argument("--templates", default=TEMPLATE_DIR,
+                        help="directory of golden templates, one image per board type")
+    parser.add_argument("--reference", default=None,
+                        help="board type to compare against (default: threshold mode)")
+    args = parser.parse_args()
+
+    engine_params = {'min_area': args.min_area, 'threshold_value': args.threshold,
+                     'confidence_level': args.confidence, 'reference': args.reference}
+    try:
+        asyncio.run(serve(args.host, args.port, engine_params=engine_params,
+                          workers=args.workers, max_batch=args.max_batch,
+                          max_wait_ms=args.max_wait_ms, template_dir=args.templates))
+    except KeyboardInterrupt:
+        pass
+    print("✅ Server stopped")
+
+
+if __name__ == "__main__":
+    main()
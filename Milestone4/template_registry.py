@@ -0,0 +1,115 @@
+"""
+MILESTONE 4: Reference Template Registry
+Golden board images per board type, preprocessed once and kept in memory
+"""
+
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+import cv2
+
+from ingest import ingest
+
+TEMPLATE_DIR = "templates"
+
+TEMPLATE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# gray: read-only processing-size grayscale; digest: content hash of gray
+# (part of the analysis cache key); source: where it was loaded from
+ReferenceTemplate = namedtuple("ReferenceTemplate", ["board_type", "gray", "digest", "source"])
+
+
+class TemplateRegistry:
+    """
+    Board type -> preprocessed golden template
+
+    A template is decoded, resized to the processing size and converted
+    to grayscale once, when it is registered. Every inspection against it
+    then only needs one absdiff with the in-memory array. Templates are
+    read-only because all engines and threads share them.
+    """
+
+    def __init__(self, size=(640, 480)):
+        """
+        Args:
+            size: (width, height) templates are stored at - the processing
+                  size the test images are resized to
+        """
+        self.size = tuple(size)
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def register(self, board_type, image):
+        """
+        Preprocess and store the golden template of one board type
+        (replacing an earlier one)
+
+        Args:
+            board_type: Name the template is looked up by
+            image: Image path, encoded bytes, RGB array or PIL image
+
+        Returns:
+            The ReferenceTemplate
+        """
+        source = "<memory>"
+        if isinstance(image, (str, os.PathLike)):
+            source = os.fspath(image)
+            with open(source, "rb") as file:
+                image = file.read()
+
+        gray = cv2.cvtColor(ingest(image, self.size), cv2.COLOR_BGR2GRAY)
+        gray.setflags(write=False)
+        digest = hashlib.blake2b(gray.data, digest_size=16).hexdigest()
+        template = ReferenceTemplate(board_type, gray, digest, source)
+        with self._lock:
+            self._templates[board_type] = template
+        return template
+
+    def load_dir(self, directory=TEMPLATE_DIR):
+        """
+        Register every image in directory, named by its file stem
+        (templates/board_a.png -> "board_a")
+
+        Returns:
+            Sorted list of the board types loaded (empty if directory is missing)
+        """
+        if not os.path.isdir(directory):
+            return []
+        loaded = []
+        for name in sorted(os.listdir(directory)):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() in TEMPLATE_EXTENSIONS:
+                self.register(stem, os.path.join(directory, name))
+                loaded.append(stem)
+        return loaded
+
+    def get(self, board_type):
+        """ReferenceTemplate of board_type (KeyError if not registered)"""
+        with self._lock:
+            template = self._templates.get(board_type)
+        if template is None:
+            raise KeyError(f"No reference template for board type {board_type!r} "
+                           f"(registered: {self.board_types()})")
+        return template
+
+    def remove(self, board_type):
+        with self._lock:
+            self._templates.pop(board_type, None)
+
+    def board_types(self):
+        with self._lock:
+            return sorted(self._templates)
+
+    def __contains__(self, board_type):
+        with self._lock:
+            return board_type in self._templates
+
+    def __len__(self):
+        with self._lock:
+            return len(self._templates)
+
+
+# Shared by all engines; fill it with register() / load_dir()
+TEMPLATE_REGISTRY = TemplateRegistry()
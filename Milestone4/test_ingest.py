@@ -0,0 +1,64 @@
+"""
+MILESTONE 4: Ingestion Allocation Tests
+A warm ingest call must not allocate a full frame (tracemalloc)
+"""
+
+import tracemalloc
+
+import cv2
+import numpy as np
+import pytest
+
+from backend import PROCESS_SIZE
+from ingest import BufferPool, ingest
+
+# Allowance for Python objects and OpenCV's small temporaries
+SLACK_BYTES = 64 * 1024
+
+INPUT_SIZE = (1280, 960)
+
+
+def peak_bytes(fn, *args):
+    """Peak traced allocation of one call, after a warm-up call"""
+    fn(*args)
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture
+def board():
+    width, height = INPUT_SIZE
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def out():
+    width, height = PROCESS_SIZE
+    return np.empty((height, width, 3), dtype=np.uint8)
+
+
+def test_array_ingest_allocates_no_frame(board, out):
+    # Resize and conversion go to the pooled scratch frame and out
+    pool = BufferPool()
+    frame_bytes = out.nbytes
+    peak = peak_bytes(ingest, board, PROCESS_SIZE, out, pool)
+    assert peak < frame_bytes, f"peak {peak} bytes, one frame is {frame_bytes}"
+    assert peak <= SLACK_BYTES
+
+
+def test_bytes_ingest_allocates_only_the_decode(board, out):
+    # The decoded input frame is the only full-size allocation
+    encoded = cv2.imencode(".png", board)[1].tobytes()
+    pool = BufferPool()
+    peak = peak_bytes(ingest, encoded, PROCESS_SIZE, out, pool)
+    assert peak <= board.nbytes + SLACK_BYTES
+
+
+def test_ingest_matches_convert_then_resize(board, out):
+    expected = cv2.resize(cv2.cvtColor(board, cv2.COLOR_RGB2BGR), PROCESS_SIZE)
+    assert np.array_equal(ingest(board, PROCESS_SIZE, out, BufferPool()), expected)
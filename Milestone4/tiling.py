@@ -0,0 +1,175 @@
+"""
+MILESTONE 4: Tile Geometry for High-Resolution Inspection
+Overlapping tile layout and seam bookkeeping for DetectionEngine.detect_tiled
+"""
+
+import cv2
+import numpy as np
+
+
+def tile_windows(height, width, tile_size=1024, overlap=64):
+    """
+    Split an image into a grid of tiles
+
+    Each tile has a core of tile_size x tile_size pixels (smaller at the
+    right and bottom edges). The cores do not overlap and cover the
+    image exactly once. The window that is actually processed is the
+    core grown by overlap pixels on every side, clipped to the image.
+
+    Returns:
+        List of (window, core) tuples, each an (x0, y0, x1, y1) rectangle
+        in image coordinates (x1, y1 exclusive)
+    """
+    if tile_size <= 0:
+        raise ValueError(f"tile_size must be positive, got {tile_size!r}")
+    if overlap < 0:
+        raise ValueError(f"overlap must be non-negative, got {overlap!r}")
+
+    tiles = []
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            y1 = min(y0 + tile_size, height)
+            window = (max(x0 - overlap, 0), max(y0 - overlap, 0),
+                      min(x1 + overlap, width), min(y1 + overlap, height))
+            tiles.append((window, (x0, y0, x1, y1)))
+    return tiles
+
+
+def touches_inner_edge(bboxes, window, image_size, margin=0):
+    """
+    True for boxes within margin pixels of a window edge that is not the
+    image border
+
+    Such a defect may continue into the neighbouring tile, or be shaped
+    by the missing context (morphology near a window edge differs from
+    the full image), so this window did not see it reliably.
+
+    Args:
+        bboxes: (N, 4) x, y, width, height in image coordinates
+        window: (x0, y0, x1, y1) of the tile window
+        image_size: (width, height) of the full image
+        margin: Distance from the edge that still counts as touching
+    """
+    bboxes = np.asarray(bboxes).reshape(-1, 4)
+    x0, y0, x1, y1 = window
+    width, height = image_size
+    x, y, w, h = bboxes.T
+    return (((x <= x0 + margin) & (x0 > 0)) |
+            ((y <= y0 + margin) & (y0 > 0)) |
+            ((x + w >= x1 - margin) & (x1 < width)) |
+            ((y + h >= y1 - margin) & (y1 < height)))
+
+
+def complete_in_any(bboxes, windows, image_size, margin=0):
+    """
+    True for boxes that lie inside at least one of windows, clear of its
+    inner edges - i.e. a tile with that window saw the whole defect
+
+    The first such tile (in tile order) reports the defect; later tiles
+    and the seam merge drop it, so overlapping windows never count a
+    defect twice.
+    """
+    bboxes = np.asarray(bboxes).reshape(-1, 4)
+    complete = np.zeros(len(bboxes), dtype=bool)
+    for window in windows:
+        x0, y0, x1, y1 = window
+        inside = ((bboxes[:, 0] >= x0) & (bboxes[:, 1] >= y0) &
+                  (bboxes[:, 0] + bboxes[:, 2] <= x1) & (bboxes[:, 1] + bboxes[:, 3] <= y1))
+        complete |= inside & ~touches_inner_edge(bboxes, window, image_size, margin)
+    return complete
+
+
+def group_boxes(bboxes):
+    """
+    Group boxes that overlap or touch (union-find over all pairs)
+
+    Used for seam pieces: the parts of one large defect seen by different
+    tiles always overlap, because neighbouring windows overlap.
+
+    Returns:
+        List of index arrays, one per group
+    """
+    bboxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+    count = len(bboxes)
+    if count == 0:
+        return []
+
+    x0, y0 = bboxes[:, 0], bboxes[:, 1]
+    x1, y1 = x0 + bboxes[:, 2], y0 + bboxes[:, 3]
+    # Pairwise overlap test in one shot (seam pieces are few)
+    touching = ((x0[:, None] <= x1[None, :]) & (x0[None, :] <= x1[:, None]) &
+                (y0[:, None] <= y1[None, :]) & (y0[None, :] <= y1[:, None]))
+
+    parent = np.arange(count)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(touching, 1))):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_j] = root_i
+
+    roots = np.array([find(i) for i in range(count)])
+    return [np.flatnonzero(roots == root) for root in np.unique(roots)]
+
+
+def covers_any(bboxes, pieces, tolerance=0):
+    """
+    True for boxes that contain at least one of the piece boxes
+    (each side may fall short by up to tolerance pixels)
+
+    A re-measured seam defect spans the pieces the tiles saw of it;
+    small defects that merely sit inside the merge window do not.
+    """
+    bboxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+    pieces = np.asarray(pieces, dtype=np.int64).reshape(-1, 4)
+    x0, y0 = bboxes[:, 0, None], bboxes[:, 1, None]
+    x1, y1 = x0 + bboxes[:, 2, None], y0 + bboxes[:, 3, None]
+    px0, py0 = pieces[None, :, 0], pieces[None, :, 1]
+    px1, py1 = px0 + pieces[None, :, 2], py0 + pieces[None, :, 3]
+    contains = ((x0 <= px0 + tolerance) & (y0 <= py0 + tolerance) &
+                (x1 >= px1 - tolerance) & (y1 >= py1 - tolerance))
+    return contains.any(axis=1)
+
+
+def union_box(bboxes):
+    """(x0, y0, x1, y1) rectangle around all (N, 4) x, y, w, h boxes"""
+    bboxes = np.asarray(bboxes).reshape(-1, 4)
+    return (int(bboxes[:, 0].min()), int(bboxes[:, 1].min()),
+            int((bboxes[:, 0] + bboxes[:, 2]).max()), int((bboxes[:, 1] + bboxes[:, 3]).max()))
+
+
+def enclosed(bboxes, contours, slack=None):
+    """
+    True for defects that lie inside another defect's outer contour
+
+    A blob sitting in the hole of a large defect is not an external
+    contour of the full image, but a tile that cuts the large defect open
+    sees it as one. Only pairs whose boxes nest are tested, with one
+    cv2.pointPolygonTest each.
+
+    Args:
+        bboxes: (N, 4) x, y, width, height in image coordinates
+        contours: N contours in image coordinates
+        slack: Optional per-contour distance (pixels) a point must be
+               inside an approximate (reduced-scale) outer contour
+    """
+    bboxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+    x0, y0 = bboxes[:, 0], bboxes[:, 1]
+    x1, y1 = x0 + bboxes[:, 2], y0 + bboxes[:, 3]
+    inside = np.zeros(len(bboxes), dtype=bool)
+    for outer in range(len(bboxes)):
+        candidates = np.flatnonzero((x0 > x0[outer]) & (y0 > y0[outer]) &
+                                    (x1 < x1[outer]) & (y1 < y1[outer]) & ~inside)
+        for inner in candidates.tolist():
+            point = tuple(float(v) for v in contours[inner][0, 0])
+            if slack is None or slack[outer] == 0:
+                inside[inner] = cv2.pointPolygonTest(contours[outer], point, False) > 0
+            else:
+                inside[inner] = cv2.pointPolygonTest(contours[outer], point, True) > slack[outer]
+    return inside
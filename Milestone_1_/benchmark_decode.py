@@ -0,0 +1,131 @@
+"""
+MILESTONE 1: Reduced-Resolution JPEG Decode Benchmark
+Compares full decode + resize with reduced-scale decode + resize
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import image_source
+from image_source import open_image_source
+from milestone1_pcb_defect_detection import PCBDefectDetector
+from template_cache import TEMPLATE_CACHE
+
+
+def make_jpeg_boards(workdir, count, size=(4000, 3000), seed=0):
+    """
+    Write one synthetic high-resolution template and count defective test
+    boards as JPEGs (pads, traces and sensor noise, like a camera capture)
+
+    Returns:
+        (template_path, [test_paths])
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    board = np.full((height, width, 3), (20, 90, 30), dtype=np.uint8)
+    for _ in range(400):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        r = int(rng.integers(10, 50))
+        cv2.circle(board, (int(x), int(y)), r, (200, 170, 60), -1)
+    for _ in range(200):
+        p1 = tuple(int(v) for v in rng.integers(0, (width, height)))
+        p2 = tuple(int(v) for v in rng.integers(0, (width, height)))
+        cv2.line(board, p1, p2, (210, 180, 70), 8)
+
+    def save(image, name):
+        noise = rng.normal(0, 4, image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+        path = os.path.join(workdir, name)
+        cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        return path
+
+    template_path = save(board, "template.jpg")
+    test_paths = []
+    for i in range(count):
+        test = board.copy()
+        # A few missing-copper / short defects per board
+        for _ in range(5):
+            x, y = rng.integers(0, width - 200), rng.integers(0, height - 200)
+            w, h = rng.integers(40, 200, size=2)
+            cv2.rectangle(test, (int(x), int(y)), (int(x + w), int(y + h)), (0, 0, 0), -1)
+        test_paths.append(save(test, f"test_{i:03d}.jpg"))
+    return template_path, test_paths
+
+
+def time_decode(paths, target_size, reduced, repeats):
+    """Best-of-repeats seconds to load and resize every path once"""
+    image_source.REDUCED_DECODE = reduced
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        images = [open_image_source(path).read_resized(target_size) for path in paths]
+        best = min(best, time.perf_counter() - start)
+    return best, images
+
+
+def time_pipeline(template_path, test_paths, target_size, reduced, output_dir):
+    """Seconds to run the full Milestone 1 pipeline over every pair"""
+    image_source.REDUCED_DECODE = reduced
+    TEMPLATE_CACHE.clear()
+    masks = []
+    start = time.perf_counter()
+    # The pipeline reports every step - keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for test_path in test_paths:
+            detector = PCBDefectDetector(template_path, test_path, output_dir)
+            detector.run_pipeline(target_size)
+            masks.append(detector.clean)
+    return time.perf_counter() - start, masks
+
+
+def run_benchmark(count=8, size=(4000, 3000), target_size=(640, 480), repeats=3):
+    """
+    Time JPEG loading both ways, then the end-to-end pipeline, and print
+    speed and how far the reduced-decode results drift from full decode
+    """
+    print("\n" + "="*60)
+    print("REDUCED-RESOLUTION JPEG DECODE BENCHMARK")
+    print("="*60)
+    print(f"Boards: {count} x {size[0]}x{size[1]} JPEG -> {target_size[0]}x{target_size[1]}")
+    print(f"Reduction factor: 1/{image_source.reduction_factor(size, target_size)}")
+
+    enabled = image_source.REDUCED_DECODE
+    with tempfile.TemporaryDirectory() as workdir:
+        template_path, test_paths = make_jpeg_boards(workdir, count, size)
+        paths = [template_path] + test_paths
+        try:
+            full_time, full_images = time_decode(paths, target_size, False, repeats)
+            fast_time, fast_images = time_decode(paths, target_size, True, repeats)
+
+            output_dir = os.path.join(workdir, "output")
+            full_run, full_masks = time_pipeline(template_path, test_paths, target_size,
+                                                 False, output_dir)
+            fast_run, fast_masks = time_pipeline(template_path, test_paths, target_size,
+                                                 True, output_dir)
+        finally:
+            image_source.REDUCED_DECODE = enabled
+            TEMPLATE_CACHE.clear()
+
+    pixel_diff = [np.abs(a.astype(np.int16) - b).mean() for a, b in zip(full_images, fast_images)]
+    mask_diff = [np.count_nonzero(a != b) / a.size for a, b in zip(full_masks, fast_masks)]
+
+    per_image = 1000 / len(paths)
+    print(f"✔️ Full decode + resize:    {full_time * per_image:.1f} ms/image")
+    print(f"✔️ Reduced decode + resize: {fast_time * per_image:.1f} ms/image")
+    print(f"✔️ Decode speedup: {full_time / fast_time:.2f}x")
+    print(f"✔️ Mean abs pixel difference: {np.mean(pixel_diff):.2f} (max {np.max(pixel_diff):.2f})")
+    print(f"✔️ Pipeline, full decode:    {count / full_run:.1f} pairs/s")
+    print(f"✔️ Pipeline, reduced decode: {count / fast_run:.1f} pairs/s")
+    print(f"✔️ Pipeline speedup: {full_run / fast_run:.2f}x")
+    print(f"✔️ Defect mask pixels that differ: {100 * np.mean(mask_diff):.3f}%")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,143 @@
+"""
+MILESTONE 1: Registration Benchmark
+Alignment latency versus accuracy on synthetically shifted boards from create_test_images
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from create_test_images import create_test_images
+from registration import TemplateRegistration
+
+
+def make_shifted_boards(count, max_shift=30.0, seed=0):
+    """
+    Template and test image from create_test_images, plus count copies of
+    the test image moved by random sub-pixel shifts (fixture play) with
+    fresh sensor noise
+
+    The checkerboard repeats every 80 px, so shifts stay below half of
+    that - beyond it no method can tell the true shift from a period.
+
+    Returns:
+        (template_gray, test_gray, shifted grays, true (dx, dy) shifts)
+    """
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_test_images(workdir)
+        template = cv2.imread(os.path.join(workdir, "template", "template.png"), cv2.IMREAD_GRAYSCALE)
+        test = cv2.imread(os.path.join(workdir, "test", "test.png"), cv2.IMREAD_GRAYSCALE)
+
+    rng = np.random.default_rng(seed)
+    height, width = test.shape
+    shifts = rng.uniform(-max_shift, max_shift, (count, 2))
+    boards = []
+    for dx, dy in shifts:
+        matrix = np.float32([[1, 0, dx], [0, 1, dy]])
+        moved = cv2.warpAffine(test, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+        noise = rng.normal(0, 5, moved.shape)
+        boards.append(np.clip(moved + noise, 0, 255).astype(np.uint8))
+    return template, test, boards, shifts
+
+
+def detect_regions(registration, template, test, shift, truth):
+    """
+    Milestone 1 chain (absdiff → Otsu → opening) after moving test by shift
+
+    Returns:
+        (regions, false_pixels) - connected defect regions, and defect
+        pixels outside the true defect area
+    """
+    aligned, (x0, y0, x1, y1) = registration.align(test, *shift)
+    diff = cv2.absdiff(template, aligned)
+    valid = np.zeros_like(diff)
+    valid[y0:y1, x0:x1] = 1
+    diff *= valid
+    _, thresh = cv2.threshold(diff, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    clean = cv2.morphologyEx(thresh, cv2.MORPH_OPEN,
+                             cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+    regions = cv2.connectedComponents(clean)[0] - 1
+    return regions, int(np.count_nonzero(clean & ~truth))
+
+
+def run_benchmark(count=50, max_shift=30.0, repeats=3):
+    """
+    Estimate the shift of every board with each method, then run the
+    detection chain on the registered boards
+    """
+    template, test, boards, shifts = make_shifted_boards(count, max_shift)
+    height, width = template.shape
+
+    # True defect area in template coordinates (a little dilated)
+    truth = np.where(cv2.absdiff(template, test) > 40, 255, 0).astype(np.uint8)
+    truth = cv2.dilate(truth, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (9, 9)))
+
+    start = time.perf_counter()
+    registration = TemplateRegistration(template)
+    precompute = time.perf_counter() - start
+
+    window = cv2.createHanningWindow((width, height), cv2.CV_64F)
+
+    def full_frame(board):
+        # cv2.phaseCorrelate transforms the template again on every call
+        # (and windows float64 inputs in place, so it gets a fresh copy)
+        (dx, dy), _ = cv2.phaseCorrelate(template.astype(np.float64),
+                                         board.astype(np.float64), window)
+        return dx, dy
+
+    def ecc_refined(board):
+        # Coarse phase correlation, then ECC (iterative) at processing resolution
+        dx, dy, _ = registration.estimate_coarse(board)
+        warp = np.float32([[1, 0, dx], [0, 1, dy]])
+        criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4)
+        try:
+            _, warp = cv2.findTransformECC(template, board, warp, cv2.MOTION_TRANSLATION,
+                                           criteria, None, 5)
+        except cv2.error:
+            pass
+        return float(warp[0, 2]), float(warp[1, 2])
+
+    methods = [
+        ("None (resize only)", lambda board: (0.0, 0.0)),
+        ("Full-frame phaseCorrelate", full_frame),
+        ("Coarse only (cached FFT)", lambda board: registration.estimate_coarse(board)[:2]),
+        ("Coarse + ECC refine", ecc_refined),
+        ("Coarse + patch refine", lambda board: registration.estimate(board)[:2]),
+    ]
+
+    print("\n" + "="*60)
+    print("REGISTRATION BENCHMARK")
+    print("="*60)
+    print(f"Boards: {count} x {width}x{height}, shifts up to ±{max_shift:.0f} px (sub-pixel)")
+    print(f"Template precompute (FFTs, once per template): {precompute * 1000:.2f} ms")
+    print(f"{'Method':28s} {'ms/board':>8s} {'mean err':>9s} {'max err':>8s} "
+          f"{'regions':>8s} {'false px':>9s}")
+
+    for name, estimate in methods:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            estimates = [estimate(board) for board in boards]
+            best = min(best, time.perf_counter() - start)
+
+        errors = np.hypot(*(np.array(estimates) - shifts).T)
+        outcomes = [detect_regions(registration, template, board, shift, truth)
+                    for board, shift in zip(boards, estimates)]
+        regions, false_pixels = np.mean(outcomes, axis=0)
+        print(f"{name:28s} {best / count * 1000:8.2f} {errors.mean():9.3f} {errors.max():8.3f} "
+              f"{regions:8.1f} {false_pixels:9.0f}")
+
+    print("✔️ regions = defect regions left after Otsu + opening (the board has 1 real defect)")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -5,8 +5,13 @@ Automatic processing of DeepPCB dataset structure
 
 import cv2
 import os
+import time
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from dataset_manifest import load_manifest
+from image_source import open_image_source
+from template_cache import TEMPLATE_CACHE
 
 class PCBDatasetHandler:
     """
@@ -15,13 +20,21 @@ class PCBDatasetHandler:
     """
     
     @staticmethod
-    def find_dataset_pairs(dataset_dir="C:\\Users\\Vishwa Adhesh\\Downloads\\PCB_DATASET"):
+    def find_dataset_pairs(dataset_dir="C:\\Users\\Vishwa Adhesh\\Downloads\\PCB_DATASET",
+                           manifest_path=None):
         """
         Scan the DeepPCB dataset and find template/test pairs
         
         DeepPCB structure:
         - PCB_USED/ contains template PCBs (perfect)
         - images/ contains defect types with test images
+        
+        The listing comes from the dataset manifest (dataset_manifest.py),
+        which only re-lists folders whose mtime changed since the last run.
+        
+        Args:
+            dataset_dir: Root of the DeepPCB dataset
+            manifest_path: Manifest location (default: inside dataset_dir)
         """
         
         print("\n" + "="*60)
@@ -30,49 +43,43 @@ class PCBDatasetHandler:
         
         pairs = []
         
-        # Path to templates
-        pcb_used_dir = os.path.join(dataset_dir, "PCB_USED")
-        images_dir = os.path.join(dataset_dir, "images")
-        
-        if not os.path.exists(images_dir):
+        manifest = load_manifest(dataset_dir, manifest_path)
+        if manifest is None:
             print(f"❌ Dataset not found at {dataset_dir}")
             return []
         
-        # Get list of templates
-        templates = sorted([f for f in os.listdir(pcb_used_dir) 
-                           if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
-        
-        print(f"✔️ Found {len(templates)} template PCBs")
-        
-        # Scan defect types
-        defect_types = [d for d in os.listdir(images_dir) 
-                       if os.path.isdir(os.path.join(images_dir, d))]
-        
-        print(f"✔️ Found {len(defect_types)} defect types")
-        
-        # For each defect type, create pairs
-        pair_count = 0
-        for defect_type in defect_types:
-            defect_dir = os.path.join(images_dir, defect_type)
-            test_images = sorted([f for f in os.listdir(defect_dir) 
-                                 if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
+        with manifest:
+            print(f"✔️ Manifest: {manifest.manifest_path} "
+                  f"({manifest.rescanned_dirs} folders re-listed, {manifest.hashed_files} files hashed)")
+            
+            # Get list of templates
+            templates = manifest.templates()
+            print(f"✔️ Found {len(templates)} template PCBs")
             
-            print(f"   - {defect_type}: {len(test_images)} images")
+            defect_types = manifest.defect_types()
+            print(f"✔️ Found {len(defect_types)} defect types")
             
-            # Pair templates with test images
-            for i, test_img in enumerate(test_images):
-                template_idx = i % len(templates)  # Cycle through templates
-                template = templates[template_idx]
+            # For each defect type, create pairs
+            pair_count = 0
+            for defect_type in defect_types:
+                test_images = manifest.images(defect_type)
+                
+                print(f"   - {defect_type}: {len(test_images)} images")
                 
-                pair = {
-                    'template': os.path.join(pcb_used_dir, template),
-                    'test': os.path.join(defect_dir, test_img),
-                    'defect_type': defect_type,
-                    'template_name': template,
-                    'test_name': test_img
-                }
-                pairs.append(pair)
-                pair_count += 1
+                # Pair templates with test images
+                for i, test_img in enumerate(test_images):
+                    template_idx = i % len(templates)  # Cycle through templates
+                    template = templates[template_idx]
+                    
+                    pair = {
+                        'template': template['path'],
+                        'test': test_img['path'],
+                        'defect_type': defect_type,
+                        'template_name': template['name'],
+                        'test_name': test_img['name']
+                    }
+                    pairs.append(pair)
+                    pair_count += 1
         
         print(f"✔️ Total pairs created: {pair_count}")
         return pairs
@@ -81,18 +88,24 @@ class PCBDatasetHandler:
 class PCBDefectDetector:
     """PCB Defect Detection Pipeline"""
     
-    def __init__(self, template_path, test_path, output_dir="output", pair_info=None):
+    def __init__(self, template_path, test_path, output_dir="output", pair_info=None,
+                 template_cache=None, register=True):
         self.template_path = template_path
         self.test_path = test_path
         self.output_dir = output_dir
         self.pair_info = pair_info or {}
+        self.template_cache = template_cache or TEMPLATE_CACHE
+        self.register = register
         
         os.makedirs(output_dir, exist_ok=True)
         
         self.template = None
         self.test = None
+        self.test_source = None
         self.template_gray = None
         self.test_gray = None
+        self.shift = None
+        self.valid_region = None
         self.diff = None
         self.thresh = None
         self.clean = None
@@ -100,18 +113,27 @@ class PCBDefectDetector:
     def load_and_align(self, target_size=(640, 480)):
         """STEP 2: Load and align images"""
         try:
-            self.template = cv2.imread(self.template_path)
-            self.test = cv2.imread(self.test_path)
+            # Templates are shared across many pairs - decode each only once
+            cached = self.template_cache.get(self.template_path, target_size)
+            # Uncompressed test images are memory-mapped, not decoded whole
+            self.test_source = open_image_source(self.test_path)
             
-            if self.template is None or self.test is None:
+            if cached is None or self.test_source is None:
                 return False
             
-            self.template = cv2.resize(self.template, target_size)
-            self.test = cv2.resize(self.test, target_size)
+            self.template, self.template_gray, _ = cached
+            self.test = self.test_source.read_resized(target_size)
             
-            self.template_gray = cv2.cvtColor(self.template, cv2.COLOR_BGR2GRAY)
             self.test_gray = cv2.cvtColor(self.test, cv2.COLOR_BGR2GRAY)
             
+            # Undo fixture shifts (template FFTs come from the cache too)
+            if self.register:
+                registration = self.template_cache.registration(self.template_path, target_size)
+                dx, dy, response = registration.estimate(self.test_gray)
+                self.shift = (dx, dy, response)
+                self.test, self.valid_region = registration.align(self.test, dx, dy)
+                self.test_gray = cv2.cvtColor(self.test, cv2.COLOR_BGR2GRAY)
+            
             return True
         except Exception as e:
             print(f"❌ Error loading images: {str(e)}")
@@ -121,6 +143,13 @@ class PCBDefectDetector:
         """STEP 3: Compute difference"""
         try:
             self.diff = cv2.absdiff(self.template_gray, self.test_gray)
+            # Edges uncovered by registration hold no test content
+            if self.valid_region is not None:
+                x0, y0, x1, y1 = self.valid_region
+                self.diff[:y0] = 0
+                self.diff[y1:] = 0
+                self.diff[:, :x0] = 0
+                self.diff[:, x1:] = 0
             return True
         except Exception as e:
             print(f"❌ Error computing difference: {str(e)}")
@@ -181,10 +210,129 @@ class PCBDefectDetector:
         return True
 
 
+def _process_pair(task):
+    """
+    Run the pipeline for one pair and save its results
+    
+    Top-level so it can be pickled into a worker process.
+    
+    Args:
+        task: (pair_index, pair, output_base_dir)
+    
+    Returns:
+        Dictionary with pair index, outcome, defect statistics,
+        worker id and processing time
+    """
+    i, pair, output_base_dir = task
+    start = time.perf_counter()
+    
+    # Create output dir for this pair
+    pair_output_dir = os.path.join(output_base_dir, f"pair_{i:03d}_{pair['defect_type']}")
+    
+    # Create detector and run pipeline
+    detector = PCBDefectDetector(
+        template_path=pair['template'],
+        test_path=pair['test'],
+        output_dir=pair_output_dir,
+        pair_info=pair
+    )
+    
+    result = {
+        'index': i,
+        'output_dir': pair_output_dir,
+        'success': False,
+        'defect_pixels': 0,
+        'total_pixels': 0,
+        'worker': os.getpid()
+    }
+    
+    if detector.run_pipeline():
+        detector.save_results(i)
+        result['success'] = True
+        result['defect_pixels'] = int(np.count_nonzero(detector.clean))
+        result['total_pixels'] = detector.clean.shape[0] * detector.clean.shape[1]
+        if detector.shift is not None:
+            result['shift'] = detector.shift[:2]
+    
+    result['elapsed'] = time.perf_counter() - start
+    result['template_cache'] = TEMPLATE_CACHE.stats()
+    return result
+
+
+def _print_pair_result(result):
+    """Print the outcome of one processed pair"""
+    i = result['index']
+    if result['success']:
+        defect_percentage = (result['defect_pixels'] / result['total_pixels']) * 100
+        print(f"✅ Pair {i+1} processed successfully")
+        print(f"   Results saved to: {result['output_dir']}")
+        print(f"   Defect area: {result['defect_pixels']} pixels ({defect_percentage:.2f}%)")
+        if 'shift' in result:
+            print(f"   Registration shift: ({result['shift'][0]:+.2f}, {result['shift'][1]:+.2f}) px")
+    else:
+        print(f"❌ Failed to process pair {i+1}")
+
+
+def _process_pairs_parallel(pairs, num_to_process, output_base_dir, workers, chunksize=None):
+    """
+    Spread pairs across a process pool
+    
+    Tasks are submitted in chunks and results come back in pair order,
+    so the output folders and printed report match the serial path.
+    """
+    if chunksize is None:
+        # A few chunks per worker keeps the pool busy without per-pair overhead
+        chunksize = max(1, num_to_process // (workers * 4))
+    
+    tasks = [(i, pairs[i], output_base_dir) for i in range(num_to_process)]
+    
+    print(f"\n✔️ Parallel mode: {workers} workers, chunk size {chunksize}")
+    
+    worker_stats = {}
+    results = []
+    start = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for done, result in enumerate(executor.map(_process_pair, tasks, chunksize=chunksize), 1):
+            stats = worker_stats.setdefault(result['worker'], {'pairs': 0, 'failed': 0, 'busy': 0.0})
+            stats['pairs'] += 1
+            stats['busy'] += result['elapsed']
+            # Counters are cumulative per process, so keep the latest snapshot
+            stats['cache'] = result['template_cache']
+            if not result['success']:
+                stats['failed'] += 1
+            
+            print(f"[worker {result['worker']}] pair {result['index']+1} "
+                  f"({done}/{num_to_process}) {result['elapsed']:.2f}s")
+            _print_pair_result(result)
+            results.append(result)
+    
+    wall_time = time.perf_counter() - start
+    
+    print(f"\n{'='*60}")
+    print("PER-WORKER SUMMARY")
+    print(f"{'='*60}")
+    for worker, stats in sorted(worker_stats.items()):
+        rate = stats['pairs'] / stats['busy'] if stats['busy'] > 0 else 0.0
+        print(f"   Worker {worker}: {stats['pairs']} pairs, {stats['failed']} failed, "
+              f"{stats['busy']:.2f}s busy ({rate:.2f} pairs/s), "
+              f"template cache {stats['cache']['hits']} hits / {stats['cache']['misses']} misses")
+    print(f"✔️ Wall time: {wall_time:.2f}s")
+    print(f"✔️ Throughput: {num_to_process / wall_time:.2f} pairs/s")
+    
+    return results
+
+
 def process_deeppcb_dataset(dataset_dir="C:\\Users\\Vishwa Adhesh\\Downloads\\PCB_DATASET", 
-                           num_pairs=5, output_base_dir="output"):
+                           num_pairs=5, output_base_dir="output", workers=1):
     """
     Process DeepPCB dataset - analyze multiple image pairs
+    
+    Args:
+        dataset_dir: Root of the DeepPCB dataset
+        num_pairs: Number of pairs to process
+        output_base_dir: Where per-pair result folders are created
+        workers: Number of worker processes (1 = serial, in-process)
     """
     
     print("\n" + "🔵"*30)
@@ -201,44 +349,30 @@ def process_deeppcb_dataset(dataset_dir="C:\\Users\\Vishwa Adhesh\\Downloads\\PC
     # Process first N pairs
     num_to_process = min(num_pairs, len(pairs))
     
-    for i in range(num_to_process):
-        pair = pairs[i]
-        
-        print(f"\n{'='*60}")
-        print(f"PROCESSING PAIR {i+1}/{num_to_process}")
-        print(f"{'='*60}")
-        print(f"Template: {pair['template_name']}")
-        print(f"Test: {pair['test_name']}")
-        print(f"Defect Type: {pair['defect_type']}")
-        
-        # Create output dir for this pair
-        pair_output_dir = os.path.join(output_base_dir, f"pair_{i:03d}_{pair['defect_type']}")
-        
-        # Create detector and run pipeline
-        detector = PCBDefectDetector(
-            template_path=pair['template'],
-            test_path=pair['test'],
-            output_dir=pair_output_dir,
-            pair_info=pair
-        )
-        
-        if detector.run_pipeline():
-            detector.save_results(i)
-            print(f"✅ Pair {i+1} processed successfully")
-            print(f"   Results saved to: {pair_output_dir}")
+    if workers > 1:
+        _process_pairs_parallel(pairs, num_to_process, output_base_dir, workers)
+    else:
+        for i in range(num_to_process):
+            pair = pairs[i]
+            
+            print(f"\n{'='*60}")
+            print(f"PROCESSING PAIR {i+1}/{num_to_process}")
+            print(f"{'='*60}")
+            print(f"Template: {pair['template_name']}")
+            print(f"Test: {pair['test_name']}")
+            print(f"Defect Type: {pair['defect_type']}")
             
-            # Print statistics
-            defect_pixels = np.count_nonzero(detector.clean)
-            total_pixels = detector.clean.shape[0] * detector.clean.shape[1]
-            defect_percentage = (defect_pixels / total_pixels) * 100
-            print(f"   Defect area: {defect_pixels} pixels ({defect_percentage:.2f}%)")
-        else:
-            print(f"❌ Failed to process pair {i+1}")
+            result = _process_pair((i, pair, output_base_dir))
+            _print_pair_result(result)
     
     print("\n" + "="*60)
     print("✅ MILESTONE 1 COMPLETE!")
     print("="*60)
     print(f"Processed {num_to_process} image pairs")
+    if workers <= 1:
+        cache_stats = TEMPLATE_CACHE.stats()
+        print(f"Template cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+              f"({cache_stats['hit_rate']*100:.1f}% hit rate)")
     print(f"Results saved in: {os.path.abspath(output_base_dir)}")
     print("="*60 + "\n")
     
@@ -252,7 +386,8 @@ if __name__ == "__main__":
     success = process_deeppcb_dataset(
         dataset_dir=r"C:\Users\Vishwa Adhesh\Downloads\PCB_DATASET",
         num_pairs=5,
-        output_base_dir="output"
+        output_base_dir="output",
+        workers=1  # Set to os.cpu_count() for nightly full-dataset runs
     )
     
     if success:
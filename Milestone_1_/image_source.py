@@ -0,0 +1,459 @@
+"""
+MILESTONE 1/2: Windowed Image Sources
+Read large panel images (or just regions of them) without decoding everything
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# PIL raw modes that can be memory-mapped as-is: raw mode -> (channels, order)
+RAW_MODES = {
+    'L': (1, 'GRAY'),
+    'RGB': (3, 'RGB'),
+    'BGR': (3, 'BGR'),
+    'RGBX': (4, 'RGBA'),
+    'RGBA': (4, 'RGBA'),
+    'BGRX': (4, 'BGRA'),
+    'BGRA': (4, 'BGRA'),
+}
+
+# Reduced-scale JPEG decoding (DCT scaling in libjpeg): factor -> imread flag
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Use reduced decoding for JPEG resizes at all. On by default: resized
+# JPEGs then differ slightly from a full decode + resize (set False, or
+# pass exact=True, for bit-identical results)
+REDUCED_DECODE = True
+
+# A reduced decode must keep at least this many decoded pixels per output
+# pixel in each direction, otherwise the JPEG is decoded at full size
+REDUCED_DECODE_MIN_RATIO = 1.0
+
+# EXIF orientations that make cv2.imread swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Conversion of a window in file channel order to BGR (None = already BGR)
+TO_BGR = {
+    'GRAY': cv2.COLOR_GRAY2BGR,
+    'RGB': cv2.COLOR_RGB2BGR,
+    'BGR': None,
+    'RGBA': cv2.COLOR_RGBA2BGR,
+    'BGRA': cv2.COLOR_BGRA2BGR,
+}
+
+
+class WindowCache:
+    """
+    Bounded LRU cache of recently read image windows
+
+    Key: (absolute path, file mtime, window) - a rewritten file
+    never serves stale pixels. Value: read-only BGR array.
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            window = self._entries.get(key)
+            if window is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return window
+
+    def put(self, key, window):
+        if window.nbytes > self.max_bytes:
+            return
+        window.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = window
+            self.current_bytes += window.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# Shared by every image source in this process
+WINDOW_CACHE = WindowCache()
+
+
+class ImageSource:
+    """
+    An image that can be read whole, resized, or one window at a time
+
+    Behaves enough like the cv2.imread array for the pipelines here:
+    .shape, slicing (source[y0:y1, x0:x1]) and np.asarray(source) all
+    return BGR pixels. Subclasses only implement _read(window).
+    """
+
+    def __init__(self, path, shape, cache=None):
+        self.path = path
+        self.shape = shape
+        self.cache = cache
+        try:
+            self._mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            self._mtime = None
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    def _read(self, window):
+        raise NotImplementedError
+
+    def _clip(self, window):
+        if window is None:
+            return (0, 0, self.width, self.height)
+        x0, y0, x1, y1 = (int(v) for v in window)
+        return (max(x0, 0), max(y0, 0), min(x1, self.width), min(y1, self.height))
+
+    def _cached(self, key, read):
+        if self.cache is None:
+            return read()
+        key = (os.path.abspath(self.path), self._mtime) + key
+        window = self.cache.get(key)
+        if window is None:
+            window = np.ascontiguousarray(read())
+            self.cache.put(key, window)
+        return window
+
+    def read(self, window=None):
+        """
+        BGR pixels of window (x0, y0, x1, y1), or the whole image
+
+        Memory-mapped sources read only the rows and tiles the window
+        touches. Results go through the window cache when one is set.
+        """
+        window = self._clip(window)
+        return self._cached((window,), lambda: self._read(window))
+
+    def read_resized(self, target_size, out=None):
+        """
+        Whole image resized to target_size (width, height), in BGR
+
+        Same pixels as cv2.resize(cv2.imread(path), target_size). Whole
+        frames are read once per image, so they bypass the window cache.
+        out: optional (height, width, 3) uint8 array to resize into
+        """
+        return cv2.resize(self._read(self._clip(None)), tuple(target_size), dst=out)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        rows = index[0] if len(index) > 0 else slice(None)
+        cols = index[1] if len(index) > 1 else slice(None)
+        if (isinstance(rows, slice) and isinstance(cols, slice) and
+                rows.step in (None, 1) and cols.step in (None, 1)):
+            y0, y1, _ = rows.indices(self.height)
+            x0, x1, _ = cols.indices(self.width)
+            window = self.read((x0, y0, x1, max(y0, y1)))
+            return window[(slice(None), slice(None)) + index[2:]]
+        return self.read()[index]
+
+    def __array__(self, dtype=None, copy=None):
+        image = self.read()
+        return image if dtype is None else image.astype(dtype)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r}, shape={self.shape})"
+
+
+class ArraySource(ImageSource):
+    """
+    Fully decoded image (compressed formats such as PNG and JPEG)
+
+    Decoded once when opened; windows are views of the result.
+    """
+
+    def __init__(self, path, image=None, cache=None):
+        if image is None:
+            image = cv2.imread(path)
+            if image is None:
+                raise ValueError(f"Cannot load image from {path}")
+        super().__init__(path, image.shape, cache)
+        self._image = image
+
+    def _read(self, window):
+        x0, y0, x1, y1 = window
+        return self._image[y0:y1, x0:x1]
+
+    def read(self, window=None):
+        """Windows of a decoded image are views - no need to cache them"""
+        return self._read(self._clip(window))
+
+
+def reduction_factor(source_size, target_size, min_ratio=None):
+    """
+    Largest JPEG reduction (8, 4, 2, or 1 = full decode) that still leaves
+    at least min_ratio decoded pixels per target pixel in each direction
+
+    Args:
+        source_size: (width, height) of the full image
+        target_size: (width, height) wanted after resizing
+    """
+    if min_ratio is None:
+        min_ratio = REDUCED_DECODE_MIN_RATIO
+    width, height = source_size
+    target_w, target_h = target_size
+    for factor in (8, 4, 2):
+        if (-(-width // factor) >= target_w * min_ratio and
+                -(-height // factor) >= target_h * min_ratio):
+            return factor
+    return 1
+
+
+class JpegSource(ArraySource):
+    """
+    JPEG image whose resizes skip the full-size decode
+
+    Shrinking to a much smaller target_size decodes at 1/2, 1/4 or 1/8
+    scale directly (cv2.IMREAD_REDUCED_COLOR_*), which skips most of the
+    IDCT work and memory. Windows still need full resolution, so the
+    first read() decodes the whole image once.
+    """
+
+    def __init__(self, path, shape, cache=None):
+        ImageSource.__init__(self, path, shape, cache)
+        self._image = None
+
+    def _read(self, window):
+        if self._image is None:
+            image = cv2.imread(self.path)
+            if image is None:
+                raise ValueError(f"Cannot load image from {self.path}")
+            self._image = image
+        return super()._read(window)
+
+    def read_resized(self, target_size, out=None, exact=False):
+        """
+        Whole image resized to target_size (width, height), in BGR
+
+        Uses a reduced-scale decode unless exact is set, REDUCED_DECODE is
+        off, the reduction would drop below REDUCED_DECODE_MIN_RATIO, or
+        the full image is decoded already. Reduced results are close to,
+        but not bit-identical with, cv2.resize(cv2.imread(path)).
+        """
+        target_size = tuple(target_size)
+        factor = 1
+        if REDUCED_DECODE and not exact and self._image is None:
+            factor = reduction_factor((self.width, self.height), target_size)
+        if factor > 1:
+            reduced = cv2.imread(self.path, REDUCED_FLAGS[factor])
+            if reduced is not None:
+                return cv2.resize(reduced, target_size, dst=out)
+        return super().read_resized(target_size, out)
+
+
+class MemmapSource(ImageSource):
+    """
+    Uncompressed image read straight from disk through numpy.memmap
+
+    The file is described as a list of raw tiles (one tile for plain
+    BMP/PPM/PGM/single-strip TIFF/.raw, many for tiled or striped TIFF),
+    each an (extents, array view) pair. A window read touches only the
+    tiles, rows and bytes it overlaps; nothing else is paged in.
+    """
+
+    def __init__(self, path, tiles, shape, order, cache=None):
+        """
+        Args:
+            path: Image file
+            tiles: List of ((x0, y0, x1, y1), view) - view is (h, w, channels)
+                   in file channel order, usually a memmap slice
+            shape: Image shape as returned by cv2.imread (h, w, 3)
+            order: File channel order, a TO_BGR key
+        """
+        super().__init__(path, shape, cache)
+        self.tiles = tiles
+        self.order = order
+
+    def _to_bgr(self, pixels, out=None):
+        code = TO_BGR[self.order]
+        if code is None:
+            return pixels
+        return cv2.cvtColor(pixels, code, dst=out)
+
+    def _read(self, window):
+        x0, y0, x1, y1 = window
+        if len(self.tiles) == 1:
+            (tx0, ty0, _, _), view = self.tiles[0]
+            return self._to_bgr(view[y0 - ty0:y1 - ty0, x0 - tx0:x1 - tx0])
+
+        channels = self.tiles[0][1].shape[2]
+        out = np.empty((y1 - y0, x1 - x0, channels), dtype=np.uint8)
+        for (tx0, ty0, tx1, ty1), view in self.tiles:
+            ix0, iy0 = max(x0, tx0), max(y0, ty0)
+            ix1, iy1 = min(x1, tx1), min(y1, ty1)
+            if ix0 < ix1 and iy0 < iy1:
+                out[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = \
+                    view[iy0 - ty0:iy1 - ty0, ix0 - tx0:ix1 - tx0]
+        return self._to_bgr(out)
+
+    def read_resized(self, target_size, out=None):
+        """
+        Whole image resized to target_size - resized straight from the
+        memory map, so a big downscale only pages in the sampled rows
+        out: optional (height, width, 3) uint8 array to resize into
+        """
+        if len(self.tiles) > 1:
+            return super().read_resized(target_size, out)
+        view = self.tiles[0][1]
+        if TO_BGR[self.order] is None:
+            return cv2.resize(view, tuple(target_size), dst=out)
+        return self._to_bgr(cv2.resize(view, tuple(target_size)), out)
+
+
+def _probe(path):
+    """
+    Read format, size, raw tile table and EXIF orientation from the
+    header with PIL (nothing is decoded). None if PIL cannot open it.
+    """
+    try:
+        with Image.open(path) as image:
+            return {
+                'format': image.format,
+                'size': image.size,
+                'tile': list(image.tile),
+                'orientation': image.getexif().get(0x0112, 1)
+            }
+    except Exception:
+        return None
+
+
+def _raw_tiles(path, header):
+    """
+    Describe an uncompressed image file as memory-mappable raw tiles
+
+    Uses the tile table from the header. Returns (tiles, shape, order),
+    or None if the file is compressed or uses a layout that cannot be
+    mapped directly.
+    """
+    width, height = header['size']
+    tile_table = header['tile']
+    if not tile_table:
+        return None
+
+    file_bytes = np.memmap(path, dtype=np.uint8, mode="r")
+    tiles = []
+    order = None
+    for tile in tile_table:
+        codec, extents, offset, args = tile[0], tile[1], tile[2], tile[3]
+        if codec != "raw":
+            return None
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if rawmode not in RAW_MODES:
+            return None
+        channels, tile_order = RAW_MODES[rawmode]
+        if order is not None and tile_order != order:
+            return None
+        order = tile_order
+
+        x0, y0, x1, y1 = extents
+        tile_w, tile_h = x1 - x0, y1 - y0
+        stride = stride or tile_w * channels
+        end = offset + stride * tile_h
+        if end > len(file_bytes):
+            return None
+        rows = file_bytes[offset:end].reshape(tile_h, stride)
+        view = rows[:, :tile_w * channels].reshape(tile_h, tile_w, channels)
+        if orientation < 0:
+            view = view[::-1]  # bottom-up rows (BMP)
+        tiles.append(((x0, y0, x1, y1), view))
+
+    return tiles, (height, width, 3), order
+
+
+def open_image_source(path, raw_shape=None, cache=WINDOW_CACHE):
+    """
+    Open an image file as the cheapest ImageSource that can read it
+
+        - .npy: numpy.load(mmap_mode='r'), pixels in BGR (or grayscale)
+        - .raw: headerless pixels, needs raw_shape (h, w) or (h, w, 3) BGR
+        - uncompressed BMP / PPM / PGM / TIFF: MemmapSource from the
+          header's tile table
+        - JPEG: JpegSource (reduced-scale decode for resizes)
+        - anything else (PNG, compressed TIFF): decoded once with
+          cv2.imread into an ArraySource
+
+    Returns:
+        ImageSource, or None if the file cannot be read
+    """
+    if not os.path.isfile(path):
+        return None
+    extension = os.path.splitext(path)[1].lower()
+
+    try:
+        if extension in (".npy", ".raw"):
+            if extension == ".npy":
+                pixels = np.load(path, mmap_mode="r")
+            else:
+                if raw_shape is None:
+                    raise ValueError("raw_shape is required for .raw images")
+                pixels = np.memmap(path, dtype=np.uint8, mode="r", shape=tuple(raw_shape))
+            order = "GRAY" if pixels.ndim == 2 else "BGR"
+            if pixels.ndim == 2:
+                pixels = pixels[:, :, None]
+            height, width = pixels.shape[:2]
+            return MemmapSource(path, [((0, 0, width, height), pixels)],
+                                (height, width, 3), order, cache)
+
+        header = _probe(path)
+        raw = None if header is None else _raw_tiles(path, header)
+        if raw is not None:
+            tiles, shape, order = raw
+            return MemmapSource(path, tiles, shape, order, cache)
+
+        if header is not None and header['format'] == "JPEG":
+            width, height = header['size']
+            if header['orientation'] in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            return JpegSource(path, (height, width, 3), cache)
+
+        return ArraySource(path, cache=cache)
+    except (OSError, ValueError) as e:
+        print(f"Error opening image {path}: {str(e)}", file=sys.stderr)
+        return None
@@ -7,14 +7,17 @@ import cv2
 import os
 import numpy as np
 from pathlib import Path
+from image_source import open_image_source
+from template_cache import TEMPLATE_CACHE
 
 class PCBDefectDetector:
     """
     Simple PCB Defect Detection Pipeline
-    Steps: Alignment → Subtraction → Threshold → Noise Removal
+    Steps: Alignment (+ Registration) → Subtraction → Threshold → Noise Removal
     """
     
-    def __init__(self, template_path, test_path, output_dir="output"):
+    def __init__(self, template_path, test_path, output_dir="output", template_cache=None,
+                 register=True):
         """
         Initialize with template and test image paths
         
@@ -22,10 +25,16 @@ class PCBDefectDetector:
             template_path: Path to perfect PCB image
             test_path: Path to PCB with defect
             output_dir: Directory to save results
+            template_cache: TemplateCache to load the template from
+                            (defaults to the shared process-wide cache)
+            register: Undo fixture shifts of the test image (phase
+                      correlation against the template) before subtracting
         """
         self.template_path = template_path
         self.test_path = test_path
         self.output_dir = output_dir
+        self.template_cache = template_cache or TEMPLATE_CACHE
+        self.register = register
         
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -33,8 +42,11 @@ class PCBDefectDetector:
         # Will store images at each step
         self.template = None
         self.test = None
+        self.test_source = None
         self.template_gray = None
         self.test_gray = None
+        self.shift = None
+        self.valid_region = None
         self.diff = None
         self.thresh = None
         self.clean = None
@@ -53,6 +65,11 @@ class PCBDefectDetector:
             1. Read both images (template = good, test = may have defect)
             2. Resize both to same dimensions
             3. Convert to grayscale (black & white)
+            4. Registration: estimate how far the test board is shifted
+               against the template and move it back (see registration.py)
+            (The template is decoded once and then served from TEMPLATE_CACHE)
+            (Uncompressed test images are memory-mapped, not fully decoded;
+             self.test_source can read full-resolution windows later)
         
         Returns:
             True if successful, False otherwise
@@ -62,33 +79,46 @@ class PCBDefectDetector:
         print("="*60)
         
         try:
-            # Read images in color first
-            self.template = cv2.imread(self.template_path)
-            self.test = cv2.imread(self.test_path)
+            # Template comes from the cache (already resized + grayscale)
+            cached = self.template_cache.get(self.template_path, target_size)
             
-            if self.template is None:
+            # Open test image as a windowed source (color, BGR)
+            self.test_source = open_image_source(self.test_path)
+            
+            if cached is None:
                 print(f"❌ Error: Cannot load template image from {self.template_path}")
                 return False
             
-            if self.test is None:
+            if self.test_source is None:
                 print(f"❌ Error: Cannot load test image from {self.test_path}")
                 return False
             
-            print(f"✔️ Template image loaded: {self.template.shape}")
-            print(f"✔️ Test image loaded: {self.test.shape}")
+            self.template, self.template_gray, template_shape = cached
+            
+            print(f"✔️ Template image loaded: {template_shape}")
+            print(f"✔️ Test image loaded: {self.test_source.shape}")
             
             # Resize both to same size
-            self.template = cv2.resize(self.template, target_size)
-            self.test = cv2.resize(self.test, target_size)
+            self.test = self.test_source.read_resized(target_size)
             
             print(f"✔️ Both images resized to: {target_size}")
             
             # Convert to grayscale (remove color, keep brightness)
-            self.template_gray = cv2.cvtColor(self.template, cv2.COLOR_BGR2GRAY)
             self.test_gray = cv2.cvtColor(self.test, cv2.COLOR_BGR2GRAY)
             
             print(f"✔️ Both images converted to grayscale")
             
+            # Registration: a shifted fixture would light up every edge in
+            # the difference image, so move the test image onto the template
+            if self.register:
+                registration = self.template_cache.registration(self.template_path, target_size)
+                dx, dy, response = registration.estimate(self.test_gray)
+                self.shift = (dx, dy, response)
+                self.test, self.valid_region = registration.align(self.test, dx, dy)
+                self.test_gray = cv2.cvtColor(self.test, cv2.COLOR_BGR2GRAY)
+                print(f"✔️ Test image registered: shift ({dx:+.2f}, {dy:+.2f}) px, "
+                      f"peak {response:.2f}")
+            
             # Save aligned images for inspection
             cv2.imwrite(os.path.join(self.output_dir, "01_template_aligned.png"), 
                        self.template_gray)
@@ -134,6 +164,15 @@ class PCBDefectDetector:
             # Compute absolute difference
             self.diff = cv2.absdiff(self.template_gray, self.test_gray)
             
+            # After registration the edges the shift uncovered hold no test
+            # content - they are not compared
+            if self.valid_region is not None:
+                x0, y0, x1, y1 = self.valid_region
+                self.diff[:y0] = 0
+                self.diff[y1:] = 0
+                self.diff[:, :x0] = 0
+                self.diff[:, x1:] = 0
+            
             print(f"✔️ Difference image computed")
             print(f"   Min pixel value: {self.diff.min()}")
             print(f"   Max pixel value: {self.diff.max()}")
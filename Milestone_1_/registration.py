@@ -0,0 +1,166 @@
+"""
+MILESTONE 1: Image Registration
+Coarse-to-fine phase correlation of test images against a template (template FFTs precomputed)
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+# Coarse level: both images shrunk by this factor, whole frame correlated
+COARSE_SCALE = 0.25
+
+# Refinement: a central patch of this size correlated at processing resolution
+REFINE_SIZE = 256
+
+# Peak height (1.0 = identical content) below which no shift is applied
+MIN_RESPONSE = 0.03
+
+# Shifts below this in both axes are estimation noise - the image is not warped
+MIN_SHIFT = 0.5
+
+
+def _spectrum(gray, window):
+    """DFT (2-channel complex) of a mean-removed, windowed patch"""
+    patch = gray.astype(np.float32)
+    patch -= patch.mean()
+    return cv2.dft(patch * window, flags=cv2.DFT_COMPLEX_OUTPUT)
+
+
+def _subpixel(before, peak, after):
+    """
+    Sub-pixel offset (-0.5..0.5) of a phase correlation peak from its
+    neighbours. The peak is a sampled Dirichlet kernel, so the offset is
+    side / (side +- peak) for the larger side (Foroosh et al.) - much less
+    biased than a parabola fit.
+    """
+    side, sign = (after, 1.0) if after >= before else (before, -1.0)
+    for offset in (side / (side + peak), side / (side - peak)):
+        if 0.0 <= offset < 1.0:
+            return sign * min(offset, 0.5)
+    return 0.0
+
+
+def correlate(spectrum, template_spectrum):
+    """
+    Phase correlation of two spectra of the same size
+
+    Returns:
+        (dx, dy, response) - sub-pixel shift of the image relative to the
+        template (image(x) = template(x - d)) and the height of the peak
+    """
+    product = cv2.mulSpectrums(spectrum, template_spectrum, 0, conjB=True)
+    magnitude = cv2.magnitude(product[..., 0], product[..., 1])
+    product /= (magnitude + 1e-9)[..., None]
+    surface = cv2.idft(product, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)
+
+    height, width = surface.shape
+    _, response, _, (x, y) = cv2.minMaxLoc(surface)
+    dx = x + _subpixel(surface[y, x - 1], response, surface[y, (x + 1) % width])
+    dy = y + _subpixel(surface[y - 1, x], response, surface[(y + 1) % height, x])
+    # The surface wraps around - peaks past the middle are negative shifts
+    if dx > width / 2:
+        dx -= width
+    if dy > height / 2:
+        dy -= height
+    return float(dx), float(dy), float(response)
+
+
+class TemplateRegistration:
+    """
+    Translation registration against one template
+
+    Everything that depends only on the template - the shrunk coarse
+    image, the refinement patch, their Hanning windows and FFTs - is
+    computed once here, so registering a test image costs one small DFT
+    per level plus the inverse transforms.
+
+    Steps:
+        1. Coarse: phase correlation of the whole frame at COARSE_SCALE
+           (finds shifts up to half the frame)
+        2. Refine: phase correlation of a REFINE_SIZE patch around the
+           centre, with the test patch taken at the coarse shift, at
+           processing resolution (sub-pixel accuracy)
+    """
+
+    def __init__(self, template_gray, coarse_scale=COARSE_SCALE, refine_size=REFINE_SIZE):
+        height, width = template_gray.shape
+        self.shape = (height, width)
+        self.coarse_scale = coarse_scale
+        self.coarse_size = (max(8, round(width * coarse_scale)), max(8, round(height * coarse_scale)))
+        coarse = cv2.resize(template_gray, self.coarse_size, interpolation=cv2.INTER_AREA)
+        self.coarse_window = cv2.createHanningWindow(self.coarse_size, cv2.CV_32F)
+        self.coarse_spectrum = _spectrum(coarse, self.coarse_window)
+
+        size = min(refine_size, height, width)
+        self.refine_origin = ((width - size) // 2, (height - size) // 2)
+        self.refine_size = size
+        x0, y0 = self.refine_origin
+        self.refine_window = cv2.createHanningWindow((size, size), cv2.CV_32F)
+        self.refine_spectrum = _spectrum(template_gray[y0:y0 + size, x0:x0 + size],
+                                         self.refine_window)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.coarse_window, self.coarse_spectrum,
+                                      self.refine_window, self.refine_spectrum))
+
+    def estimate_coarse(self, test_gray):
+        """Shift from the coarse level only (about 1/COARSE_SCALE px accurate), in processing pixels"""
+        coarse = cv2.resize(test_gray, self.coarse_size, interpolation=cv2.INTER_AREA)
+        dx, dy, response = correlate(_spectrum(coarse, self.coarse_window), self.coarse_spectrum)
+        return dx / self.coarse_scale, dy / self.coarse_scale, response
+
+    def estimate(self, test_gray):
+        """
+        Shift of test_gray relative to the template
+
+        Returns:
+            (dx, dy, response) - (0, 0, response) when the coarse peak is
+            below MIN_RESPONSE (nothing in common to align on)
+        """
+        if test_gray.shape != self.shape:
+            raise ValueError(f"Test image is {test_gray.shape[::-1]}, "
+                             f"template is {self.shape[::-1]}")
+        coarse_dx, coarse_dy, response = self.estimate_coarse(test_gray)
+        if response < MIN_RESPONSE:
+            return 0.0, 0.0, response
+
+        # Test patch where the template patch should have moved to
+        height, width = self.shape
+        size = self.refine_size
+        x0, y0 = self.refine_origin
+        ox = int(np.clip(round(coarse_dx), -x0, width - size - x0))
+        oy = int(np.clip(round(coarse_dy), -y0, height - size - y0))
+        patch = test_gray[y0 + oy:y0 + oy + size, x0 + ox:x0 + ox + size]
+        dx, dy, refine_response = correlate(_spectrum(patch, self.refine_window),
+                                            self.refine_spectrum)
+        if refine_response < MIN_RESPONSE:
+            return coarse_dx, coarse_dy, response
+        return ox + dx, oy + dy, refine_response
+
+    def align(self, image, dx, dy):
+        """
+        Move image by (-dx, -dy), with sub-pixel accuracy, onto the template
+
+        An image that is already aligned (|dx| and |dy| below MIN_SHIFT -
+        phase correlation still measures a few hundredths of a pixel of
+        noise) comes back unchanged, so it is not blurred by interpolation.
+        Anything else is warped by the full sub-pixel shift (bilinear).
+
+        Returns:
+            (aligned image, valid) - valid is the (x0, y0, x1, y1) region
+            that holds real image content (outside it the edge pixels are
+            repeated and should not be compared)
+        """
+        height, width = image.shape[:2]
+        if abs(dx) < MIN_SHIFT and abs(dy) < MIN_SHIFT:
+            return image, (0, 0, width, height)
+        matrix = np.float32([[1, 0, -dx], [0, 1, -dy]])
+        aligned = cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                                 borderMode=cv2.BORDER_REPLICATE)
+        # Partly covered border pixels are blended with repeated ones - not valid
+        valid = (math.ceil(max(0, -dx)), math.ceil(max(0, -dy)),
+                 math.floor(min(width, width - dx)), math.floor(min(height, height - dy)))
+        return aligned, valid
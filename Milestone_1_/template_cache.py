@@ -0,0 +1,164 @@
+"""
+MILESTONE 1: Template Cache
+Keeps preprocessed template images in memory between pairs
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from image_source import open_image_source
+from registration import TemplateRegistration
+
+
+class TemplateCache:
+    """
+    Bounded LRU cache of preprocessed template images
+
+    The same few templates are paired with hundreds of test images, so each
+    template is decoded, resized and converted to grayscale only once.
+
+    Key: (absolute path, file mtime, target size)
+        - Editing the template file changes its mtime, so stale entries are
+          never served.
+    Value: read-only (resized BGR, grayscale, original shape)
+        - Arrays are shared between detectors, so they are marked read-only
+          to stop one pair from modifying another pair's template.
+
+    The TemplateRegistration (template FFTs) of a cached template is kept
+    next to it and evicted with it; it is small and not counted in
+    max_bytes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Memory cap for cached arrays (least recently used
+                       entries are evicted first)
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._registrations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path, target_size):
+        abs_path = os.path.abspath(path)
+        return (abs_path, os.stat(abs_path).st_mtime_ns, tuple(target_size))
+
+    @staticmethod
+    def _entry_bytes(entry):
+        color, gray, _ = entry
+        return color.nbytes + gray.nbytes
+
+    def get(self, path, target_size=(640, 480)):
+        """
+        Return (template, template_gray, original_shape) for a template path
+
+        Returns None if the file does not exist or cannot be decoded.
+        """
+        return self._lookup(path, target_size, count=True)
+
+    def _lookup(self, path, target_size, count):
+        """get(), with the hit/miss counters only updated if count is set"""
+        try:
+            key = self._key(path, target_size)
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry
+            if count:
+                self.misses += 1
+
+        # Decode outside the lock so other threads are not blocked on disk I/O
+        # (uncompressed templates are resized straight from a memory map)
+        source = open_image_source(path)
+        if source is None:
+            return None
+
+        color = source.read_resized(tuple(target_size))
+        gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        color.setflags(write=False)
+        gray.setflags(write=False)
+        entry = (color, gray, source.shape)
+
+        size = self._entry_bytes(entry)
+        if size > self.max_bytes:
+            # Too large to cache - serve it without storing
+            return entry
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    evicted_key, evicted = self._entries.popitem(last=False)
+                    self._registrations.pop(evicted_key, None)
+                    self.current_bytes -= self._entry_bytes(evicted)
+                    self.evictions += 1
+            return self._entries.get(key, entry)
+
+    def registration(self, path, target_size=(640, 480)):
+        """
+        Return the TemplateRegistration of a template path, built on first use
+
+        Returns None if the template cannot be loaded. Does not count as a
+        template lookup in stats() - callers get() the template as well.
+        """
+        cached = self._lookup(path, target_size, count=False)
+        if cached is None:
+            return None
+        key = self._key(path, target_size)
+
+        with self._lock:
+            registration = self._registrations.get(key)
+        if registration is not None:
+            return registration
+
+        registration = TemplateRegistration(cached[1])
+        with self._lock:
+            # Only kept while its template is cached
+            if key in self._entries:
+                registration = self._registrations.setdefault(key, registration)
+        return registration
+
+    def clear(self):
+        """Drop all cached templates and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._registrations.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return hit/miss counters and memory usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'registrations': len(self._registrations),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared by every PCBDefectDetector in this process
+TEMPLATE_CACHE = TemplateCache()
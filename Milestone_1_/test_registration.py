@@ -0,0 +1,57 @@
+"""
+MILESTONE 1: Registration Tests
+Registration must leave aligned pairs untouched and undo shifts accurately
+"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from milestone1_pcb_defect_detection import PCBDefectDetector
+from registration import TemplateRegistration
+from template_cache import TemplateCache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(HERE, "dataset", "template", "template.png")
+TEST_PATH = os.path.join(HERE, "dataset", "test", "test.png")
+
+
+def run_detector(output_dir, register):
+    detector = PCBDefectDetector(TEMPLATE_PATH, TEST_PATH, output_dir=str(output_dir),
+                                 template_cache=TemplateCache(), register=register)
+    assert detector.run_pipeline()
+    return detector
+
+
+def test_aligned_pair_mask_unchanged(tmp_path):
+    # The sample pair is already aligned - registration must not alter the result
+    plain = run_detector(tmp_path / "plain", register=False)
+    registered = run_detector(tmp_path / "registered", register=True)
+    dx, dy, _ = registered.shift
+    assert abs(dx) < 0.5 and abs(dy) < 0.5
+    assert registered.valid_region == (0, 0, 640, 480)
+    assert np.array_equal(registered.test_gray, plain.test_gray)
+    assert np.array_equal(registered.clean, plain.clean)
+
+
+@pytest.mark.parametrize("shift", [(7, -4), (-12, 9)])
+def test_whole_pixel_shift_undone_exactly(shift):
+    template = cv2.resize(cv2.imread(TEMPLATE_PATH, cv2.IMREAD_GRAYSCALE), (640, 480))
+    dx, dy = shift
+    matrix = np.float32([[1, 0, dx], [0, 1, dy]])
+    moved = cv2.warpAffine(template, matrix, (640, 480), flags=cv2.INTER_NEAREST,
+                           borderMode=cv2.BORDER_REPLICATE)
+
+    registration = TemplateRegistration(template)
+    est_dx, est_dy, _ = registration.estimate(moved)
+    assert abs(est_dx - dx) < 0.1 and abs(est_dy - dy) < 0.1
+    # A whole-pixel shift is undone without interpolating anything
+    aligned, (x0, y0, x1, y1) = registration.align(moved, dx, dy)
+    assert (x0, y0, x1, y1) == (max(0, -dx), max(0, -dy), min(640, 640 - dx), min(480, 480 - dy))
+    assert np.array_equal(aligned[y0:y1, x0:x1], template[y0:y1, x0:x1])
+    # The estimated (sub-pixel) shift lands within interpolation error of it
+    aligned, (x0, y0, x1, y1) = registration.align(moved, est_dx, est_dy)
+    diff = cv2.absdiff(aligned[y0:y1, x0:x1], template[y0:y1, x0:x1])
+    assert np.mean(diff) < 2.0
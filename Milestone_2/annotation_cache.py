@@ -0,0 +1,184 @@
+"""
+MILESTONE 2: Bulk Annotation Cache
+Parses every VOC XML once (streaming, in parallel) and serves boxes from one array file
+"""
+
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Written next to images/ unless a cache_path is given
+CACHE_NAME = "pcb_annotations.npz"
+
+# Columns of the boxes array
+IMAGE, CLASS, XMIN, YMIN, XMAX, YMAX = range(6)
+
+# Below this many files a process pool costs more than it saves
+# (streaming one small VOC file takes ~0.1 ms, starting the pool ~0.3 s)
+PARALLEL_MIN_FILES = 2000
+
+
+def iterparse_objects(xml_path):
+    """
+    Stream one VOC XML file and return its objects
+
+    Uses ET.iterparse and clears every finished <object>, so no full DOM
+    is built. Raises on unreadable or malformed files.
+
+    Returns:
+        List of (class_name, x_min, y_min, x_max, y_max)
+    """
+    objects = []
+    values = {}
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == 'object':
+                values = {}
+        elif tag in ('name', 'xmin', 'ymin', 'xmax', 'ymax'):
+            values[tag] = elem.text
+        elif tag == 'object':
+            objects.append((values.get('name') or "",
+                            int(values['xmin']), int(values['ymin']),
+                            int(values['xmax']), int(values['ymax'])))
+            values = {}
+            elem.clear()
+    return objects
+
+
+def _parse_chunk(xml_paths):
+    """Worker: parse a list of files, None for the ones that fail"""
+    results = []
+    for path in xml_paths:
+        try:
+            results.append(iterparse_objects(path))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def _stamps(xml_paths):
+    """(mtime_ns, size) per file; (-1, -1) for missing files"""
+    stamps = np.full((len(xml_paths), 2), -1, dtype=np.int64)
+    for i, path in enumerate(xml_paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stamps[i] = stat.st_mtime_ns, stat.st_size
+    return stamps
+
+
+class AnnotationCache:
+    """
+    All bounding boxes of a dataset in one (N, 6) int32 array
+
+    Columns: image index, class id, x_min, y_min, x_max, y_max, sorted by
+    image index. Class ids index self.classes (sorted class names), image
+    indices index self.paths.
+
+    The array, the paths, the class names and every file's (mtime, size)
+    are stored together in one .npz file. load() stats each XML; if any
+    file was added, removed or modified, everything is parsed again.
+    """
+
+    def __init__(self, xml_paths, cache_path, workers=None):
+        """
+        Args:
+            xml_paths: Annotation files to serve
+            cache_path: .npz file holding the parsed boxes (None = parse
+                        every time, keep nothing on disk)
+            workers: Parser processes (None = os.cpu_count())
+        """
+        self.paths = [os.path.abspath(p) for p in xml_paths]
+        self.cache_path = cache_path
+        self.workers = workers or os.cpu_count() or 1
+        self.boxes = np.empty((0, 6), dtype=np.int32)
+        self.classes = []
+        self.failed = 0
+        self.rebuilt = False
+        self._index = {path: i for i, path in enumerate(self.paths)}
+        self._offsets = np.zeros(len(self.paths) + 1, dtype=np.intp)
+
+    # ============ BUILD / LOAD ============
+    def _parse_all(self):
+        """Parse every file, in a process pool for large datasets"""
+        paths = self.paths
+        if self.workers <= 1 or len(paths) < PARALLEL_MIN_FILES:
+            return _parse_chunk(paths)
+
+        # One chunk per task keeps inter-process traffic to a few messages
+        size = -(-len(paths) // (self.workers * 4))
+        chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            return [objects for chunk in pool.map(_parse_chunk, chunks) for objects in chunk]
+
+    def _build(self, stamps):
+        parsed = self._parse_all()
+        self.failed = sum(objects is None for objects in parsed)
+
+        self.classes = sorted({obj[0] for objects in parsed if objects for obj in objects})
+        class_ids = {name: i for i, name in enumerate(self.classes)}
+        rows = [(image, class_ids[name], x1, y1, x2, y2)
+                for image, objects in enumerate(parsed) if objects
+                for name, x1, y1, x2, y2 in objects]
+        self.boxes = np.array(rows, dtype=np.int32).reshape(-1, 6)
+
+        if self.cache_path is None:
+            return
+        try:
+            np.savez(self.cache_path, boxes=self.boxes, paths=np.array(self.paths, dtype=str),
+                     classes=np.array(self.classes, dtype=str), stamps=stamps)
+        except OSError:
+            # Read-only share - serve from memory for this process only
+            pass
+
+    def load(self):
+        """
+        Load boxes from cache_path, re-parsing if any XML changed
+
+        Returns:
+            self
+        """
+        stamps = _stamps(self.paths)
+        self.rebuilt = True
+        try:
+            if self.cache_path is not None:
+                with np.load(self.cache_path, allow_pickle=False) as cached:
+                    if (cached['paths'].tolist() == self.paths and
+                            np.array_equal(cached['stamps'], stamps)):
+                        self.boxes = cached['boxes']
+                        self.classes = cached['classes'].tolist()
+                        self.rebuilt = False
+        except (OSError, KeyError, ValueError):
+            pass
+
+        if self.rebuilt:
+            self._build(stamps)
+
+        self._offsets = np.searchsorted(self.boxes[:, IMAGE], np.arange(len(self.paths) + 1))
+        return self
+
+    # ============ LOOKUPS ============
+    def __contains__(self, xml_path):
+        return os.path.abspath(xml_path) in self._index
+
+    def rows(self, xml_path):
+        """(M, 6) view of the boxes array for one annotation file"""
+        i = self._index[os.path.abspath(xml_path)]
+        return self.boxes[self._offsets[i]:self._offsets[i + 1]]
+
+    def bboxes(self, xml_path):
+        """[(x_min, y_min, x_max, y_max), ...] as XMLAnnotationParser.parse_xml returns"""
+        return [tuple(box) for box in self.rows(xml_path)[:, XMIN:].tolist()]
+
+    def labels(self, xml_path):
+        """Class name of every box of one annotation file"""
+        return [self.classes[c] for c in self.rows(xml_path)[:, CLASS].tolist()]
+
+
+def load_annotation_cache(xml_paths, cache_path, workers=None):
+    """Build or load the annotation cache for a list of XML files"""
+    return AnnotationCache(xml_paths, cache_path, workers).load()
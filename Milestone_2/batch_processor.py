@@ -5,17 +5,78 @@ Process multiple defect images with their annotations
 
 import os
 import sys
-from pathlib import Path
+import time
+import numpy as np
+from annotation_cache import CACHE_NAME, CLASS, XMIN, load_annotation_cache
+from dataset_manifest import MANIFEST_NAME, load_manifest
+from gt_masks import MaskBatch
+from image_source import open_image_source
+from patch_store import PatchStore
 from milestone2_defect_localization import DefectLocalizer
 
 
 class BatchDefectProcessor:
     """Process multiple images with annotations"""
     
-    def __init__(self, dataset_dir, num_images=5):
+    def __init__(self, dataset_dir, num_images=5, output_dir="output", manifest_path=None,
+                 annotation_cache_path=None):
+        """
+        Args:
+            dataset_dir: Root of the DeepPCB dataset (only read)
+            num_images: Images process_dataset handles
+            output_dir: Where results, the manifest and the annotation
+                        cache are written
+            manifest_path: Dataset manifest (default: output_dir/pcb_manifest.sqlite)
+            annotation_cache_path: Annotation cache (default: output_dir/pcb_annotations.npz)
+        """
         self.dataset_dir = dataset_dir
         self.num_images = num_images
+        self.output_dir = output_dir
+        self.manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_NAME)
+        self.annotation_cache_path = annotation_cache_path or os.path.join(output_dir, CACHE_NAME)
         self.results = []
+        self._manifest = None
+        self._annotations = None
+    
+    def _load_manifest(self):
+        """
+        Dataset manifest, revalidated once per processor
+        (folders whose mtime did not change are not listed again)
+        """
+        if self._manifest is None:
+            os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+            self._manifest = load_manifest(self.dataset_dir, self.manifest_path)
+            if self._manifest is None:
+                raise FileNotFoundError(f"Dataset not found at {self.dataset_dir}")
+        return self._manifest
+    
+    def _load_annotations(self, num_images=None):
+        """
+        Annotations of the first num_images images (None = all), parsed
+        in bulk
+
+        The whole dataset is parsed once and served from the .npz cache on
+        later runs (see annotation_cache.py). A smaller selection is parsed
+        on its own and not cached, so a short run neither parses every
+        file nor replaces the dataset-wide cache.
+        """
+        entries = self._load_manifest().images(annotated_only=True)
+        if num_images is not None and num_images < len(entries):
+            return load_annotation_cache([entry['annotation'] for entry in entries[:num_images]],
+                                         None)
+        if self._annotations is None:
+            os.makedirs(os.path.dirname(self.annotation_cache_path) or ".", exist_ok=True)
+            self._annotations = load_annotation_cache([entry['annotation'] for entry in entries],
+                                                      self.annotation_cache_path)
+        return self._annotations
+    
+    def _iter_image_pairs(self):
+        """
+        Lazily yield (defect_type, img_file, img_path, xml_path) for every
+        image that has a matching XML annotation
+        """
+        for entry in self._load_manifest().images(annotated_only=True):
+            yield entry['defect_type'], entry['name'], entry['path'], entry['annotation']
     
     def process_dataset(self):
         """
@@ -25,81 +86,225 @@ class BatchDefectProcessor:
         print("MILESTONE 2: BATCH PROCESSING")
         print("="*60)
         
-        images_dir = os.path.join(self.dataset_dir, "images")
-        annotations_dir = os.path.join(self.dataset_dir, "Annotations")
-        
-        # Get all defect types
-        defect_types = sorted([d for d in os.listdir(images_dir) 
-                              if os.path.isdir(os.path.join(images_dir, d))])
+        manifest = self._load_manifest()
+        defect_types = manifest.defect_types()
         
+        print(f"[OK] Manifest: {manifest.manifest_path} "
+              f"({manifest.rescanned_dirs} folders re-listed, {manifest.hashed_files} files hashed)")
         print(f"[OK] Found {len(defect_types)} defect types")
         
+        # Images that fail are replaced by later ones - those are parsed
+        # by their localizer, the rest come from this bulk parse
+        annotations = self._load_annotations(self.num_images)
+        print(f"[OK] Annotations: {len(annotations.boxes)} boxes, {len(annotations.classes)} classes "
+              f"({'parsed' if annotations.rebuilt else 'cached'}, {annotations.failed} unreadable)")
+        
         image_count = 0
         
-        # Process each defect type
-        for defect_type in defect_types:
-            defect_img_dir = os.path.join(images_dir, defect_type)
-            defect_ann_dir = os.path.join(annotations_dir, defect_type)
+        # Process up to num_images total
+        for defect_type, img_file, img_path, xml_path in self._iter_image_pairs():
+            if image_count >= self.num_images:
+                break
+            
+            print(f"\n{'='*60}")
+            print(f"PROCESSING IMAGE {image_count + 1}/{self.num_images}")
+            print(f"{'='*60}")
+            print(f"Type: {defect_type}")
+            print(f"Image: {img_file}")
+            
+            # Create output directory
+            output_dir = os.path.join(self.output_dir, f"image_{image_count:02d}_{defect_type}")
+            
+            # Process
+            localizer = DefectLocalizer(
+                image_path=img_path,
+                xml_path=xml_path,
+                output_dir=output_dir,
+                annotation_cache=annotations
+            )
+            
+            if localizer.run_pipeline():
+                image_count += 1
+                self.results.append({
+                    'index': image_count,
+                    'type': defect_type,
+                    'image': img_file,
+                    'status': 'SUCCESS',
+                    'output_dir': output_dir,
+                    'roi_count': len(localizer.roi_list)
+                })
+            else:
+                self.results.append({
+                    'index': image_count,
+                    'type': defect_type,
+                    'image': img_file,
+                    'status': 'FAILED',
+                    'output_dir': output_dir,
+                    'roi_count': 0
+                })
+        
+        self._print_summary()
+    
+    def stream_dataset(self, num_images=None, target_size=(640, 480)):
+        """
+        STREAMING MODE: yield each image's result as soon as it is ready
+        
+        Unlike process_dataset, nothing is kept in self.results and no
+        intermediate PNGs are written. A single quiet DefectLocalizer is
+        reused for every image, so memory stays flat no matter how large
+        the dataset is. Downstream stages (metrics, training-set export)
+        should consume the generator lazily, e.g. with summarize_stream.
+        
+        Args:
+            num_images: Stop after this many images (None = whole dataset)
+            target_size: Processing size passed to the localizer
+        
+        Yields:
+            Dictionary with index, type, image, status, bboxes (scaled to
+            target_size), labels (class name per box), rois (views into the resized image), roi_count,
+            per-step timings in seconds and errors (failure messages, also
+            printed to stderr)
+        """
+        localizer = DefectLocalizer(None, None, save_outputs=False, verbose=False,
+                                    annotation_cache=self._load_annotations(num_images))
+        
+        steps = [
+            ('load', lambda: localizer.load_image_and_annotation(target_size)),
+            ('mask', localizer.create_defect_mask),
+            ('contours', localizer.find_contours),
+            ('roi', localizer.crop_roi),
+        ]
+        
+        for index, (defect_type, img_file, img_path, xml_path) in enumerate(self._iter_image_pairs()):
+            if num_images is not None and index >= num_images:
+                break
             
-            # Get all images in this defect type
-            images = sorted([f for f in os.listdir(defect_img_dir) 
-                           if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
+            localizer.reset(img_path, xml_path)
+            timings = {}
+            status = 'SUCCESS'
             
-            # Process up to num_images total
-            for img_file in images:
-                if image_count >= self.num_images:
+            for name, step in steps:
+                start = time.perf_counter()
+                ok = step()
+                timings[name] = time.perf_counter() - start
+                if not ok:
+                    status = 'FAILED'
                     break
-                
-                # Find corresponding XML
-                xml_file = Path(img_file).stem + ".xml"
-                
-                img_path = os.path.join(defect_img_dir, img_file)
-                xml_path = os.path.join(defect_ann_dir, xml_file)
-                
-                # Check if both exist
-                if not os.path.exists(xml_path):
+            
+            timings['total'] = sum(timings.values())
+            success = status == 'SUCCESS'
+            
+            yield {
+                'index': index,
+                'type': defect_type,
+                'image': img_file,
+                'image_path': img_path,
+                'status': status,
+                'bboxes': list(localizer.bboxes) if success else [],
+                'labels': list(localizer.labels) if success else [],
+                'rois': list(localizer.roi_list) if success else [],
+                'roi_count': len(localizer.roi_list) if success else 0,
+                'timings': timings,
+                'errors': list(localizer.errors)
+            }
+    
+    def stream_ground_truth(self, batch_size=64, target_size=(640, 480), num_images=None,
+                            skip=()):
+        """
+        BULK MODE: yield ground-truth masks and ROIs for groups of images
+        
+        Boxes come from the annotation cache and are scaled, rasterized
+        and cropped for a whole group at once (see gt_masks.py). Nothing
+        is written to disk.
+        
+        The masks and images of each batch are views into the preallocated
+        MaskBatch stacks (images are resized straight into them), refilled
+        for the next batch - copy them if they must outlive the iteration.
+        ROIs are views into the image stack.
+        
+        Args:
+            batch_size: Images per batch
+            target_size: Size the images and masks are produced at
+            num_images: Stop after this many images (None = whole dataset)
+            skip: Image paths to leave out (not read or rasterized); they
+                  still count towards num_images
+        
+        Yields:
+            MaskBatch.fill result plus 'paths' (one per slot),
+            'labels' (class id of each box) and 'classes' (class names)
+        """
+        annotations = self._load_annotations(num_images)
+        entries = self._load_manifest().images(annotated_only=True)
+        if num_images is not None:
+            entries = entries[:num_images]
+        if skip:
+            entries = [entry for entry in entries if entry['path'] not in skip]
+        
+        batch = MaskBatch(batch_size, target_size)
+        for start in range(0, len(entries), batch_size):
+            paths = []
+            shapes = []
+            rows = []
+            for entry in entries[start:start + batch_size]:
+                source = open_image_source(entry['path'])
+                if source is None:
                     continue
-                
-                print(f"\n{'='*60}")
-                print(f"PROCESSING IMAGE {image_count + 1}/{self.num_images}")
-                print(f"{'='*60}")
-                print(f"Type: {defect_type}")
-                print(f"Image: {img_file}")
-                
-                # Create output directory
-                output_dir = f"output/image_{image_count:02d}_{defect_type}"
-                
-                # Process
-                localizer = DefectLocalizer(
-                    image_path=img_path,
-                    xml_path=xml_path,
-                    output_dir=output_dir
-                )
-                
-                if localizer.run_pipeline():
-                    image_count += 1
-                    self.results.append({
-                        'index': image_count,
-                        'type': defect_type,
-                        'image': img_file,
-                        'status': 'SUCCESS',
-                        'output_dir': output_dir,
-                        'roi_count': len(localizer.roi_list)
-                    })
-                else:
-                    self.results.append({
-                        'index': image_count,
-                        'type': defect_type,
-                        'image': img_file,
-                        'status': 'FAILED',
-                        'output_dir': output_dir,
-                        'roi_count': 0
-                    })
+                source.read_resized(target_size, out=batch.images[len(paths)])
+                rows.append(annotations.rows(entry['annotation']))
+                shapes.append(source.shape[:2])
+                paths.append(entry['path'])
             
-            if image_count >= self.num_images:
-                break
+            if not paths:
+                continue
+            counts = [len(r) for r in rows]
+            rows = np.concatenate(rows)
+            result = batch.fill(None, shapes, rows[:, XMIN:],
+                                np.repeat(np.arange(len(paths)), counts))
+            result['paths'] = paths
+            result['labels'] = rows[:, CLASS]
+            result['classes'] = annotations.classes
+            yield result
+    
+    def export_patches(self, store_path, patch_size=(64, 64), mode="pad",
+                       target_size=(640, 480), num_images=None, batch_size=64):
+        """
+        EXPORT MODE: append every ROI of the dataset to one packed patch file
         
-        self._print_summary()
+        Replaces millions of 05_roi_XX.png files with a single memory-mapped
+        PatchStore (see patch_store.py). Images already in the store are
+        skipped, so an interrupted or extended export can simply be run
+        again with the same store_path.
+        
+        Args:
+            store_path: Base path of the store (created if missing)
+            patch_size: (width, height) of every patch
+            mode: "pad" (keep aspect ratio) or "resize" (stretch)
+            target_size: Size the images are processed at
+            num_images: Stop after this many images (None = whole dataset)
+            batch_size: Images per ground-truth batch
+        
+        Returns:
+            Number of patches appended in this run
+        """
+        added = 0
+        with PatchStore(store_path, patch_size) as store:
+            # Already exported images are not even decoded
+            done = set(store.sources)
+            for batch in self.stream_ground_truth(batch_size, target_size, num_images, skip=done):
+                keep = batch['keep']
+                owners = batch['image_index'][keep]
+                labels = batch['labels'][keep]
+                boxes = batch['boxes'][keep]
+                for slot, path in enumerate(batch['paths']):
+                    rois = np.flatnonzero(owners == slot)
+                    store.append([batch['rois'][r] for r in rois],
+                                 [batch['classes'][c] for c in labels[rois].tolist()],
+                                 path, boxes[rois].tolist(), mode)
+                    added += len(rois)
+            
+            print(f"[OK] Exported {added} patches to {store_path} "
+                  f"({len(store)} total, {len(store.classes)} classes)")
+        return added
     
     def _print_summary(self):
         """Print processing summary"""
@@ -127,6 +332,54 @@ class BatchDefectProcessor:
         print("="*60 + "\n")
 
 
+def summarize_stream(results, report_every=100):
+    """
+    Consume a stream_dataset generator and return running metrics
+    
+    Only counters are kept, so memory does not grow with the number
+    of images processed.
+    
+    Args:
+        results: Iterable of stream_dataset results
+        report_every: Print a progress line every N images (0 = never)
+    
+    Returns:
+        Dictionary with image/success/failure/ROI counts, per-type counts
+        and mean per-step timings
+    """
+    summary = {
+        'images': 0,
+        'successful': 0,
+        'failed': 0,
+        'total_rois': 0,
+        'per_type': {},
+        'mean_timings': {}
+    }
+    timing_sums = {}
+    
+    for result in results:
+        summary['images'] += 1
+        if result['status'] == 'SUCCESS':
+            summary['successful'] += 1
+        else:
+            summary['failed'] += 1
+        summary['total_rois'] += result['roi_count']
+        summary['per_type'][result['type']] = summary['per_type'].get(result['type'], 0) + 1
+        
+        for step, seconds in result['timings'].items():
+            timing_sums[step] = timing_sums.get(step, 0.0) + seconds
+        
+        if report_every and summary['images'] % report_every == 0:
+            print(f"[OK] {summary['images']} images streamed, "
+                  f"{summary['total_rois']} ROIs, {summary['failed']} failed")
+    
+    if summary['images']:
+        summary['mean_timings'] = {step: total / summary['images']
+                                   for step, total in timing_sums.items()}
+    
+    return summary
+
+
 # ============ USAGE ============
 if __name__ == "__main__":
     
@@ -139,5 +392,8 @@ if __name__ == "__main__":
     
     processor.process_dataset()
     
+    # Streaming mode: results are consumed one at a time, nothing is written
+    # summary = summarize_stream(processor.stream_dataset())
+    
     print("[OK] All images processed!")
-    print("[OK] Check 'output/' folder for results")
+    print(f"[OK] Check '{processor.output_dir}/' folder for results")
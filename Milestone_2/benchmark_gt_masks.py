@@ -0,0 +1,120 @@
+"""
+MILESTONE 2: Ground-Truth Mask Benchmark
+Compares per-image DefectLocalizer masks/ROIs with the bulk MaskBatch path
+"""
+
+import time
+
+import numpy as np
+
+from gt_masks import MaskBatch
+from milestone2_defect_localization import DefectLocalizer
+
+
+def make_annotations(num_annotations, boxes_per_image=5, original_size=(3034, 1586), seed=0):
+    """
+    Random DeepPCB-like annotations: small defect boxes on full-size panels
+
+    Returns:
+        (boxes, image_index, num_images) with boxes in original coordinates
+    """
+    rng = np.random.default_rng(seed)
+    width, height = original_size
+    num_images = -(-num_annotations // boxes_per_image)
+    image_index = np.arange(num_annotations) // boxes_per_image
+    x1 = rng.integers(0, width - 120, num_annotations)
+    y1 = rng.integers(0, height - 120, num_annotations)
+    x2 = x1 + rng.integers(20, 120, num_annotations)
+    y2 = y1 + rng.integers(20, 120, num_annotations)
+    return np.stack([x1, y1, x2, y2], axis=1), image_index, num_images
+
+
+def run_per_image(images, original_shape, boxes, image_index, num_images, keep=False):
+    """Old path: one DefectLocalizer mask + crop per image"""
+    localizer = DefectLocalizer(None, None, save_outputs=False, verbose=False)
+    localizer.original_img = np.empty(original_shape + (0,), dtype=np.uint8)
+    starts = np.searchsorted(image_index, np.arange(num_images + 1))
+    masks = []
+    rois = 0
+    for i in range(num_images):
+        localizer.img_resized = images[i % len(images)]
+        localizer.bboxes = [tuple(b) for b in boxes[starts[i]:starts[i + 1]].tolist()]
+        localizer.create_defect_mask()
+        localizer.crop_roi()
+        if keep:
+            masks.append(localizer.mask)
+        rois += len(localizer.roi_list)
+    return masks, rois
+
+
+def run_bulk(images, original_shape, boxes, image_index, num_images, batch_size, keep=False):
+    """New path: scale, rasterize and crop a whole batch at once"""
+    target_size = images.shape[2], images.shape[1]
+    batch = MaskBatch(batch_size, target_size)
+    starts = np.searchsorted(image_index, np.arange(0, num_images + batch_size, batch_size))
+    # Stand-in for read_resized(..., out=batch.images[slot]): the images
+    # are already in the batch stack (slot i always holds image i % len(images))
+    for slot in range(batch_size):
+        batch.images[slot] = images[slot % len(images)]
+    masks = []
+    rois = 0
+    for b, first in enumerate(range(0, num_images, batch_size)):
+        count = min(batch_size, num_images - first)
+        rows = slice(starts[b], starts[b + 1])
+        result = batch.fill(None, [original_shape] * count, boxes[rows], image_index[rows] - first)
+        if keep:
+            # The mask stack is reused - copy to compare afterwards
+            masks.append(result['masks'].copy())
+        rois += len(result['rois'])
+    return masks, rois
+
+
+def run_benchmark(num_annotations=10000, batch_size=64, target_size=(640, 480), repeats=3):
+    """
+    Time both paths on the same annotations and check they agree
+    """
+    boxes, image_index, num_images = make_annotations(num_annotations)
+    original_shape = (1586, 3034)
+    width, height = target_size
+    assert batch_size % 8 == 0, "slot i must map to image i % 8 in every batch"
+    rng = np.random.default_rng(1)
+    images = rng.integers(0, 255, (8, height, width, 3), dtype=np.uint8)
+
+    print("\n" + "="*60)
+    print("GROUND-TRUTH MASK BENCHMARK")
+    print("="*60)
+    print(f"Annotations: {num_annotations} on {num_images} images ({width}x{height})")
+    print(f"Batch size: {batch_size}")
+
+    old_times = []
+    new_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run_per_image(images, original_shape, boxes, image_index, num_images)
+        old_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        run_bulk(images, original_shape, boxes, image_index, num_images, batch_size)
+        new_times.append(time.perf_counter() - start)
+
+    # Both paths must paint the same pixels and cut the same ROIs
+    old_masks, old_rois = run_per_image(images, original_shape, boxes, image_index,
+                                        num_images, keep=True)
+    new_masks, new_rois = run_bulk(images, original_shape, boxes, image_index,
+                                   num_images, batch_size, keep=True)
+    assert old_rois == new_rois
+    assert np.array_equal(np.stack(old_masks), np.concatenate(new_masks))
+
+    old_best = min(old_times)
+    new_best = min(new_times)
+    print(f"[OK] Per-image DefectLocalizer: {old_best:.3f}s "
+          f"({num_annotations / old_best:.0f} annotations/s)")
+    print(f"[OK] Bulk MaskBatch:            {new_best:.3f}s "
+          f"({num_annotations / new_best:.0f} annotations/s)")
+    print(f"[OK] Speedup: {old_best / new_best:.2f}x")
+    print(f"[OK] Masks and ROI counts identical ({new_rois} ROIs)")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_benchmark()
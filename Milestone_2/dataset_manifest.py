@@ -0,0 +1,334 @@
+"""
+MILESTONE 1/2: Dataset Manifest
+Persistent index of the DeepPCB dataset, revalidated by directory mtimes
+"""
+
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+
+from PIL import Image
+
+# Written next to images/ unless a manifest_path is given
+MANIFEST_NAME = "pcb_manifest.sqlite"
+
+# Bump when the schema or the meaning of a column changes (forces a rebuild)
+MANIFEST_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Read size for content hashing
+HASH_CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS defect_types (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS files (
+    kind TEXT,
+    defect_type TEXT,
+    name TEXT,
+    path TEXT,
+    annotation TEXT,
+    width INTEGER,
+    height INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hash TEXT,
+    PRIMARY KEY (kind, defect_type, name)
+);
+"""
+
+
+def file_hash(path):
+    """Content hash of a file (BLAKE2b, 128-bit hex digest)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _image_size(path):
+    """(width, height) from the image header, (None, None) if unreadable"""
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None, None
+
+
+def _dir_mtime(path):
+    """Directory mtime in ns, or None if it does not exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class DatasetManifest:
+    """
+    SQLite index of templates, test images and annotations
+
+    Tables:
+        files: one row per template (kind 'template') or test image
+               (kind 'image') with its annotation, dimensions, size,
+               mtime and content hash. Paths are relative to dataset_dir,
+               so a share mounted under a different drive still matches.
+        dirs:  mtime of every directory the rows were listed from
+
+    refresh() stats only the directories. A directory is listed again only
+    when its mtime changed (a file was added, removed or renamed), and only
+    new or modified files in it are hashed again. Editing a file in place
+    does not change its directory's mtime, so such edits are not seen.
+
+    If the manifest cannot be written (read-only share or file), the
+    index is kept in memory for this process, starting from whatever the
+    existing manifest holds.
+    """
+
+    def __init__(self, dataset_dir, manifest_path=None):
+        """
+        Args:
+            dataset_dir: Root of the DeepPCB dataset
+            manifest_path: Where to keep the manifest (default:
+                           dataset_dir/pcb_manifest.sqlite)
+        """
+        self.dataset_dir = dataset_dir
+        self.manifest_path = manifest_path or os.path.join(dataset_dir, MANIFEST_NAME)
+        self.rescanned_dirs = 0
+        self.hashed_files = 0
+
+        self._db = None
+        try:
+            self._db = sqlite3.connect(self.manifest_path)
+            self._open()
+        except sqlite3.Error:
+            self._to_memory()
+
+    def _open(self):
+        """Create the schema and clear the index if its version is stale"""
+        self._db.executescript(SCHEMA)
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or int(row[0]) != MANIFEST_VERSION:
+            with self._db:
+                self._db.execute("DELETE FROM dirs")
+                self._db.execute("DELETE FROM defect_types")
+                self._db.execute("DELETE FROM files")
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                                 (str(MANIFEST_VERSION),))
+
+    def _to_memory(self):
+        """
+        Read-only share or manifest - keep the index for this process only,
+        starting from a copy of the existing manifest if it can be read
+        """
+        memory = sqlite3.connect(":memory:")
+        if self._db is not None:
+            try:
+                self._db.backup(memory)
+            except sqlite3.Error:
+                pass
+            self._db.close()
+        self.manifest_path = ":memory:"
+        self._db = memory
+        self._open()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ============ REVALIDATION ============
+    def _stored_mtime(self, rel_dir):
+        row = self._db.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (rel_dir,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_mtime(self, rel_dir, mtime_ns):
+        self._db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (rel_dir, mtime_ns))
+
+    def _sync_files(self, kind, defect_type, rel_dir, annotations=None):
+        """
+        Re-list one image directory and update its rows
+
+        Files whose size and mtime match the stored row keep their hash
+        and dimensions; everything else is measured again.
+        """
+        abs_dir = os.path.join(self.dataset_dir, rel_dir)
+        names = sorted(f for f in os.listdir(abs_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        stored = {name: (size, mtime_ns, width, height, digest)
+                  for name, size, mtime_ns, width, height, digest in self._db.execute(
+                      "SELECT name, size, mtime_ns, width, height, hash FROM files "
+                      "WHERE kind = ? AND defect_type = ?", (kind, defect_type))}
+
+        rows = []
+        for name in names:
+            rel_path = os.path.join(rel_dir, name)
+            abs_path = os.path.join(self.dataset_dir, rel_path)
+            stat = os.stat(abs_path)
+            old = stored.get(name)
+            if old is not None and old[:2] == (stat.st_size, stat.st_mtime_ns):
+                width, height, digest = old[2:]
+            else:
+                width, height = _image_size(abs_path)
+                digest = file_hash(abs_path)
+                self.hashed_files += 1
+
+            annotation = None
+            if annotations is not None:
+                xml_name = Path(name).stem + ".xml"
+                if xml_name in annotations:
+                    annotation = os.path.join(annotations[xml_name], xml_name)
+            rows.append((kind, defect_type, name, rel_path, annotation,
+                         width, height, stat.st_size, stat.st_mtime_ns, digest))
+
+        self._db.execute("DELETE FROM files WHERE kind = ? AND defect_type = ?", (kind, defect_type))
+        self._db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.rescanned_dirs += 1
+
+    def refresh(self):
+        """
+        Bring the manifest up to date with the dataset on disk
+
+        Returns:
+            False if dataset_dir has no images/ folder, True otherwise
+        """
+        try:
+            return self._refresh()
+        except sqlite3.OperationalError:
+            # Opened, but cannot be written (read-only file or share)
+            if self.manifest_path == ":memory:":
+                raise
+            self._to_memory()
+            return self._refresh()
+
+    def _refresh(self):
+        images_rel = "images"
+        if not os.path.isdir(os.path.join(self.dataset_dir, images_rel)):
+            return False
+
+        self.rescanned_dirs = 0
+        self.hashed_files = 0
+
+        with self._db:
+            # ===== Templates =====
+            templates_rel = "PCB_USED"
+            mtime = _dir_mtime(os.path.join(self.dataset_dir, templates_rel))
+            if mtime != self._stored_mtime(templates_rel):
+                if mtime is None:
+                    self._db.execute("DELETE FROM files WHERE kind = 'template'")
+                else:
+                    self._sync_files('template', '', templates_rel)
+                self._set_mtime(templates_rel, mtime)
+
+            # ===== Defect types =====
+            mtime = _dir_mtime(os.path.join(self.dataset_dir, images_rel))
+            if mtime != self._stored_mtime(images_rel):
+                images_dir = os.path.join(self.dataset_dir, images_rel)
+                defect_types = sorted(d for d in os.listdir(images_dir)
+                                      if os.path.isdir(os.path.join(images_dir, d)))
+                # Forget types whose folder is gone
+                for removed in set(self.defect_types()) - set(defect_types):
+                    self._db.execute("DELETE FROM files WHERE kind = 'image' AND defect_type = ?",
+                                     (removed,))
+                    self._db.execute("DELETE FROM dirs WHERE path IN (?, ?)",
+                                     (os.path.join(images_rel, removed),
+                                      os.path.join("Annotations", removed)))
+                self._db.execute("DELETE FROM defect_types")
+                self._db.executemany("INSERT INTO defect_types VALUES (?)",
+                                     [(d,) for d in defect_types])
+                self._set_mtime(images_rel, mtime)
+                self.rescanned_dirs += 1
+
+            # ===== Test images and annotations, per defect type =====
+            for defect_type in self.defect_types():
+                image_rel = os.path.join(images_rel, defect_type)
+                annotation_rel = os.path.join("Annotations", defect_type)
+                image_mtime = _dir_mtime(os.path.join(self.dataset_dir, image_rel))
+                annotation_mtime = _dir_mtime(os.path.join(self.dataset_dir, annotation_rel))
+                if (image_mtime == self._stored_mtime(image_rel) and
+                        annotation_mtime == self._stored_mtime(annotation_rel)):
+                    continue
+
+                annotations = {}
+                if annotation_mtime is not None:
+                    annotation_dir = os.path.join(self.dataset_dir, annotation_rel)
+                    annotations = {f: annotation_rel for f in os.listdir(annotation_dir)
+                                   if f.lower().endswith('.xml')}
+                    self.rescanned_dirs += 1
+                self._sync_files('image', defect_type, image_rel, annotations)
+                self._set_mtime(image_rel, image_mtime)
+                self._set_mtime(annotation_rel, annotation_mtime)
+
+        return True
+
+    # ============ QUERIES ============
+    def defect_types(self):
+        """Sorted defect type names (sub-folders of images/)"""
+        return [row[0] for row in self._db.execute("SELECT name FROM defect_types ORDER BY name")]
+
+    def _rows(self, where, params):
+        query = ("SELECT defect_type, name, path, annotation, width, height, size, hash "
+                 f"FROM files WHERE {where} ORDER BY defect_type, name")
+        entries = []
+        for defect_type, name, path, annotation, width, height, size, digest in \
+                self._db.execute(query, params):
+            entries.append({
+                'defect_type': defect_type,
+                'name': name,
+                'path': os.path.join(self.dataset_dir, path),
+                'annotation': None if annotation is None else os.path.join(self.dataset_dir, annotation),
+                'width': width,
+                'height': height,
+                'size': size,
+                'hash': digest
+            })
+        return entries
+
+    def templates(self):
+        """Template entries (PCB_USED/), sorted by name"""
+        return self._rows("kind = 'template'", ())
+
+    def images(self, defect_type=None, annotated_only=False):
+        """
+        Test image entries, sorted by defect type and name
+
+        Args:
+            defect_type: Only this defect type (None = all)
+            annotated_only: Skip images without an XML annotation
+        """
+        where = "kind = 'image'"
+        params = ()
+        if defect_type is not None:
+            where += " AND defect_type = ?"
+            params = (defect_type,)
+        if annotated_only:
+            where += " AND annotation IS NOT NULL"
+        return self._rows(where, params)
+
+
+def load_manifest(dataset_dir, manifest_path=None):
+    """
+    Open the dataset manifest and revalidate it
+
+    Returns:
+        Refreshed DatasetManifest, or None if dataset_dir has no images/
+    """
+    manifest = DatasetManifest(dataset_dir, manifest_path)
+    if not manifest.refresh():
+        manifest.close()
+        return None
+    return manifest
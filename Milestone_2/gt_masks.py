@@ -0,0 +1,171 @@
+"""
+MILESTONE 2: Bulk Ground-Truth Masks
+Scales, rasterizes and crops annotation boxes for many images at once
+"""
+
+import numpy as np
+
+
+def scale_boxes(boxes, scale_x, scale_y):
+    """
+    Scale (N, 4) x1, y1, x2, y2 boxes in one operation
+
+    Truncates like int(x * scale) in DefectLocalizer, so both paths give
+    identical boxes.
+
+    Args:
+        boxes: (N, 4) boxes in original image coordinates
+        scale_x, scale_y: Scalars, or (N,) arrays for boxes that come from
+                          images of different sizes
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scale_x = np.asarray(scale_x, dtype=np.float64)
+    scale_y = np.asarray(scale_y, dtype=np.float64)
+    scale = np.stack(np.broadcast_arrays(scale_x, scale_y, scale_x, scale_y), axis=-1)
+    return (boxes * scale).astype(np.int32)
+
+
+def rasterize_masks(boxes, image_index, out, value=255):
+    """
+    Paint filled boxes into a stack of masks
+
+    All boxes are written with one fancy-index assignment into the
+    flattened stack: the flat index of every covered pixel is built with
+    numpy from the boxes' row runs, so the cost follows the total box
+    area and there is no per-box Python work. Same pixels as
+    cv2.rectangle(..., -1) in DefectLocalizer.create_defect_mask (x2/y2
+    inclusive, clipped to the mask). Only the box pixels are written;
+    out is not cleared.
+
+    Args:
+        boxes: (N, 4) scaled x1, y1, x2, y2 boxes
+        image_index: (N,) index into out of each box's mask
+        out: (n, H, W) uint8 masks to paint into (C-contiguous)
+        value: Fill value (0 erases boxes painted earlier)
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    index = np.asarray(image_index, dtype=np.int64).reshape(-1)
+    _, height, width = out.shape
+
+    # Corner order does not matter to cv2.rectangle; clip to the mask
+    x1 = np.maximum(np.minimum(boxes[:, 0], boxes[:, 2]), 0)
+    x2 = np.minimum(np.maximum(boxes[:, 0], boxes[:, 2]), width - 1)
+    y1 = np.maximum(np.minimum(boxes[:, 1], boxes[:, 3]), 0)
+    y2 = np.minimum(np.maximum(boxes[:, 1], boxes[:, 3]), height - 1)
+    box_width = np.maximum(x2 - x1 + 1, 0)
+    box_height = np.where(box_width > 0, np.maximum(y2 - y1 + 1, 0), 0)
+
+    # One run of box_width pixels per covered row, laid end to end: pixel
+    # k of the runs is at offsets[row of k] + k in the flattened stack
+    row_owner = np.repeat(np.arange(len(boxes)), box_height)
+    if len(row_owner) == 0:
+        return out
+    first_row = np.repeat(np.cumsum(box_height) - box_height, box_height)
+    row_y = y1[row_owner] + np.arange(len(row_owner)) - first_row
+    row_width = box_width[row_owner]
+    row_start = (index[row_owner] * height + row_y) * width + x1[row_owner]
+    offsets = row_start - (np.cumsum(row_width) - row_width)
+    flat = np.repeat(offsets, row_width) + np.arange(int(row_width.sum()))
+    out.reshape(-1)[flat] = value
+    return out
+
+
+def roi_views(images, boxes, image_index):
+    """
+    Cut every box out of a group of images without copying
+
+    Same slices as DefectLocalizer.crop_roi (image[y1:y2, x1:x2]); empty
+    crops are dropped. The ROIs are views that share memory with images.
+
+    Args:
+        images: (n, H, W, 3) stack (or list of n same-size images)
+        boxes: (N, 4) scaled x1, y1, x2, y2 boxes
+        image_index: (N,) image of each box
+
+    Returns:
+        (rois, keep): list of views, and the box indices they belong to
+    """
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    index = np.asarray(image_index).reshape(-1)
+    height, width = images[0].shape[:2] if len(images) else (0, 0)
+    # Clip to the image first so emptiness is known before slicing
+    clipped = np.clip(boxes, 0, [width, height, width, height])
+    keep = np.flatnonzero((clipped[:, 2] > clipped[:, 0]) & (clipped[:, 3] > clipped[:, 1]))
+
+    rois = [images[i][y1:y2, x1:x2]
+            for i, x1, y1, x2, y2 in np.column_stack((index, clipped))[keep].tolist()]
+    return rois, keep
+
+
+class MaskBatch:
+    """
+    Preallocated mask stack for bulk ground-truth generation
+
+    One MaskBatch is refilled for every group of images, so generating
+    masks for the whole dataset allocates the stack once. Masks are mostly
+    background, so instead of clearing the whole stack, a refill erases
+    just the boxes the previous fill painted - the cost follows the
+    defect area, not the image size.
+
+    The images of a group live in one (batch_size, H, W, 3) stack as
+    well. Read them straight into its slots (read_resized(..., out=
+    batch.images[i])) and every ROI of the batch is a view into that one
+    buffer; images passed in from elsewhere are copied into the slots.
+    """
+
+    def __init__(self, batch_size=64, target_size=(640, 480)):
+        width, height = target_size
+        self.batch_size = batch_size
+        self.target_size = tuple(target_size)
+        self.masks = np.zeros((batch_size, height, width), dtype=np.uint8)
+        self.images = np.empty((batch_size, height, width, 3), dtype=np.uint8)
+        self._painted = (np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.intp))
+
+    def fill(self, images, original_shapes, boxes, image_index):
+        """
+        Rasterize one group of images
+
+        Args:
+            images: Up to batch_size resized BGR images (target_size), or
+                    None if they were read into self.images already
+            original_shapes: (n, 2) height, width of each original image
+            boxes: (N, 4) x1, y1, x2, y2 boxes in original coordinates
+            image_index: (N,) image of each box (0..n-1)
+
+        Returns:
+            Dictionary with masks and images (views of the first n slots
+            of the shared stacks, overwritten by the next fill; masks are
+            read-only), scaled boxes, image_index, rois (views into the
+            image stack) and keep (box index of each ROI)
+        """
+        shapes = np.asarray(original_shapes, dtype=np.float64).reshape(-1, 2)
+        count = len(shapes)
+        if count > self.batch_size:
+            raise ValueError(f"{count} images do not fit a batch of {self.batch_size}")
+
+        width, height = self.target_size
+        image_index = np.asarray(image_index, dtype=np.intp).reshape(-1)
+        scaled = scale_boxes(boxes,
+                             (width / shapes[:, 1])[image_index],
+                             (height / shapes[:, 0])[image_index])
+
+        rasterize_masks(*self._painted, self.masks, value=0)
+        rasterize_masks(scaled, image_index, self.masks)
+        self._painted = (scaled, image_index)
+
+        masks = self.masks[:count]
+        masks.flags.writeable = False
+        if images is not None:
+            for slot, image in enumerate(images):
+                if not np.shares_memory(image, self.images[slot]):
+                    self.images[slot] = image
+        images = self.images[:count]
+        rois, keep = roi_views(images, scaled, image_index)
+        return {
+            'masks': masks,
+            'images': images,
+            'boxes': scaled,
+            'image_index': image_index,
+            'rois': rois,
+            'keep': keep
+        }
@@ -8,9 +8,12 @@ Goal: "Draw a box around the defect so the computer knows where the problem is"
 import cv2
 import numpy as np
 import os
-import xml.etree.ElementTree as ET
+import sys
 from pathlib import Path
 
+from annotation_cache import iterparse_objects
+from image_source import open_image_source
+
 
 class XMLAnnotationParser:
     """
@@ -18,6 +21,24 @@ class XMLAnnotationParser:
     Extract bounding boxes for each defect
     """
     
+    @staticmethod
+    def parse_objects(xml_path):
+        """
+        Parse every defect with its class name
+        
+        The file is streamed (see annotation_cache.iterparse_objects)
+        instead of loaded as a full DOM.
+        
+        Returns:
+            List of (class_name, x_min, y_min, x_max, y_max)
+        """
+        try:
+            return iterparse_objects(xml_path)
+        
+        except Exception as e:
+            print(f"[FAIL] Error parsing XML: {str(e)}")
+            return []
+    
     @staticmethod
     def parse_xml(xml_path):
         """
@@ -30,28 +51,7 @@ class XMLAnnotationParser:
         Returns:
             List of bounding boxes: [(x_min, y_min, x_max, y_max), ...]
         """
-        try:
-            tree = ET.parse(xml_path)
-            root = tree.getroot()
-            
-            bboxes = []
-            
-            # Find all object elements (each defect)
-            for obj in root.findall('object'):
-                bndbox = obj.find('bndbox')
-                
-                x_min = int(bndbox.find('xmin').text)
-                y_min = int(bndbox.find('ymin').text)
-                x_max = int(bndbox.find('xmax').text)
-                y_max = int(bndbox.find('ymax').text)
-                
-                bboxes.append((x_min, y_min, x_max, y_max))
-            
-            return bboxes
-        
-        except Exception as e:
-            print(f"[FAIL] Error parsing XML: {str(e)}")
-            return []
+        return [tuple(obj[1:]) for obj in XMLAnnotationParser.parse_objects(xml_path)]
 
 
 class DefectLocalizer:
@@ -64,7 +64,9 @@ class DefectLocalizer:
     5. Crop defect regions (ROI)
     """
     
-    def __init__(self, image_path, xml_path, output_dir="output"):
+    def __init__(self, image_path, xml_path, output_dir="output",
+                 save_outputs=True, verbose=True, annotation_cache=None,
+                 patch_store=None, patch_mode="pad"):
         """
         Initialize with image and annotation paths
         
@@ -72,13 +74,38 @@ class DefectLocalizer:
             image_path: Path to PCB image
             xml_path: Path to XML annotation
             output_dir: Where to save results
+            save_outputs: Write the intermediate PNGs for each step
+            verbose: Print step-by-step progress (failures are always
+                     reported, on stderr when quiet)
+            annotation_cache: Optional loaded AnnotationCache; annotations
+                              it holds are not parsed again
+            patch_store: Optional PatchStore - ROIs are appended to it as
+                         fixed-size patches instead of one PNG each
+            patch_mode: How ROIs are fitted to the patch size ("pad" or
+                        "resize", see patch_store.fit_patch)
         """
-        self.image_path = image_path
-        self.xml_path = xml_path
         self.output_dir = output_dir
+        self.save_outputs = save_outputs
+        self.verbose = verbose
+        self.annotation_cache = annotation_cache
+        self.patch_store = patch_store
+        self.patch_mode = patch_mode
         
         # Create output directory
-        os.makedirs(output_dir, exist_ok=True)
+        if save_outputs:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        self.reset(image_path, xml_path)
+    
+    def reset(self, image_path, xml_path):
+        """
+        Point the localizer at a new image/annotation pair
+        
+        Clears all per-image state so one localizer can be reused
+        across a whole dataset.
+        """
+        self.image_path = image_path
+        self.xml_path = xml_path
         
         # Will store images at each step
         self.original_img = None
@@ -88,6 +115,24 @@ class DefectLocalizer:
         self.img_with_boxes = None
         self.roi_list = []
         self.bboxes = []
+        self.annotation_bboxes = []  # As in the XML (full-resolution coordinates)
+        self.labels = []  # Class name of each box
+        self.errors = []  # Failure messages of this image
+    
+    def _log(self, message=""):
+        """Print progress only in verbose mode"""
+        if self.verbose:
+            print(message)
+    
+    def _fail(self, message):
+        """Record a failure and report it even in quiet mode"""
+        self.errors.append(message)
+        print(message, file=sys.stdout if self.verbose else sys.stderr)
+    
+    def _save(self, filename, image):
+        """Write an intermediate image only when outputs are enabled"""
+        if self.save_outputs:
+            cv2.imwrite(os.path.join(self.output_dir, filename), image)
     
     # ============ STEP 1: LOAD IMAGE & ANNOTATION ============
     def load_image_and_annotation(self, target_size=(640, 480)):
@@ -100,40 +145,49 @@ class DefectLocalizer:
         Returns:
             True if successful
         """
-        print("\n" + "="*60)
-        print("STEP 1: LOAD IMAGE & ANNOTATION")
-        print("="*60)
+        self._log("\n" + "="*60)
+        self._log("STEP 1: LOAD IMAGE & ANNOTATION")
+        self._log("="*60)
         
         try:
-            # Load image
-            self.original_img = cv2.imread(self.image_path)
+            # Open image as a windowed source: uncompressed files are
+            # memory-mapped instead of decoded whole (see image_source.py)
+            self.original_img = open_image_source(self.image_path)
             
             if self.original_img is None:
-                print(f"[FAIL] Cannot load image from {self.image_path}")
+                self._fail(f"[FAIL] Cannot load image from {self.image_path}")
                 return False
             
-            print(f"[OK] Image loaded: {self.original_img.shape}")
+            self._log(f"[OK] Image loaded: {self.original_img.shape}")
             
             # Resize image
-            self.img_resized = cv2.resize(self.original_img, target_size)
-            print(f"[OK] Image resized to: {target_size}")
-            
-            # Parse annotation
-            self.bboxes = XMLAnnotationParser.parse_xml(self.xml_path)
+            self.img_resized = self.original_img.read_resized(target_size)
+            self._log(f"[OK] Image resized to: {target_size}")
+            
+            # Parse annotation (or take it from the pre-parsed cache)
+            cache = self.annotation_cache
+            if cache is not None and self.xml_path in cache:
+                self.bboxes = cache.bboxes(self.xml_path)
+                self.labels = cache.labels(self.xml_path)
+            else:
+                objects = XMLAnnotationParser.parse_objects(self.xml_path)
+                self.bboxes = [tuple(obj[1:]) for obj in objects]
+                self.labels = [obj[0] for obj in objects]
+            self.annotation_bboxes = list(self.bboxes)
             
             if not self.bboxes:
-                print(f"[WARN] No defects found in annotation")
+                self._fail(f"[WARN] No defects found in annotation: {self.xml_path}")
                 return False
             
-            print(f"[OK] Found {len(self.bboxes)} defect(s) in annotation")
-            for i, (x1, y1, x2, y2) in enumerate(self.bboxes):
-                print(f"   Defect {i+1}: ({x1}, {y1}) to ({x2}, {y2})")
+            self._log(f"[OK] Found {len(self.bboxes)} defect(s) in annotation")
+            for i, ((x1, y1, x2, y2), label) in enumerate(zip(self.bboxes, self.labels)):
+                self._log(f"   Defect {i+1} [{label}]: ({x1}, {y1}) to ({x2}, {y2})")
             
-            print("[DONE] STEP 1 COMPLETE: Image & annotation loaded\n")
+            self._log("[DONE] STEP 1 COMPLETE: Image & annotation loaded\n")
             return True
             
         except Exception as e:
-            print(f"[FAIL] Error in Step 1: {str(e)}")
+            self._fail(f"[FAIL] Error in Step 1 ({self.image_path}): {str(e)}")
             return False
     
     # ============ STEP 2: CREATE DEFECT MASK ============
@@ -151,12 +205,12 @@ class DefectLocalizer:
         Returns:
             True if successful
         """
-        print("\n" + "="*60)
-        print("STEP 2: CREATE DEFECT MASK")
-        print("="*60)
+        self._log("\n" + "="*60)
+        self._log("STEP 2: CREATE DEFECT MASK")
+        self._log("="*60)
         
         if self.img_resized is None:
-            print("[FAIL] Error: Image not loaded yet!")
+            self._fail("[FAIL] Error: Image not loaded yet!")
             return False
         
         try:
@@ -165,7 +219,7 @@ class DefectLocalizer:
             
             # Create empty black mask
             self.mask = np.zeros((height, width), dtype="uint8")
-            print(f"[OK] Created empty mask: {self.mask.shape}")
+            self._log(f"[OK] Created empty mask: {self.mask.shape}")
             
             # Scale bounding boxes to resized image
             original_h, original_w = self.original_img.shape[:2]
@@ -193,19 +247,18 @@ class DefectLocalizer:
             total_pixels = self.mask.shape[0] * self.mask.shape[1]
             defect_percentage = (white_pixels / total_pixels) * 100
             
-            print(f"[OK] Defect area marked: {white_pixels} pixels ({defect_percentage:.2f}%)")
+            self._log(f"[OK] Defect area marked: {white_pixels} pixels ({defect_percentage:.2f}%)")
             
             # Save mask
-            cv2.imwrite(os.path.join(self.output_dir, "02_defect_mask.png"), 
-                       self.mask)
+            self._save("02_defect_mask.png", self.mask)
             
-            print(f"[OK] Mask saved to {self.output_dir}")
-            print("[DONE] STEP 2 COMPLETE: Defect mask created\n")
+            self._log(f"[OK] Mask saved to {self.output_dir}")
+            self._log("[DONE] STEP 2 COMPLETE: Defect mask created\n")
             
             return True
             
         except Exception as e:
-            print(f"[FAIL] Error in Step 2: {str(e)}")
+            self._fail(f"[FAIL] Error in Step 2: {str(e)}")
             return False
     
     # ============ STEP 3: FIND CONTOURS ============
@@ -225,12 +278,12 @@ class DefectLocalizer:
         Returns:
             True if successful
         """
-        print("\n" + "="*60)
-        print("STEP 3: FIND CONTOURS (DEFECT BORDERS)")
-        print("="*60)
+        self._log("\n" + "="*60)
+        self._log("STEP 3: FIND CONTOURS (DEFECT BORDERS)")
+        self._log("="*60)
         
         if self.mask is None:
-            print("[FAIL] Error: Mask not created yet!")
+            self._fail("[FAIL] Error: Mask not created yet!")
             return False
         
         try:
@@ -241,20 +294,20 @@ class DefectLocalizer:
                 cv2.CHAIN_APPROX_SIMPLE  # Simplify contour paths
             )
             
-            print(f"[OK] Found {len(self.contours)} contour(s)")
+            self._log(f"[OK] Found {len(self.contours)} contour(s)")
             
             # Analyze each contour
             for i, cnt in enumerate(self.contours):
                 area = cv2.contourArea(cnt)
                 perimeter = cv2.arcLength(cnt, True)
-                print(f"   Contour {i+1}: Area={area:.0f}px, Perimeter={perimeter:.0f}px")
+                self._log(f"   Contour {i+1}: Area={area:.0f}px, Perimeter={perimeter:.0f}px")
             
-            print("[DONE] STEP 3 COMPLETE: Contours detected\n")
+            self._log("[DONE] STEP 3 COMPLETE: Contours detected\n")
             
             return True
             
         except Exception as e:
-            print(f"[FAIL] Error in Step 3: {str(e)}")
+            self._fail(f"[FAIL] Error in Step 3: {str(e)}")
             return False
     
     # ============ STEP 4: DRAW BOUNDING BOXES ============
@@ -272,12 +325,12 @@ class DefectLocalizer:
         Returns:
             True if successful
         """
-        print("\n" + "="*60)
-        print("STEP 4: DRAW BOUNDING BOXES")
-        print("="*60)
+        self._log("\n" + "="*60)
+        self._log("STEP 4: DRAW BOUNDING BOXES")
+        self._log("="*60)
         
         if self.img_resized is None:
-            print("[FAIL] Error: Image not loaded yet!")
+            self._fail("[FAIL] Error: Image not loaded yet!")
             return False
         
         try:
@@ -295,19 +348,18 @@ class DefectLocalizer:
                            (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 
                            0.5, (0, 255, 0), 2)
             
-            print(f"[OK] Drew {len(self.bboxes)} bounding box(es)")
+            self._log(f"[OK] Drew {len(self.bboxes)} bounding box(es)")
             
             # Save image with boxes
-            cv2.imwrite(os.path.join(self.output_dir, "03_bounding_boxes.png"), 
-                       self.img_with_boxes)
+            self._save("03_bounding_boxes.png", self.img_with_boxes)
             
-            print(f"[OK] Image with boxes saved to {self.output_dir}")
-            print("[DONE] STEP 4 COMPLETE: Bounding boxes drawn\n")
+            self._log(f"[OK] Image with boxes saved to {self.output_dir}")
+            self._log("[DONE] STEP 4 COMPLETE: Bounding boxes drawn\n")
             
             return True
             
         except Exception as e:
-            print(f"[FAIL] Error in Step 4: {str(e)}")
+            self._fail(f"[FAIL] Error in Step 4: {str(e)}")
             return False
     
     # ============ STEP 5: CROP DEFECT REGIONS (ROI) ============
@@ -329,16 +381,18 @@ class DefectLocalizer:
         Returns:
             True if successful
         """
-        print("\n" + "="*60)
-        print("STEP 5: CROP DEFECT REGIONS (ROI)")
-        print("="*60)
+        self._log("\n" + "="*60)
+        self._log("STEP 5: CROP DEFECT REGIONS (ROI)")
+        self._log("="*60)
         
         if self.img_resized is None:
-            print("[FAIL] Error: Image not loaded yet!")
+            self._fail("[FAIL] Error: Image not loaded yet!")
             return False
         
         try:
             self.roi_list = []
+            roi_labels = []
+            roi_boxes = []
             
             for i, (x1, y1, x2, y2) in enumerate(self.bboxes):
                 # Extract region of interest
@@ -346,33 +400,64 @@ class DefectLocalizer:
                 
                 # Check if ROI is valid
                 if roi.size == 0:
-                    print(f"[WARN] ROI {i+1} is empty, skipping...")
+                    self._log(f"[WARN] ROI {i+1} is empty, skipping...")
                     continue
                 
                 self.roi_list.append(roi)
                 
+                if self.patch_store is not None:
+                    # Packed export: collected and appended below
+                    roi_labels.append(self.labels[i] if i < len(self.labels) else "")
+                    roi_boxes.append((x1, y1, x2, y2))
+                    continue
+                
                 # Save ROI
                 roi_filename = f"05_roi_{i+1:02d}.png"
-                cv2.imwrite(os.path.join(self.output_dir, roi_filename), roi)
+                self._save(roi_filename, roi)
                 
-                print(f"[OK] ROI {i+1} cropped and saved: {roi.shape}")
-            
-            print(f"[OK] Total {len(self.roi_list)} ROI(s) extracted")
-            print(f"[OK] ROI images saved to {self.output_dir}")
-            print("[DONE] STEP 5 COMPLETE: Defect regions cropped\n")
+                self._log(f"[OK] ROI {i+1} cropped and saved: {roi.shape}")
+            
+            self._log(f"[OK] Total {len(self.roi_list)} ROI(s) extracted")
+            if self.patch_store is not None:
+                first = self.patch_store.append(self.roi_list, roi_labels, self.image_path,
+                                                roi_boxes, self.patch_mode)
+                self._log(f"[OK] ROIs appended to {self.patch_store.path} "
+                          f"as patches {first}..{self.patch_store.count - 1}")
+            else:
+                self._log(f"[OK] ROI images saved to {self.output_dir}")
+            self._log("[DONE] STEP 5 COMPLETE: Defect regions cropped\n")
             
             return True
             
         except Exception as e:
-            print(f"[FAIL] Error in Step 5: {str(e)}")
+            self._fail(f"[FAIL] Error in Step 5: {str(e)}")
             return False
     
+    def read_full_resolution_rois(self, padding=0):
+        """
+        Read each annotated defect region at full resolution
+        
+        Only the annotated windows are read from the image source (and
+        kept in its window cache), never the whole panel.
+        
+        Args:
+            padding: Extra pixels of context around each box
+        
+        Returns:
+            List of BGR ROI arrays, one per annotation box
+        """
+        if self.original_img is None:
+            self._fail("[FAIL] Error: Image not loaded yet!")
+            return []
+        
+        return [self.original_img.read((x1 - padding, y1 - padding, x2 + padding, y2 + padding))
+                for x1, y1, x2, y2 in self.annotation_bboxes]
+    
     # ============ SAVE SUMMARY ============
     def save_original_image(self):
         """Save resized original image for reference"""
         try:
-            cv2.imwrite(os.path.join(self.output_dir, "01_original_resized.png"), 
-                       self.img_resized)
+            self._save("01_original_resized.png", self.img_resized)
         except:
             pass
     
@@ -381,9 +466,9 @@ class DefectLocalizer:
         """
         Run complete Milestone 2 pipeline
         """
-        print("\n" + "="*60)
-        print("MILESTONE 2: DEFECT LOCALIZATION")
-        print("="*60)
+        self._log("\n" + "="*60)
+        self._log("MILESTONE 2: DEFECT LOCALIZATION")
+        self._log("="*60)
         
         # Step 1: Load
         if not self.load_image_and_annotation(target_size):
@@ -409,17 +494,17 @@ class DefectLocalizer:
             return False
         
         # Summary
-        print("\n" + "="*60)
-        print("[DONE] MILESTONE 2 COMPLETE!")
-        print("="*60)
-        print(f"Output saved in: {os.path.abspath(self.output_dir)}")
-        print("\nGenerated files:")
-        print("  1. 01_original_resized.png - Resized original image")
-        print("  2. 02_defect_mask.png - Defect mask (white=defect)")
-        print("  3. 03_bounding_boxes.png - Image with green boxes")
-        print("  4. 05_roi_01.png, 05_roi_02.png, ... - Cropped defect regions")
-        print("\nThese are the DELIVERABLES for Milestone 2!")
-        print("="*60 + "\n")
+        self._log("\n" + "="*60)
+        self._log("[DONE] MILESTONE 2 COMPLETE!")
+        self._log("="*60)
+        self._log(f"Output saved in: {os.path.abspath(self.output_dir)}")
+        self._log("\nGenerated files:")
+        self._log("  1. 01_original_resized.png - Resized original image")
+        self._log("  2. 02_defect_mask.png - Defect mask (white=defect)")
+        self._log("  3. 03_bounding_boxes.png - Image with green boxes")
+        self._log("  4. 05_roi_01.png, 05_roi_02.png, ... - Cropped defect regions")
+        self._log("\nThese are the DELIVERABLES for Milestone 2!")
+        self._log("="*60 + "\n")
         
         return True
 
@@ -0,0 +1,267 @@
+"""
+MILESTONE 2: Packed ROI Patch Store
+Fixed-size defect patches in one memory-mapped file instead of one PNG per ROI
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+STORE_VERSION = 1
+
+# Patches are added to the data file in blocks of this many (fewer resizes)
+CHUNK_PATCHES = 4096
+
+# One row of the metadata side array per patch
+META_DTYPE = np.dtype([
+    ('label', np.int16),   # index into store.classes
+    ('source', np.int32),  # index into store.sources (image path)
+    ('x1', np.int32),      # ROI box in the processed image
+    ('y1', np.int32),
+    ('x2', np.int32),
+    ('y2', np.int32),
+])
+
+
+def fit_patch(roi, patch_size, mode="pad"):
+    """
+    Bring one ROI to patch_size (width, height)
+
+    Modes:
+        - "resize": stretch to patch_size
+        - "pad": keep the aspect ratio - shrink to fit if too large, then
+          center on a black patch
+
+    Returns:
+        (height, width, channels) uint8 patch
+    """
+    width, height = patch_size
+    if mode == "resize":
+        return cv2.resize(roi, (width, height), interpolation=cv2.INTER_AREA)
+    if mode != "pad":
+        raise ValueError(f"mode must be 'pad' or 'resize', got {mode!r}")
+
+    roi_h, roi_w = roi.shape[:2]
+    scale = min(1.0, width / roi_w, height / roi_h)
+    if scale < 1.0:
+        roi = cv2.resize(roi, (max(1, int(roi_w * scale)), max(1, int(roi_h * scale))),
+                         interpolation=cv2.INTER_AREA)
+        roi_h, roi_w = roi.shape[:2]
+
+    patch = np.zeros((height, width) + roi.shape[2:], dtype=np.uint8)
+    top = (height - roi_h) // 2
+    left = (width - roi_w) // 2
+    patch[top:top + roi_h, left:left + roi_w] = roi
+    return patch
+
+
+class PatchStore:
+    """
+    Appendable NHWC uint8 patch array in a single file
+
+    Files (for base path "patches"):
+        patches.u8        raw (capacity, H, W, C) uint8, memory-mapped;
+                          grows in CHUNK_PATCHES blocks
+        patches.meta.npy  (count,) META_DTYPE side array
+        patches.json      patch size, count, class names, source paths
+
+    The header is written last on flush(), and every file it points at is
+    replaced atomically, so a run that dies mid-append or mid-flush leaves
+    the store at its previous count. Opening an existing store
+    appends to it; store[i] reads patch i straight from the memory map.
+    """
+
+    def __init__(self, path, patch_size=(64, 64), channels=3, readonly=False):
+        """
+        Args:
+            path: Base path (without extension)
+            patch_size: (width, height) of every patch; must match an
+                        existing store
+            channels: 3 for BGR, 1 for grayscale
+            readonly: Open an existing store for reading only
+        """
+        self.path = path
+        self.readonly = readonly
+        self._data_path = path + ".u8"
+        self._meta_path = path + ".meta.npy"
+        self._header_path = path + ".json"
+
+        if os.path.exists(self._header_path):
+            with open(self._header_path) as f:
+                header = json.load(f)
+            if header['version'] != STORE_VERSION:
+                raise ValueError(f"Unsupported patch store version {header['version']}")
+            self.patch_size = tuple(header['patch_size'])
+            self.channels = header['channels']
+            if not readonly and (self.patch_size != tuple(patch_size) or self.channels != channels):
+                raise ValueError(f"{path} holds {self.patch_size} x {self.channels} patches, "
+                                 f"not {tuple(patch_size)} x {channels}")
+            self.count = header['count']
+            self.classes = header['classes']
+            self.sources = header['sources']
+            meta = np.load(self._meta_path) if self.count else np.empty(0, META_DTYPE)
+            self._meta = meta[:self.count]
+        elif readonly:
+            raise FileNotFoundError(f"No patch store at {path}")
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.patch_size = tuple(patch_size)
+            self.channels = channels
+            self.count = 0
+            self.classes = []
+            self.sources = []
+            self._meta = np.empty(0, META_DTYPE)
+            open(self._data_path, 'wb').close()
+
+        width, height = self.patch_size
+        self._patch_shape = (height, width, self.channels)
+        self._patch_bytes = height * width * self.channels
+        self._class_ids = {name: i for i, name in enumerate(self.classes)}
+        self._source_ids = {source: i for i, source in enumerate(self.sources)}
+        self._pending_meta = []
+        self._data = None
+        self._map()
+
+    def _map(self):
+        """(Re)map the data file at its current capacity"""
+        capacity = os.path.getsize(self._data_path) // self._patch_bytes
+        self.capacity = capacity
+        if capacity == 0:
+            self._data = np.empty((0,) + self._patch_shape, dtype=np.uint8)
+            return
+        self._data = np.memmap(self._data_path, dtype=np.uint8,
+                               mode='r' if self.readonly else 'r+',
+                               shape=(capacity,) + self._patch_shape)
+
+    def _reserve(self, count):
+        """Grow the data file so count patches fit"""
+        if count <= self.capacity:
+            return
+        capacity = -(-count // CHUNK_PATCHES) * CHUNK_PATCHES
+        if isinstance(self._data, np.memmap):
+            self._data.flush()
+        self._data = None
+        with open(self._data_path, 'r+b') as f:
+            f.truncate(capacity * self._patch_bytes)
+        self._map()
+
+    # ============ WRITING ============
+    def append(self, rois, labels, source, boxes, mode="pad"):
+        """
+        Fit and append the ROIs of one image
+
+        Args:
+            rois: ROI arrays (any size)
+            labels: Class name of each ROI
+            source: Image path the ROIs were cut from
+            boxes: (x1, y1, x2, y2) of each ROI in the processed image
+            mode: "pad" or "resize" (see fit_patch)
+
+        Returns:
+            Index of the first appended patch
+        """
+        if self.readonly:
+            raise ValueError(f"{self.path} is open read-only")
+        if not len(rois) == len(labels) == len(boxes):
+            raise ValueError(f"{len(rois)} ROIs need as many labels and boxes, "
+                             f"got {len(labels)} labels and {len(boxes)} boxes")
+        first = self.count
+        if not len(rois):
+            return first
+        self._reserve(first + len(rois))
+
+        # Sources, classes and metadata rows are only registered once every
+        # ROI fitted, so a failure leaves them aligned with count
+        source_id = self._source_ids.get(source, len(self.sources))
+        class_ids = dict(self._class_ids)
+        classes = list(self.classes)
+        rows = []
+        for i, (roi, label, box) in enumerate(zip(rois, labels, boxes)):
+            if self.channels == 1 and roi.ndim == 3:
+                roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+            patch = fit_patch(roi, self.patch_size, mode)
+            self._data[first + i] = patch.reshape(self._patch_shape)
+
+            label_id = class_ids.get(label)
+            if label_id is None:
+                label_id = class_ids[label] = len(classes)
+                classes.append(label)
+            rows.append((label_id, source_id) + tuple(int(v) for v in box))
+
+        if source not in self._source_ids:
+            self._source_ids[source] = source_id
+            self.sources.append(source)
+        self._class_ids = class_ids
+        self.classes[:] = classes
+        self._pending_meta.extend(rows)
+        self.count = first + len(rois)
+        return first
+
+    def flush(self):
+        """Write patches, the metadata side array and then the header"""
+        if self.readonly:
+            return
+        if isinstance(self._data, np.memmap):
+            self._data.flush()
+        # Write-then-rename like the header: a crash mid-write must not
+        # leave a truncated side array behind a valid header
+        temp_path = self._meta_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, self.meta)
+        os.replace(temp_path, self._meta_path)
+
+        header = {
+            'version': STORE_VERSION,
+            'patch_size': list(self.patch_size),
+            'channels': self.channels,
+            'count': self.count,
+            'classes': self.classes,
+            'sources': self.sources
+        }
+        temp_path = self._header_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(header, f)
+        os.replace(temp_path, self._header_path)
+
+    def close(self):
+        self.flush()
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ============ READING ============
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """
+        Patch i, a slice or an index array of patches, read from the
+        memory map (ints and slices give views, index arrays a copy)
+        """
+        if isinstance(index, (int, np.integer)):
+            if not -self.count <= index < self.count:
+                raise IndexError(f"patch {index} out of range for {self.count} patches")
+            return self._data[index % self.count]
+        return self._data[:self.count][index]
+
+    @property
+    def meta(self):
+        """(count,) META_DTYPE side array"""
+        if self._pending_meta:
+            pending = np.array(self._pending_meta, dtype=META_DTYPE)
+            self._meta = np.concatenate([self._meta, pending])
+            self._pending_meta = []
+        return self._meta
+
+    @property
+    def labels(self):
+        """(count,) class id of every patch (names in self.classes)"""
+        return self.meta['label']
@@ -0,0 +1,26 @@
+"""
+Shared Module Copies
+Every milestone folder runs standalone, so modules used by more than one
+milestone are copied into each. The copies must stay byte-identical.
+"""
+
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SHARED_MODULES = [
+    ("Milestone_1_/image_source.py", "Milestone_2/image_source.py"),
+    ("Milestone_1_/dataset_manifest.py", "Milestone_2/dataset_manifest.py"),
+    ("Milestone-3-/ingest.py", "Milestone4/ingest.py"),
+    ("Milestone-3-/defect_set.py", "Milestone4/defect_set.py"),
+]
+
+
+@pytest.mark.parametrize("first, second", SHARED_MODULES)
+def test_copies_identical(first, second):
+    with open(os.path.join(ROOT, first), "rb") as file:
+        expected = file.read()
+    with open(os.path.join(ROOT, second), "rb") as file:
+        assert file.read() == expected, f"{second} drifted from {first}"